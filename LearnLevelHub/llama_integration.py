@@ -1,65 +1,37 @@
 import os
-import requests
-import json
-import time
+import sys
+import importlib.util
 from translations import get_text
 
-def setup_llama_model():
-    """
-    Initialize and return Llama model configuration.
-    In a real implementation, this would connect to the Llama 3.3 API.
-    
-    Returns:
-        dict: Configuration for Llama model
+def _load_shared_backends():
     """
-    # In a real implementation, this might include API keys, endpoints, etc.
-    # For now, we'll just return a configuration dictionary
-    
-    api_key = os.getenv("LLAMA_API_KEY", "")
-    model_config = {
-        "model_name": "llama-3.3",
-        "api_key": api_key,
-        "temperature": 0.7,
-        "max_tokens": 1024
-    }
-    
-    return model_config
+    Load the LLM backends shared with the main CiaoHost app.
 
-def get_llama_response(prompt, model_config, language='english'):
-    """
-    Get a response from the Llama 3.3 model.
-    
-    Args:
-        prompt (str): The user's question or prompt
-        model_config (dict): Model configuration
-        language (str): The language to use for the response
-    
-    Returns:
-        str: The AI assistant's response
+    The module is loaded from its path because this app's own utils.py
+    shadows the CiaoHost utils package.
     """
-    # In a real implementation, this would make an API call to the Llama 3.3 service
-    # For this prototype, we'll simulate responses based on input
+    module_name = "ciaohost_llm_backends"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
     
-    # Add context about the system to make responses more relevant to B&B management
-    system_prompt = """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "llm_backends.py")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+llm_backends = _load_shared_backends()
+
+# Add context about the system to make responses more relevant to B&B management
+SYSTEM_PROMPT = """
     You are an AI assistant for a B&B property management system called CiaoHost. 
     Your role is to help property managers with their B&B operations, guest communications, 
     and provide suggestions for improving their business. Provide concise, helpful responses.
     """
-    
-    # For now, we'll handle common B&B management questions with pre-defined responses
-    # In a real implementation, this would be replaced with actual API calls to Llama 3.3
-    
-    # Simulate API processing time
-    time.sleep(1)
-    
-    # Convert prompt to lowercase for easier matching
-    lower_prompt = prompt.lower()
-    
-    # Basic response logic based on prompt content
-    if "welcome message" in lower_prompt or "greeting" in lower_prompt:
-        if language == 'italian':
-            return """
+
+WELCOME_RESPONSES = {
+    "italian": """
             Ecco un esempio di messaggio di benvenuto:
             
             "Gentile [Nome Ospite],
@@ -76,9 +48,8 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Cordiali saluti,
             [Il Vostro Nome]"
-            """
-        else:
-            return """
+            """,
+    "english": """
             Here's a sample welcome message template:
             
             "Dear [Guest Name],
@@ -96,10 +67,10 @@ def get_llama_response(prompt, model_config, language='english'):
             Best regards,
             [Your Name]"
             """
-    
-    elif "checkout" in lower_prompt or "check-out" in lower_prompt:
-        if language == 'italian':
-            return """
+}
+
+CHECKOUT_RESPONSES = {
+    "italian": """
             Ecco un esempio di istruzioni per il check-out:
             
             "Gentile [Nome Ospite],
@@ -115,9 +86,8 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Cordiali saluti,
             [Il Vostro Nome]"
-            """
-        else:
-            return """
+            """,
+    "english": """
             Here's a sample checkout instructions template:
             
             "Dear [Guest Name],
@@ -134,10 +104,10 @@ def get_llama_response(prompt, model_config, language='english'):
             Best regards,
             [Your Name]"
             """
-    
-    elif "pricing" in lower_prompt or "rates" in lower_prompt or "price" in lower_prompt:
-        if language == 'italian':
-            return """
+}
+
+PRICING_RESPONSES = {
+    "italian": """
             Per determinare i prezzi ottimali per il vostro B&B, considerate questi fattori:
             
             1. Analisi della concorrenza: Controllate i prezzi dei B&B simili nella vostra zona
@@ -148,9 +118,8 @@ def get_llama_response(prompt, model_config, language='english'):
             6. Tariffe di pulizia: Considerate se includerle nel prezzo o addebitarle separatamente
             
             Vi consiglio anche di utilizzare strumenti di gestione dei prezzi che possono ottimizzare automaticamente le tariffe in base alla domanda.
-            """
-        else:
-            return """
+            """,
+    "english": """
             To determine optimal pricing for your B&B, consider these factors:
             
             1. Competitive analysis: Check prices of similar B&Bs in your area
@@ -162,10 +131,10 @@ def get_llama_response(prompt, model_config, language='english'):
             
             I also recommend using pricing management tools that can automatically optimize rates based on demand.
             """
-    
-    elif "cleaning" in lower_prompt or "housekeeping" in lower_prompt:
-        if language == 'italian':
-            return """
+}
+
+CLEANING_RESPONSES = {
+    "italian": """
             Ecco una checklist per la pulizia delle camere del B&B:
             
             1. Preparazione:
@@ -196,9 +165,8 @@ def get_llama_response(prompt, model_config, language='english'):
                - Spruzzare un profumatore d'ambiente
             
             Ricordate di creare una checklist standardizzata per assicurare coerenza tra diverse persone che potrebbero occuparsi della pulizia.
-            """
-        else:
-            return """
+            """,
+    "english": """
             Here's a B&B room cleaning checklist:
             
             1. Preparation:
@@ -230,10 +198,10 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Remember to create a standardized checklist to ensure consistency across different people who might handle cleaning.
             """
-    
-    elif "review" in lower_prompt or "rating" in lower_prompt or "feedback" in lower_prompt:
-        if language == 'italian':
-            return """
+}
+
+REVIEW_RESPONSES = {
+    "italian": """
             Per migliorare le recensioni del vostro B&B:
             
             1. Superare le aspettative: Offrite piccole sorprese come snack di benvenuto o una bottiglia di vino locale
@@ -251,9 +219,8 @@ def get_llama_response(prompt, model_config, language='english'):
             7. Mantenere la struttura aggiornata: Rinnovate regolarmente la decorazione e le amenities
             
             Ricordate che la coerenza è fondamentale: è meglio offrire un servizio di buona qualità in modo costante piuttosto che un'esperienza eccezionale una volta e deludente la volta successiva.
-            """
-        else:
-            return """
+            """,
+    "english": """
             To improve your B&B's reviews:
             
             1. Exceed expectations: Offer small surprises like welcome snacks or a bottle of local wine
@@ -272,11 +239,21 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Remember that consistency is key - it's better to offer good quality service consistently rather than an exceptional experience once and a disappointing one the next time.
             """
-    
-    # Generic response for other queries
-    else:
-        if language == 'italian':
-            return f"""
+}
+
+# Keyword rules used by the deterministic backend, checked in order
+RESPONSE_RULES = [
+    (['welcome message', 'greeting'], WELCOME_RESPONSES),
+    (['checkout', 'check-out'], CHECKOUT_RESPONSES),
+    (['pricing', 'rates', 'price'], PRICING_RESPONSES),
+    (['cleaning', 'housekeeping'], CLEANING_RESPONSES),
+    (['review', 'rating', 'feedback'], REVIEW_RESPONSES)
+]
+
+def get_default_response(prompt, language):
+    """Generic response for queries not matched by any rule"""
+    if language == 'italian':
+        return f"""
             Grazie per la tua domanda su "{prompt}". 
             
             Come assistente AI di CiaoHost, sono qui per aiutarti con la gestione delle proprietà B&B, 
@@ -291,8 +268,8 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Per favore, fammi sapere se hai domande specifiche su questi argomenti.
             """
-        else:
-            return f"""
+    else:
+        return f"""
             Thank you for your question about "{prompt}". 
             
             As CiaoHost's AI assistant, I'm here to help you with B&B property management, 
@@ -307,3 +284,130 @@ def get_llama_response(prompt, model_config, language='english'):
             
             Please let me know if you have specific questions about these topics.
             """
+
+def setup_llama_model():
+    """
+    Initialize and return Llama model configuration.
+    
+    Set LLAMA_API_URL to use a local OpenAI-compatible server (e.g. llama.cpp
+    or vLLM), or LLAMA_API_KEY to use the hosted Llama API. Without either,
+    responses come from the deterministic rule engine.
+    
+    Returns:
+        dict: Configuration for Llama model
+    """
+    api_key = os.getenv("LLAMA_API_KEY", "")
+    api_url = os.getenv("LLAMA_API_URL", "")
+    
+    if api_url:
+        backend = "http"
+    elif api_key:
+        backend = "llama_api"
+        api_url = os.getenv("LLAMA_API_BASE", "https://api.llama.com/compat/v1")
+    else:
+        backend = "rules"
+    
+    model_config = {
+        "model_name": os.getenv("LLAMA_MODEL", "llama-3.3"),
+        "api_key": api_key,
+        "api_url": api_url,
+        "backend": backend,
+        "temperature": 0.7,
+        "max_tokens": 1024
+    }
+    
+    return model_config
+
+def get_rule_backend():
+    """Get the shared deterministic rule engine backend"""
+    return llm_backends.get_shared_backend(
+        "rules:llama",
+        lambda: llm_backends.RuleEngineBackend(RESPONSE_RULES, get_default_response)
+    )
+
+def get_llama_backend(model_config):
+    """
+    Get the backend selected by the model configuration
+    
+    Args:
+        model_config (dict): Model configuration from setup_llama_model
+    
+    Returns:
+        LLMBackend: Shared backend instance
+    """
+    if model_config.get("backend") in ("http", "llama_api") and model_config.get("api_url"):
+        api_url = model_config["api_url"]
+        model_name = model_config["model_name"]
+        return llm_backends.get_shared_backend(
+            f"http:{api_url}:{model_name}",
+            lambda: llm_backends.HTTPChatBackend(api_url, model_name, api_key=model_config.get("api_key") or None)
+        )
+    
+    return get_rule_backend()
+
+def build_llama_request(prompt, model_config, language='english'):
+    """
+    Build the chat completion request for a prompt
+    
+    Args:
+        prompt (str): The user's question or prompt
+        model_config (dict): Model configuration
+        language (str): The language to use for the response
+    
+    Returns:
+        dict: Request with messages and options
+    """
+    language_instruction = "Rispondi in italiano." if language == 'italian' else "Respond in English."
+    
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT + "\n" + language_instruction},
+            {"role": "user", "content": prompt}
+        ],
+        "language": language,
+        "temperature": model_config.get("temperature"),
+        "max_tokens": model_config.get("max_tokens")
+    }
+
+def get_llama_response(prompt, model_config, language='english'):
+    """
+    Get a response from the Llama 3.3 model.
+    
+    Args:
+        prompt (str): The user's question or prompt
+        model_config (dict): Model configuration
+        language (str): The language to use for the response
+    
+    Returns:
+        str: The AI assistant's response
+    """
+    request = build_llama_request(prompt, model_config, language)
+    messages = request.pop("messages")
+    
+    try:
+        return get_llama_backend(model_config).complete(messages, use_cache=True, **request)
+    except Exception:
+        # If the model is not reachable, fall back to the rule engine
+        return get_rule_backend().complete(messages, **request)
+
+def get_llama_responses(prompts, model_config, language='english', max_workers=4):
+    """
+    Get responses for many prompts, sending the requests concurrently.
+    
+    Args:
+        prompts (list): The user's questions or prompts
+        model_config (dict): Model configuration
+        language (str): The language to use for the responses
+        max_workers (int): Maximum number of concurrent requests
+    
+    Returns:
+        list: The AI assistant's responses, in the same order as the prompts
+    """
+    requests_batch = [build_llama_request(prompt, model_config, language) for prompt in prompts]
+    responses = get_llama_backend(model_config).complete_batch(requests_batch, max_workers=max_workers, use_cache=True)
+    
+    # Failed requests are answered by the rule engine
+    return [
+        response if response is not None else get_rule_backend().complete(request["messages"], language=language)
+        for request, response in zip(requests_batch, responses)
+    ]
@@ -4,11 +4,17 @@ import json
 import uuid
 from datetime import datetime, timedelta
 import os
-from utils.ai_assistant import generate_automated_messages
+from utils.ai_assistant import generate_automated_messages, generate_bulk_messages
+from utils.anomaly_service import check_booking, refresh_booking_models
 
 def show_bookings():
     st.markdown("<h1 class='main-header'>Gestione Prenotazioni</h1>", unsafe_allow_html=True)
     
+    # Aggiorniamo i modelli di rilevamento anomalie una volta per sessione
+    if not st.session_state.get("anomaly_models_refreshed"):
+        refresh_anomaly_models()
+        st.session_state.anomaly_models_refreshed = True
+    
     # Create tabs for different booking management sections
     tabs = st.tabs(["Elenco Prenotazioni", "Nuova Prenotazione", "Check-in/Check-out", "Messaggi Automatici"])
     
@@ -231,6 +237,10 @@ def add_new_booking():
             st.rerun()
         return
     
+    # Avviso di anomalia della prenotazione appena salvata (dopo il rerun)
+    if "booking_anomaly_warning" in st.session_state:
+        st.warning(st.session_state.pop("booking_anomaly_warning"))
+    
     # Check if we're editing
     editing = False
     booking_to_edit = None
@@ -261,6 +271,31 @@ def add_new_booking():
             guest_phone = st.text_input("Telefono Ospite", 
                                       value=booking_to_edit.get("guest_phone", "") if editing else "")
             guests_count = st.number_input("Numero Ospiti*", min_value=1, value=booking_to_edit.get("guests", 1) if editing else 1)
+            guest_ages_text = st.text_input(
+                "Età dei minori",
+                value=", ".join(str(age) for age in booking_to_edit.get("guest_ages") or []) if editing else "",
+                help="Separate da virgola, es. 4, 12. Servono per le esenzioni dell'imposta di soggiorno; gli altri ospiti sono considerati adulti."
+            )
+        
+        # Dati fiscali, richiesti per la fattura elettronica
+        with st.expander("Dati Fiscali Ospite (fattura elettronica)"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                guest_fiscal_code = st.text_input("Codice Fiscale",
+                                                  value=booking_to_edit.get("guest_fiscal_code") or "" if editing else "")
+                guest_address = st.text_input("Indirizzo",
+                                              value=booking_to_edit.get("guest_address") or "" if editing else "")
+                guest_city = st.text_input("Comune",
+                                           value=booking_to_edit.get("guest_city") or "" if editing else "")
+            
+            with col2:
+                guest_vat_number = st.text_input("Partita IVA",
+                                                 value=booking_to_edit.get("guest_vat_number") or "" if editing else "")
+                guest_zip = st.text_input("CAP",
+                                          value=booking_to_edit.get("guest_zip") or "" if editing else "")
+                guest_country = st.text_input("Nazione (codice ISO)",
+                                              value=booking_to_edit.get("guest_country") or "IT" if editing else "IT")
         
         # Property selection
         st.markdown("### Dettagli Prenotazione")
@@ -393,6 +428,15 @@ def add_new_booking():
             st.error("Compila tutti i campi obbligatori (contrassegnati con *).")
             return
         
+        try:
+            guest_ages = [int(age) for age in guest_ages_text.replace(";", ",").split(",") if age.strip()]
+        except ValueError:
+            st.error("Le età dei minori devono essere numeri interi separati da virgola.")
+            return
+        if len(guest_ages) > guests_count or any(age < 0 or age >= 18 for age in guest_ages):
+            st.error("Indica un'età tra 0 e 17 anni per ciascun minore, senza superare il numero di ospiti.")
+            return
+        
         # Calculate total price
         nights = (checkout_date - checkin_date).days
         subtotal = adjusted_price * nights
@@ -403,10 +447,17 @@ def add_new_booking():
             "guest_name": guest_name,
             "guest_email": guest_email,
             "guest_phone": guest_phone,
+            "guest_fiscal_code": guest_fiscal_code.strip().upper(),
+            "guest_vat_number": guest_vat_number.strip().upper(),
+            "guest_address": guest_address.strip(),
+            "guest_zip": guest_zip.strip(),
+            "guest_city": guest_city.strip(),
+            "guest_country": guest_country.strip().upper() or "IT",
             "property_id": selected_property_id,
             "checkin_date": checkin_date,
             "checkout_date": checkout_date,
             "guests": guests_count,
+            "guest_ages": guest_ages,
             "price_per_night": adjusted_price,
             "cleaning_fee": adjusted_cleaning,
             "nights": nights,
@@ -442,8 +493,17 @@ def add_new_booking():
             st.session_state.bookings.append(booking_data)
             success_message = "Prenotazione creata con successo!"
         
+        # Controllo anomalie con il modello già addestrato (nessun riaddestramento)
+        anomaly = check_booking(booking_data, st.session_state.properties)
+        if anomaly and anomaly["is_anomaly"]:
+            details = f" Valori insoliti: {', '.join(anomaly['columns'])}." if anomaly["columns"] else ""
+            st.session_state.booking_anomaly_warning = (
+                f"La prenotazione di {guest_name} è insolita rispetto allo storico: verifica prezzo, date e ospiti.{details}"
+            )
+        
         # Save the updated data
         save_data()
+        refresh_anomaly_models()
         
         st.success(success_message)
         
@@ -761,6 +821,54 @@ def automated_messages():
             if st.button("Invia", key="send_custom", disabled=not custom_message):
                 st.success("Messaggio inviato con successo!")
                 # In a real app, this would send the message through SMS, email, etc.
+    
+    # Bulk messages for tomorrow's arrivals
+    st.markdown("---")
+    st.subheader("Invio Massivo - Arrivi di Domani")
+    
+    tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+    tomorrow_arrivals = [b for b in active_bookings if str(b.get("checkin_date", ""))[:10] == tomorrow]
+    
+    if not tomorrow_arrivals:
+        st.info("Nessun arrivo previsto per domani.")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        bulk_type = st.selectbox(
+            "Tipo di Messaggio",
+            ["check_in", "welcome", "reminder"],
+            format_func=lambda x: {"check_in": "Istruzioni Check-in", "welcome": "Benvenuto", "reminder": "Promemoria"}.get(x),
+            key="bulk_message_type"
+        )
+    
+    with col2:
+        bulk_language = st.selectbox(
+            "Lingua",
+            ["italiano", "english", "français", "español", "deutsch"],
+            key="bulk_message_language"
+        )
+    
+    if st.button(f"Genera Messaggi per {len(tomorrow_arrivals)} Arrivi", key="gen_bulk"):
+        # I modelli vengono generati una sola volta per immobile e compilati localmente
+        st.session_state.bulk_messages = generate_bulk_messages(
+            bulk_type,
+            tomorrow_arrivals,
+            st.session_state.properties,
+            bulk_language
+        )
+    
+    bulk_messages = st.session_state.get("bulk_messages", [])
+    
+    if bulk_messages:
+        for item in bulk_messages:
+            with st.expander(f"{item['guest_name']}"):
+                st.write(item["message"])
+        
+        if st.button("Invia Tutti", key="send_bulk"):
+            st.success(f"{len(bulk_messages)} messaggi inviati con successo!")
+            # In a real app, this would send the messages through SMS, email, etc.
 
 def handle_checkin(booking):
     """Handle the check-in process for a booking"""
@@ -861,6 +969,13 @@ def handle_checkout(booking):
     # Rating request (in a real app, this would send a review request to the guest)
     st.success("Richiesta di recensione inviata all'ospite.")
 
+def refresh_anomaly_models():
+    """Retrain the booking and price anomaly models if they are missing or stale"""
+    try:
+        refresh_booking_models(st.session_state.bookings, st.session_state.properties)
+    except Exception as e:
+        st.error(f"Errore nell'aggiornamento dei modelli di rilevamento anomalie: {str(e)}")
+
 def save_data():
     """Save property and booking data to files"""
     # Make sure data directory exists
@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
 import json
-from utils.data_processor import get_column_types, filter_dataframe
+from utils.data_processor import get_column_types
 from utils.visualization import create_visualization, render_chart_in_streamlit, suggest_visualizations
 from utils.ai_insights import suggest_visualizations_with_ai
+from utils.dashboard_cache import get_filtered_frame, get_panel_figure
 
 st.set_page_config(
     page_title="Dashboard Creator - DataInsight AI",
@@ -86,7 +87,7 @@ def main():
             
             # Apply filters if any
             if filters:
-                filtered_df = filter_dataframe(df, filters)
+                filtered_df = get_filtered_frame(df, filters)
                 st.write(f"Filtered data has {filtered_df.shape[0]} rows (from original {df.shape[0]} rows)")
             else:
                 filtered_df = df
@@ -262,6 +263,7 @@ def main():
                         # For count-based charts, add computed values
                         if suggestion["type"] == "bar" and suggestion["config"]["y"] is None:
                             value_counts = df[suggestion["config"]["x"]].value_counts()
+                            value_counts = value_counts[value_counts > 0]
                             temp_df = pd.DataFrame({
                                 suggestion["config"]["x"]: value_counts.index,
                                 "count": value_counts.values
@@ -270,6 +272,7 @@ def main():
                             fig = create_visualization(temp_df, suggestion["type"], suggestion["config"])
                         elif suggestion["type"] == "pie" and suggestion["config"]["values"] is None:
                             value_counts = df[suggestion["config"]["names"]].value_counts()
+                            value_counts = value_counts[value_counts > 0]
                             temp_df = pd.DataFrame({
                                 suggestion["config"]["names"]: value_counts.index,
                                 "count": value_counts.values
@@ -546,41 +549,9 @@ def render_panel(panel, df):
     """Render a dashboard panel"""
     st.markdown(f"#### {panel['title']}")
     
-    # Apply filters if any
-    if panel["filters"]:
-        filtered_df = filter_dataframe(df, panel["filters"])
-    else:
-        filtered_df = df
-    
-    # Special handling for count-based visualizations
-    viz_type = panel["type"]
-    config = panel["config"].copy()
-    
     try:
-        if viz_type == "bar" and config.get("y") is None:
-            # Bar chart with counts
-            value_counts = filtered_df[config["x"]].value_counts()
-            temp_df = pd.DataFrame({
-                config["x"]: value_counts.index,
-                "count": value_counts.values
-            })
-            config["y"] = "count"
-            fig = create_visualization(temp_df, viz_type, config)
-        elif viz_type == "pie" and config.get("values") is None:
-            # Pie chart with counts
-            value_counts = filtered_df[config["names"]].value_counts()
-            temp_df = pd.DataFrame({
-                config["names"]: value_counts.index,
-                "count": value_counts.values
-            })
-            config["values"] = "count"
-            fig = create_visualization(temp_df, viz_type, config)
-        else:
-            # Standard visualization
-            fig = create_visualization(filtered_df, viz_type, config)
-        
-        # Set chart height
-        fig.update_layout(height=panel["height"])
+        # Filtered data and figure are cached: unchanged panels are not recomputed on reruns
+        fig = get_panel_figure(df, panel)
         
         # Render in Streamlit
         render_chart_in_streamlit(fig)
@@ -1,7 +1,10 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
-from utils.data_processor import get_column_types
+from utils.data_processor import get_column_types, get_file_extension, load_data
+from utils.ingestion import get_ingestion_report
+from utils.booking_facts import get_booking_facts
 from utils.ai_insights import (
     generate_ai_data_insights, 
     detect_anomalies, 
@@ -9,6 +12,8 @@ from utils.ai_insights import (
     create_data_profile
 )
 from utils.visualization import create_visualization, render_chart_in_streamlit
+from utils.stream_profiler import profile_csv_stream, DEFAULT_CHUNKSIZE
+from utils.clustering_engine import get_k_curve, suggest_k, SEGMENTATION_PRESETS
 
 st.set_page_config(
     page_title="AI Data Insights - DataInsight AI",
@@ -21,23 +26,32 @@ def main():
     st.title("🔍 AI Data Insights")
     st.write("Get AI-powered insights and discover hidden patterns in your data")
     
+    # Sidebar for selecting analysis type
+    st.sidebar.title("Analysis Type")
+    analysis_type = st.sidebar.radio(
+        "Select Analysis",
+        ["AI-Powered Insights", "Anomaly Detection", "Cluster Analysis", "Data Profiling",
+         "Large File Profiling", "Guest & Property Segmentation"]
+    )
+    
+    # These analyses read files from disk or the booking store, they do not need a loaded dataset
+    if analysis_type == "Large File Profiling":
+        show_large_file_profiling()
+        return
+    if analysis_type == "Guest & Property Segmentation":
+        show_segmentation()
+        return
+    
+    show_dataset_upload()
+    
     # Check if data is loaded
     if 'data' not in st.session_state or st.session_state.data is None:
-        st.info("Please upload a dataset from the Home page first.")
-        if st.button("Go to Home Page"):
-            st.switch_page("app.py")
+        st.info("Please upload a dataset from the sidebar first.")
         return
     
     # Get the data
     df = st.session_state.data
     
-    # Sidebar for selecting analysis type
-    st.sidebar.title("Analysis Type")
-    analysis_type = st.sidebar.radio(
-        "Select Analysis",
-        ["AI-Powered Insights", "Anomaly Detection", "Cluster Analysis", "Data Profiling"]
-    )
-    
     # Main content based on selected analysis type
     if analysis_type == "AI-Powered Insights":
         show_ai_insights(df)
@@ -48,6 +62,42 @@ def main():
     elif analysis_type == "Data Profiling":
         show_data_profiling(df)
 
+def show_dataset_upload():
+    """Show the dataset uploader in the sidebar and load the selected file"""
+    st.sidebar.title("Dataset")
+    uploaded_file = st.sidebar.file_uploader("Upload a dataset", type=["csv", "xlsx", "xls", "json"])
+    
+    if uploaded_file is None:
+        # Without an upload the bookings managed in CiaoHost can be analysed directly
+        if st.session_state.get('bookings') and st.sidebar.checkbox("Analyse CiaoHost bookings"):
+            st.session_state.data = get_booking_facts(st.session_state.bookings, st.session_state.get('properties', []))
+            st.sidebar.caption(f"{len(st.session_state.data):,} bookings joined to their properties")
+        return
+    
+    # Same file and content across reruns: the cached dataframe is reused by load_data
+    try:
+        df = load_data(uploaded_file, get_file_extension(uploaded_file.name))
+    except Exception as e:
+        st.sidebar.error(str(e))
+        return
+    
+    st.session_state.data = df
+    
+    report = get_ingestion_report(df)
+    st.sidebar.caption(f"{len(df):,} rows, {report.get('memory_mb', 0):.1f} MB in memory")
+    if report.get('source') == "parsed" and report.get('default_memory_mb'):
+        st.sidebar.caption(
+            f"Compact dtypes saved {report['saved_percent']:.0f}% of memory "
+            f"({report['default_memory_mb']:.1f} MB with default dtypes)"
+        )
+        if report.get('converted_columns'):
+            with st.sidebar.expander("Converted columns"):
+                st.dataframe(pd.DataFrame(
+                    list(report['converted_columns'].items()), columns=["Column", "Type"]
+                ), hide_index=True)
+    elif report.get('source') in ("memory", "parquet_cache"):
+        st.sidebar.caption("Loaded from cache")
+
 def show_ai_insights(df):
     """Show AI insights page"""
     st.header("AI-Powered Insights")
@@ -112,11 +162,14 @@ def show_anomaly_detection(df):
     
     # Run anomaly detection if requested
     if detect_button or ('anomalies_df' in st.session_state and selected_cols):
-        if detect_button or selected_cols != st.session_state.get('last_anomaly_cols'):
+        # Changing the contamination reuses the fitted model, so it is applied immediately
+        if (detect_button or selected_cols != st.session_state.get('last_anomaly_cols')
+                or contamination != st.session_state.get('last_anomaly_contamination')):
             with st.spinner("Detecting anomalies..."):
                 anomalies_df = detect_anomalies(df, selected_cols, contamination)
                 st.session_state.anomalies_df = anomalies_df
                 st.session_state.last_anomaly_cols = selected_cols
+                st.session_state.last_anomaly_contamination = contamination
         else:
             anomalies_df = st.session_state.anomalies_df
         
@@ -213,6 +266,9 @@ def show_cluster_analysis(df):
     if cluster_button or ('clustered_df' in st.session_state and selected_cols):
         if cluster_button or selected_cols != st.session_state.get('last_cluster_cols') or n_clusters != st.session_state.get('last_n_clusters'):
             with st.spinner("Identifying clusters..."):
+                # Models for every k are fitted once in parallel, then the slider only reads the cache
+                if cluster_button or selected_cols != st.session_state.get('last_cluster_cols'):
+                    st.session_state.cluster_k_curve = compute_k_curve(df, selected_cols)
                 clustered_df, centers = identify_clusters(df, selected_cols, n_clusters)
                 st.session_state.clustered_df = clustered_df
                 st.session_state.cluster_centers = centers
@@ -226,126 +282,201 @@ def show_cluster_analysis(df):
             st.error(clustered_df['error'][0])
             return
         
-        # Show results
-        st.subheader("Cluster Analysis Results")
+        render_k_curve(st.session_state.get('cluster_k_curve'))
+        render_cluster_results(df, clustered_df, centers, selected_cols, n_clusters)
+
+def compute_k_curve(df, columns):
+    """Compute inertia and silhouette for k=2..10, or None if clustering is not possible"""
+    try:
+        return get_k_curve(df, columns)
+    except Exception as e:
+        st.error(f"Error computing cluster quality curve: {str(e)}")
+        return None
+
+def render_k_curve(curve):
+    """Show inertia and silhouette curves to help choose the number of clusters"""
+    if curve is None or curve.empty:
+        return
+    
+    with st.expander("Choosing the Number of Clusters"):
+        best_k = suggest_k(curve)
+        if best_k:
+            st.write(f"Best silhouette score with **{best_k} clusters**.")
+        
+        curve_cols = st.columns(2)
+        with curve_cols[0]:
+            st.write("Inertia (elbow method)")
+            st.line_chart(curve.set_index("k")["inertia"])
+        with curve_cols[1]:
+            st.write("Silhouette score (higher is better)")
+            st.line_chart(curve.set_index("k")["silhouette"])
+
+def show_segmentation():
+    """Show guest and property segmentation built on the booking store"""
+    st.header("Guest & Property Segmentation")
+    st.write("""
+    Group guests and properties with similar booking behaviour, using the bookings managed in CiaoHost.
+    """)
+    
+    preset_key = st.radio(
+        "Segmentation",
+        list(SEGMENTATION_PRESETS.keys()),
+        format_func=lambda key: SEGMENTATION_PRESETS[key]["label"],
+        horizontal=True
+    )
+    preset = SEGMENTATION_PRESETS[preset_key]
+    
+    segments = preset["builder"](st.session_state.get("bookings", []), st.session_state.get("properties", []))
+    columns = preset["columns"]
+    
+    if segments.empty or len(segments.dropna(subset=columns)) < 3:
+        st.info("Not enough bookings to build segments yet.")
+        return
+    
+    curve = compute_k_curve(segments, columns)
+    max_k = max(2, min(10, len(segments.dropna(subset=columns)) - 1))
+    default_k = min(suggest_k(curve) or preset["k"], max_k) if curve is not None else min(preset["k"], max_k)
+    if max_k > 2:
+        n_clusters = st.slider("Number of segments", 2, max_k, default_k, key=f"segments_k_{preset_key}")
+    else:
+        # With three rows only two segments are possible, and a slider needs min < max
+        n_clusters = 2
+        st.caption("Number of segments: 2")
+    
+    clustered_df, centers = identify_clusters(segments, columns, n_clusters)
+    if 'error' in clustered_df.columns:
+        st.error(clustered_df['error'][0])
+        return
+    
+    render_k_curve(curve)
+    
+    st.write("### Segments")
+    st.dataframe(clustered_df[[preset["id_column"], 'cluster'] + columns].sort_values('cluster'))
+    
+    render_cluster_results(segments, clustered_df, centers, columns, n_clusters)
+
+def render_cluster_results(df, clustered_df, centers, selected_cols, n_clusters):
+    """Show distribution, charts, centers and samples of a clustering"""
+    # Show results
+    st.subheader("Cluster Analysis Results")
+    
+    # Cluster distribution
+    cluster_counts = clustered_df['cluster'].value_counts().sort_index()
+    
+    st.write("### Cluster Distribution")
+    fig = create_visualization(
+        pd.DataFrame({
+            'Cluster': cluster_counts.index,
+            'Count': cluster_counts.values
+        }),
+        "bar",
+        {
+            "x": "Cluster",
+            "y": "Count",
+            "title": "Records per Cluster",
+            "color": "Cluster"
+        }
+    )
+    render_chart_in_streamlit(fig)
+    
+    # Visualization of clusters
+    if len(selected_cols) >= 2:
+        st.write("### Cluster Visualization")
         
-        # Cluster distribution
-        cluster_counts = clustered_df['cluster'].value_counts().sort_index()
+        viz_cols = st.columns(2)
+        with viz_cols[0]:
+            x_col = st.selectbox("X-axis", selected_cols, index=0)
+        with viz_cols[1]:
+            y_col = st.selectbox("Y-axis", selected_cols, index=min(1, len(selected_cols)-1))
         
-        st.write("### Cluster Distribution")
+        # Create scatter plot
         fig = create_visualization(
-            pd.DataFrame({
-                'Cluster': cluster_counts.index,
-                'Count': cluster_counts.values
-            }),
-            "bar",
+            clustered_df,
+            "scatter",
             {
-                "x": "Cluster",
-                "y": "Count",
-                "title": "Records per Cluster",
-                "color": "Cluster"
+                "x": x_col,
+                "y": y_col,
+                "color": "cluster",
+                "title": f"Clusters by {x_col} and {y_col}",
+                "opacity": 0.7
             }
         )
         render_chart_in_streamlit(fig)
+    
+    # Show cluster centers
+    if centers is not None:
+        st.write("### Cluster Centers")
+        st.dataframe(centers)
         
-        # Visualization of clusters
-        if len(selected_cols) >= 2:
-            st.write("### Cluster Visualization")
+        # Radar chart of cluster centers
+        if len(selected_cols) >= 3:
+            st.write("### Cluster Profiles")
             
-            viz_cols = st.columns(2)
-            with viz_cols[0]:
-                x_col = st.selectbox("X-axis", selected_cols, index=0)
-            with viz_cols[1]:
-                y_col = st.selectbox("Y-axis", selected_cols, index=min(1, len(selected_cols)-1))
+            # Normalize cluster centers for radar chart
+            radar_data = []
             
-            # Create scatter plot
-            fig = create_visualization(
-                clustered_df,
-                "scatter",
-                {
-                    "x": x_col,
-                    "y": y_col,
-                    "color": "cluster",
-                    "title": f"Clusters by {x_col} and {y_col}",
-                    "opacity": 0.7
-                }
-            )
-            render_chart_in_streamlit(fig)
-        
-        # Show cluster centers
-        if centers is not None:
-            st.write("### Cluster Centers")
-            st.dataframe(centers)
+            # Get min/max values for normalization
+            mins = df[selected_cols].min()
+            maxs = df[selected_cols].max()
             
-            # Radar chart of cluster centers
-            if len(selected_cols) >= 3:
-                st.write("### Cluster Profiles")
-                
-                # Normalize cluster centers for radar chart
-                radar_data = []
-                
-                # Get min/max values for normalization
-                mins = df[selected_cols].min()
-                maxs = df[selected_cols].max()
+            # For each cluster center, create normalized values
+            for i in range(n_clusters):
+                center = centers[centers['cluster'] == i].iloc[0]
                 
-                # For each cluster center, create normalized values
-                for i in range(n_clusters):
-                    center = centers[centers['cluster'] == i].iloc[0]
-                    
-                    radar_data.append({
-                        'Cluster': f"Cluster {i}",
-                    })
-                    
-                    # Add normalized values (0-1 scale)
-                    for col in selected_cols:
-                        if maxs[col] > mins[col]:  # Avoid division by zero
-                            norm_val = (center[col] - mins[col]) / (maxs[col] - mins[col])
-                            radar_data[-1][col] = norm_val
-                        else:
-                            radar_data[-1][col] = 0.5  # Default if all values are the same
+                radar_data.append({
+                    'Cluster': f"Cluster {i}",
+                })
                 
-                radar_df = pd.DataFrame(radar_data)
-                
-                # Create radar chart using scatterpolar
-                import plotly.graph_objects as go
-                
-                fig = go.Figure()
-                for i in range(n_clusters):
-                    row = radar_df[radar_df['Cluster'] == f"Cluster {i}"].iloc[0]
-                    values = [row[col] for col in selected_cols]
-                    values.append(values[0])  # Close the loop
-                    theta = selected_cols + [selected_cols[0]]  # Close the loop
-                    
-                    fig.add_trace(go.Scatterpolar(
-                        r=values,
-                        theta=theta,
-                        fill='toself',
-                        name=f'Cluster {i}'
-                    ))
-                
-                fig.update_layout(
-                    polar=dict(
-                        radialaxis=dict(
-                            visible=True,
-                            range=[0, 1]
-                        )
-                    ),
-                    title="Normalized Cluster Profiles",
-                    showlegend=True
-                )
+                # Add normalized values (0-1 scale)
+                for col in selected_cols:
+                    if maxs[col] > mins[col]:  # Avoid division by zero
+                        norm_val = (center[col] - mins[col]) / (maxs[col] - mins[col])
+                        radar_data[-1][col] = norm_val
+                    else:
+                        radar_data[-1][col] = 0.5  # Default if all values are the same
+            
+            radar_df = pd.DataFrame(radar_data)
+            
+            # Create radar chart using scatterpolar
+            import plotly.graph_objects as go
+            
+            fig = go.Figure()
+            for i in range(n_clusters):
+                row = radar_df[radar_df['Cluster'] == f"Cluster {i}"].iloc[0]
+                values = [row[col] for col in selected_cols]
+                values.append(values[0])  # Close the loop
+                theta = selected_cols + [selected_cols[0]]  # Close the loop
                 
-                st.plotly_chart(fig, use_container_width=True)
-        
-        # Show sample data from each cluster
-        st.write("### Sample Records from Each Cluster")
-        
-        for i in range(n_clusters):
-            with st.expander(f"Cluster {i} Samples"):
-                cluster_sample = clustered_df[clustered_df['cluster'] == i].head(5)
-                if not cluster_sample.empty:
-                    st.dataframe(cluster_sample[selected_cols])
-                else:
-                    st.info(f"No records in Cluster {i}")
+                fig.add_trace(go.Scatterpolar(
+                    r=values,
+                    theta=theta,
+                    fill='toself',
+                    name=f'Cluster {i}'
+                ))
+            
+            fig.update_layout(
+                polar=dict(
+                    radialaxis=dict(
+                        visible=True,
+                        range=[0, 1]
+                    )
+                ),
+                title="Normalized Cluster Profiles",
+                showlegend=True
+            )
+            
+            st.plotly_chart(fig, use_container_width=True)
+    
+    # Show sample data from each cluster
+    st.write("### Sample Records from Each Cluster")
+    
+    for i in range(n_clusters):
+        with st.expander(f"Cluster {i} Samples"):
+            cluster_sample = clustered_df[clustered_df['cluster'] == i].head(5)
+            if not cluster_sample.empty:
+                st.dataframe(cluster_sample[selected_cols])
+            else:
+                st.info(f"No records in Cluster {i}")
 
 def show_data_profiling(df):
     """Show data profiling page"""
@@ -358,6 +489,62 @@ def show_data_profiling(df):
     with st.spinner("Generating data profile..."):
         profile = create_data_profile(df)
     
+    render_data_profile(profile)
+
+def show_large_file_profiling():
+    """Show profiling page for CSV files too large to load in memory"""
+    st.header("Large File Profiling")
+    st.write("""
+    Profile CSV files larger than memory, such as channel-manager exports, by reading them in chunks.
+    Distinct counts, quantiles and top values are approximate and reported with their error bounds.
+    """)
+    
+    file_path = st.text_input("CSV file path on the server", placeholder="data/exports/bookings.csv")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        chunksize = st.number_input("Rows per chunk", min_value=10_000, max_value=1_000_000,
+                                    value=DEFAULT_CHUNKSIZE, step=10_000)
+    with col2:
+        separator = st.text_input("Separator", value=",")
+    
+    if st.button("Profile File"):
+        if not file_path or not os.path.isfile(file_path):
+            st.error("File not found. Please enter a valid path.")
+            return
+        
+        progress = st.empty()
+        try:
+            with st.spinner("Profiling file..."):
+                st.session_state.stream_profile = profile_csv_stream(
+                    file_path,
+                    chunksize=int(chunksize),
+                    progress_callback=lambda rows: progress.write(f"Rows read: {rows:,}"),
+                    sep=separator
+                )
+        except Exception as e:
+            st.error(f"Error profiling file: {str(e)}")
+            return
+        progress.empty()
+    
+    profile = st.session_state.get("stream_profile")
+    if not profile:
+        return
+    
+    bounds = profile['error_bounds']
+    st.info(
+        f"Approximate profile ({bounds['confidence']:.0%} confidence): distinct counts within "
+        f"±{bounds['distinct_relative_error']:.1%}, quantiles within ±{bounds['quantile_rank_error']:.1%} "
+        f"in rank, top value counts overestimated by at most {bounds['top_values_error_share']:.2%} of the rows, "
+        f"duplicate rows within ±{bounds['duplicate_rows_error']:,}."
+    )
+    if profile['basic_info']['file_size']:
+        st.caption(f"File size: {profile['basic_info']['file_size']:.1f} MB")
+    
+    render_data_profile(profile)
+
+def render_data_profile(profile):
+    """Render a data profile (exact or approximate)"""
     # Show basic information
     st.subheader("Dataset Overview")
     
@@ -10,6 +10,7 @@ import json
 import os
 from utils.database import get_all_properties, get_property, update_property
 from utils.ai_assistant import dynamic_pricing_recommendation
+from utils.anomaly_service import check_price
 
 def show_dynamic_pricing():
     st.markdown("<h1 class='main-header'>Dynamic Pricing</h1>", unsafe_allow_html=True)
@@ -113,6 +114,10 @@ def show_pricing_overview():
             # Price editor
             st.subheader("Modifica Prezzi")
             
+            # Avviso di prezzo anomalo applicato prima del rerun
+            if "price_anomaly_warning" in st.session_state:
+                st.warning(st.session_state.pop("price_anomaly_warning"))
+            
             with st.form("edit_prices_form"):
                 st.write("Seleziona un intervallo di date e modifica i prezzi:")
                 
@@ -167,6 +172,14 @@ def show_pricing_overview():
                     # Save updated pricing data
                     save_pricing_data(selected_property_id, pricing_data)
                     
+                    # Segnaliamo i prezzi lontani da quelli pagati nelle prenotazioni
+                    anomaly = check_price(property_data, price_adjustment)
+                    if anomaly and anomaly["is_anomaly"]:
+                        st.session_state.price_anomaly_warning = (
+                            f"Il prezzo di €{price_adjustment:.2f} è insolito rispetto ai prezzi delle prenotazioni passate. "
+                            "Verifica che non si tratti di un errore di inserimento."
+                        )
+                    
                     # Update current price in property data
                     updated_property = property_data.copy()
                     updated_property['current_price'] = price_adjustment
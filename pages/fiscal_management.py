@@ -1,19 +1,42 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-import io
+import os
 from utils.database import (
     get_all_invoices, get_invoice, add_booking, update_booking, 
     get_booking, get_property, get_all_properties,
-    create_invoice_for_booking
+    create_invoice_for_booking, create_invoices_for_bookings
 )
 from utils.pdf_export import create_invoice_pdf
+from utils.invoice_export import (
+    create_export_job, run_export_job, list_export_jobs, delete_export_job
+)
+from utils.fatturapa import export_fatturapa_archive, check_company_info, get_schema
+from utils.fiscal_ledger import get_fiscal_summary, get_fiscal_totals
+from utils.tourist_tax import get_monthly_remittance, attach_tourist_tax_to_invoices, get_invoice_tourist_tax
+from utils.table_export import export_table, EXPORT_FORMATS
+
+# Larghezze e formati delle colonne nell'esportazione Excel delle fatture
+INVOICE_EXPORT_COLUMNS = {
+    "id": {"width": 10},
+    "Numero Fattura": {"width": 15},
+    "Data": {"width": 12},
+    "Ospite": {"width": 20},
+    "Immobile": {"width": 20},
+    "Importo": {"width": 12, "format": {'num_format': '€#,##0.00'}},
+    "IVA": {"width": 12, "format": {'num_format': '€#,##0.00'}},
+    "Aliquota IVA": {"width": 12},
+    "Imponibile": {"width": 12, "format": {'num_format': '€#,##0.00'}},
+    "Stato": {"width": 10},
+    "Data Pagamento": {"width": 15},
+    "Note": {"width": 30}
+}
 
 def show_fiscal_management():
     st.markdown("<h1 class='main-header'>Archivio Fiscale</h1>", unsafe_allow_html=True)
     
     # Create tabs for different fiscal management sections
-    tabs = st.tabs(["Fatture", "Generazione Fatture", "Esportazione", "Impostazioni Fiscali"])
+    tabs = st.tabs(["Fatture", "Generazione Fatture", "Esportazione", "Riepilogo Fiscale", "Impostazioni Fiscali"])
     
     with tabs[0]:
         show_invoices()
@@ -25,6 +48,9 @@ def show_fiscal_management():
         export_invoices()
     
     with tabs[3]:
+        show_fiscal_summary()
+    
+    with tabs[4]:
         fiscal_settings()
 
 def show_invoices():
@@ -145,6 +171,9 @@ def show_invoices():
                         st.markdown(f"**Importo Totale:** €{selected_invoice.get('amount'):.2f}")
                         st.markdown(f"**IVA ({selected_invoice.get('tax_percentage')}%):** €{selected_invoice.get('tax_amount'):.2f}")
                         st.markdown(f"**Imponibile:** €{selected_invoice.get('amount') - selected_invoice.get('tax_amount'):.2f}")
+                        tourist_tax = get_invoice_tourist_tax(selected_invoice_id)
+                        if tourist_tax and tourist_tax.get("amount"):
+                            st.markdown(f"**Imposta di Soggiorno ({tourist_tax.get('city')}, fuori campo IVA):** €{tourist_tax.get('amount'):.2f}")
                         st.markdown(f"**Stato:** {selected_invoice.get('status')}")
                         if selected_invoice.get('payment_date'):
                             st.markdown(f"**Data Pagamento:** {selected_invoice.get('payment_date')}")
@@ -203,7 +232,7 @@ def generate_invoices():
     
     # Get bookings without invoices
     all_invoices = get_all_invoices()
-    invoiced_booking_ids = [inv.get("booking_id") for inv in all_invoices]
+    invoiced_booking_ids = {inv.get("booking_id") for inv in all_invoices}
     
     bookings_data = []
     for booking in st.session_state.bookings:
@@ -236,10 +265,15 @@ def generate_invoices():
         if selected_booking_ids:
             if st.button("Genera Fatture"):
                 with st.spinner("Generazione fatture in corso..."):
-                    for booking_id in selected_booking_ids:
-                        create_invoice_for_booking(booking_id)
+                    try:
+                        summary = create_invoices_for_bookings(selected_booking_ids)
+                    except Exception as e:
+                        st.error(f"Errore nella generazione delle fatture: {str(e)}")
+                        return
                     
-                    st.success(f"Generate {len(selected_booking_ids)} fatture con successo!")
+                    st.success(f"Generate {len(summary['created'])} fatture con successo!")
+                    if summary["skipped"] or summary["missing"]:
+                        st.info(f"Saltate {len(summary['skipped'])} prenotazioni già fatturate e {len(summary['missing'])} non trovate.")
                     st.rerun()
     else:
         st.info("Tutte le prenotazioni hanno già fatture associate.")
@@ -361,54 +395,227 @@ def export_invoices():
             )
         
         with col2:
-            # Export to Excel
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name="Fatture", index=False)
-                
-                # Get the xlsxwriter workbook and worksheet objects
-                workbook = writer.book
-                worksheet = writer.sheets["Fatture"]
-                
-                # Add some cell formats
-                format_header = workbook.add_format({'bold': True, 'bg_color': '#D7E4BC'})
-                format_money = workbook.add_format({'num_format': '€#,##0.00'})
-                
-                # Set column widths and formats
-                worksheet.set_column('A:A', 10)  # ID
-                worksheet.set_column('B:B', 15)  # Numero Fattura
-                worksheet.set_column('C:C', 12)  # Data
-                worksheet.set_column('D:D', 20)  # Ospite
-                worksheet.set_column('E:E', 20)  # Immobile
-                worksheet.set_column('F:F', 12, format_money)  # Importo
-                worksheet.set_column('G:G', 12, format_money)  # IVA
-                worksheet.set_column('H:H', 12)  # Aliquota IVA
-                worksheet.set_column('I:I', 12, format_money)  # Imponibile
-                worksheet.set_column('J:J', 10)  # Stato
-                worksheet.set_column('K:K', 15)  # Data Pagamento
-                worksheet.set_column('L:L', 30)  # Note
-                
-                # Write the column headers with the defined format
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, format_header)
-            
-            # Return the Excel file from the BytesIO object
-            buffer.seek(0)
-            
-            st.download_button(
-                label="Esporta Excel",
-                data=buffer,
-                file_name=f"fatture_{start_date}_{end_date}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            # Export to Excel, or to the faster compressed CSV and Parquet formats
+            export_format = st.selectbox(
+                "Formato",
+                options=list(EXPORT_FORMATS.keys()),
+                format_func=lambda x: EXPORT_FORMATS[x]["label"],
+                key="invoice_export_format"
             )
+            
+            if st.button("Prepara Esportazione"):
+                try:
+                    # Righe scritte a blocchi, in memoria costante; i formati sono creati una volta
+                    buffer = export_table(
+                        df,
+                        export_format,
+                        sheet_name="Fatture",
+                        columns=INVOICE_EXPORT_COLUMNS,
+                        header_format={'bold': True, 'bg_color': '#D7E4BC'}
+                    )
+                    st.download_button(
+                        label="Scarica File",
+                        data=buffer,
+                        file_name=f"fatture_{start_date}_{end_date}.{EXPORT_FORMATS[export_format]['extension']}",
+                        mime=EXPORT_FORMATS[export_format]["mime"]
+                    )
+                except ImportError as e:
+                    st.error(f"Formato non disponibile: {str(e)}")
         
         with col3:
             if st.button("Esporta PDF Multipli"):
-                st.info("Questa funzione genererebbe un PDF per ogni fattura selezionata e le includerebbe in un file ZIP.")
-                st.info("In un'applicazione completa, qui verrebbe fornito un file ZIP con tutte le fatture PDF.")
+                # I PDF vengono generati in parallelo e scritti direttamente nello ZIP su disco
+                job_id = create_export_job(
+                    [inv["id"] for inv in filtered_invoices],
+                    name=f"fatture_{start_date}_{end_date}"
+                )
+                run_invoice_export(job_id)
+        
+        if st.button("Esporta FatturaPA (XML)"):
+            run_fatturapa_export(
+                [inv["id"] for inv in filtered_invoices],
+                name=f"fatturapa_{start_date}_{end_date}"
+            )
+        
+        show_invoice_export_jobs()
     else:
         st.info("Nessuna fattura corrisponde ai filtri selezionati.")
 
+def run_invoice_export(job_id):
+    """Run an export job showing its progress"""
+    progress_bar = st.progress(0.0, text="Generazione PDF in corso...")
+    
+    def update_progress(done, total):
+        progress_bar.progress(done / total if total else 1.0, text=f"Generati {done} di {total} PDF")
+    
+    try:
+        job = run_export_job(job_id, progress_callback=update_progress)
+    except Exception as e:
+        st.error(f"Errore durante l'esportazione: {str(e)}. Puoi riprenderla dall'elenco delle esportazioni.")
+        return
+    
+    progress_bar.progress(1.0, text="Esportazione completata")
+    if job["errors"]:
+        st.warning(f"{len(job['errors'])} fatture non sono state esportate.")
+
+def run_fatturapa_export(invoice_ids, name):
+    """Generate the FatturaPA XML archive of the invoices, showing progress and rejected documents"""
+    company_info = st.session_state.get("company_info", {})
+    company_errors = check_company_info(company_info)
+    if company_errors:
+        st.error("Completa le informazioni azienda nelle Impostazioni Fiscali: " + "; ".join(company_errors))
+        return
+    
+    try:
+        schema = get_schema()
+    except ValueError as e:
+        st.error(str(e))
+        return
+    if schema is None:
+        st.warning("Schema XSD FatturaPA non disponibile: i file XML verranno generati senza validazione.")
+    
+    progress_bar = st.progress(0.0, text="Generazione XML in corso...")
+    
+    def update_progress(done, total):
+        progress_bar.progress(done / total if total else 1.0, text=f"Generati {done} di {total} XML")
+    
+    try:
+        summary = export_fatturapa_archive(invoice_ids, company_info, name=name, progress_callback=update_progress)
+    except Exception as e:
+        st.error(f"Errore durante la generazione FatturaPA: {str(e)}")
+        return
+    
+    progress_bar.progress(1.0, text=f"{summary['exported']} fatture elettroniche pronte per l'invio")
+    
+    if summary["errors"]:
+        st.warning(f"{len(summary['errors'])} fatture non hanno superato i controlli e non sono nell'archivio.")
+        with st.expander("Dettaglio errori"):
+            for error in summary["errors"]:
+                st.write(f"**{error['file_name'] or error['invoice_id']}**: {'; '.join(error['errors'])}")
+    
+    if summary["exported"]:
+        # Lo ZIP viene letto dal disco solo quando si scarica
+        with open(summary["path"], "rb") as f:
+            st.download_button(
+                label="Scarica ZIP FatturaPA",
+                data=f,
+                file_name=os.path.basename(summary["path"]),
+                mime="application/zip"
+            )
+
+def show_invoice_export_jobs():
+    """Show bulk PDF exports with download and resume actions"""
+    jobs = list_export_jobs()
+    if not jobs:
+        return
+    
+    st.markdown("### Esportazioni PDF")
+    
+    for job in jobs[:10]:
+        total = len(job["invoice_ids"])
+        created = datetime.fromisoformat(job["created_at"]).strftime("%d/%m/%Y %H:%M")
+        
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            st.write(f"**{job['name']}** - {created} - {job['completed']}/{total} fatture ({job['status']})")
+        
+        with col2:
+            if job["status"] == "Completato" and os.path.exists(job["zip_path"]):
+                # Lo ZIP viene letto dal disco solo quando si scarica
+                with open(job["zip_path"], "rb") as f:
+                    st.download_button(
+                        label="Scarica ZIP",
+                        data=f,
+                        file_name=f"{job['name']}.zip",
+                        mime="application/zip",
+                        key=f"download_{job['id']}"
+                    )
+            elif st.button("Riprendi", key=f"resume_{job['id']}"):
+                run_invoice_export(job["id"])
+                st.rerun()
+        
+        with col3:
+            if st.button("Elimina", key=f"delete_export_{job['id']}"):
+                delete_export_job(job["id"])
+                st.rerun()
+
+def show_fiscal_summary():
+    """Show VAT, taxable amount and commissions by period and property from the fiscal ledger"""
+    st.subheader("Riepilogo Fiscale")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        year = st.selectbox("Anno", list(range(datetime.now().year, datetime.now().year - 6, -1)), key="fiscal_summary_year")
+    with col2:
+        period_label = st.radio("Periodo", ["Trimestrale", "Mensile"], horizontal=True, key="fiscal_summary_period")
+    
+    show_fiscal_ledger(year, "quarter" if period_label == "Trimestrale" else "month")
+    
+    # L'imposta di soggiorno non dipende dal registro fiscale: la mostriamo anche senza prenotazioni registrate
+    show_tourist_tax_remittance(year)
+
+def show_fiscal_ledger(year, period):
+    """Show the fiscal ledger totals of a year by period and by property"""
+    start_date = datetime(year, 1, 1).date()
+    end_date = datetime(year, 12, 31).date()
+    
+    # I totali arrivano dal registro fiscale: una riga per periodo, senza rileggere prenotazioni e fatture
+    summary = get_fiscal_summary(period, start_date, end_date)
+    if not summary:
+        st.info("Nessuna prenotazione registrata nell'anno selezionato.")
+        return
+    
+    columns = {
+        "period": "Periodo", "bookings": "Prenotazioni", "gross": "Lordo", "taxable": "Imponibile",
+        "vat": "IVA", "cleaning_fees": "Pulizie", "commissions": "Commissioni"
+    }
+    money_columns = ["Lordo", "Imponibile", "IVA", "Pulizie", "Commissioni"]
+    
+    df = pd.DataFrame(summary).rename(columns=columns)
+    st.dataframe(df.style.format({col: "€{:,.2f}" for col in money_columns}), use_container_width=True, hide_index=True)
+    
+    totals = get_fiscal_totals(start_date, end_date)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Imponibile", f"€{totals['taxable']:,.2f}")
+    col2.metric("IVA", f"€{totals['vat']:,.2f}")
+    col3.metric("Commissioni", f"€{totals['commissions']:,.2f}")
+    
+    st.markdown("### Per Immobile")
+    property_names = {p.get("id"): p.get("name") for p in get_all_properties()}
+    by_property = pd.DataFrame(get_fiscal_totals(start_date, end_date, by_property=True))
+    by_property["property_id"] = by_property["property_id"].map(lambda x: property_names.get(x, "Sconosciuto"))
+    by_property = by_property.rename(columns={"property_id": "Immobile", **columns})
+    st.dataframe(by_property.style.format({col: "€{:,.2f}" for col in money_columns}), use_container_width=True, hide_index=True)
+
+def show_tourist_tax_remittance(year):
+    """Show the tourist tax to remit to each city, month by month"""
+    st.markdown("### Imposta di Soggiorno")
+    
+    remittance = get_monthly_remittance(year)
+    if remittance.empty:
+        st.info("Nessuna imposta di soggiorno dovuta nell'anno selezionato. Le regole dei comuni si trovano in data/tourist_tax.")
+    else:
+        table = remittance.rename(columns={
+            "city": "Comune", "month": "Mese", "stays": "Soggiorni",
+            "guest_nights": "Pernottamenti", "tourist_tax": "Imposta"
+        })
+        st.dataframe(table.style.format({"Imposta": "€{:,.2f}", "Pernottamenti": "{:,.0f}"}), use_container_width=True, hide_index=True)
+        
+        for city, total in remittance.groupby("city")["tourist_tax"].sum().items():
+            st.write(f"**{city}:** €{total:,.2f} da riversare nel {year}")
+    
+    # Le nuove fatture ricevono l'imposta alla creazione; il ricalcolo serve dopo una modifica delle regole
+    if st.button("Ricalcola imposta di soggiorno di tutte le fatture"):
+        with st.spinner("Calcolo dell'imposta in corso..."):
+            try:
+                result = attach_tourist_tax_to_invoices()
+            except Exception as e:
+                st.error(f"Errore nel calcolo dell'imposta di soggiorno: {str(e)}")
+                return
+        st.success(f"Imposta calcolata per {result['invoices']} fatture: €{result['total']:,.2f}")
+        if result["missing_rules"]:
+            st.warning(f"Nessuna regola per: {', '.join(result['missing_rules'])}. Aggiungi un file in data/tourist_tax.")
+
 def fiscal_settings():
     st.subheader("Impostazioni Fiscali")
     
@@ -158,6 +158,7 @@ def add_new_property():
                                         ["Appartamento", "Casa", "Villa", "B&B", "Camera Privata", "Altro"])
             city = st.text_input("Città*", placeholder="Es: Napoli")
             address = st.text_input("Indirizzo*", placeholder="Es: Via Roma, 123")
+            zip_code = st.text_input("CAP", placeholder="Es: 80100")
         
         with col2:
             bedrooms = st.number_input("Camere da letto*", min_value=0, value=1)
@@ -246,6 +247,7 @@ def add_new_property():
             "type": property_type,
             "city": city,
             "address": address,
+            "zip": zip_code.strip(),
             "bedrooms": bedrooms,
             "bathrooms": bathrooms,
             "max_guests": max_guests,
@@ -317,6 +319,7 @@ def edit_property():
                                         index=["Appartamento", "Casa", "Villa", "B&B", "Camera Privata", "Altro"].index(selected_property.get("type", "Appartamento")))
             city = st.text_input("Città*", value=selected_property.get("city", ""))
             address = st.text_input("Indirizzo*", value=selected_property.get("address", ""))
+            zip_code = st.text_input("CAP", value=selected_property.get("zip") or "")
         
         with col2:
             bedrooms = st.number_input("Camere da letto*", min_value=0, value=selected_property.get("bedrooms", 1))
@@ -413,6 +416,7 @@ def edit_property():
             "type": property_type,
             "city": city,
             "address": address,
+            "zip": zip_code.strip(),
             "bedrooms": bedrooms,
             "bathrooms": bathrooms,
             "max_guests": max_guests,
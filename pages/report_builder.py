@@ -2,11 +2,15 @@ import streamlit as st
 import pandas as pd
 import json
 import io
+import zipfile
 from datetime import datetime, timedelta
 import os
 from utils.database import get_all_properties, get_property, get_all_bookings, get_all_invoices, get_booking
 from utils.pdf_export import create_property_report_pdf, create_financial_report_pdf
-from utils.report_generator import generate_report_template, add_section_to_report, render_report_in_streamlit, generate_pdf_report, download_report, generate_ai_report
+from utils.report_catalog import save_report, sync_catalog, search_reports, load_report, delete_report, REPORTS_PER_PAGE
+from utils.booking_facts import get_booking_facts, filter_booking_facts
+from utils.table_export import write_excel
+from utils.report_generator import generate_report_template, add_section_to_report, render_report_in_streamlit, generate_pdf_report, generate_pdf_reports, download_report, generate_ai_report
 
 def main():
     st.markdown("<h1 class='main-header'>Report Builder</h1>", unsafe_allow_html=True)
@@ -19,19 +23,8 @@ def main():
         st.warning("Per utilizzare il Report Builder, devi prima aggiungere immobili e prenotazioni.")
         return
     
-    # Convert to dataframe
-    df_bookings = pd.DataFrame(bookings)
-    df_properties = pd.DataFrame(properties)
-    
-    # Join data for a complete view
-    if not df_bookings.empty and not df_properties.empty:
-        try:
-            df = df_bookings.merge(df_properties, how='left', left_on='property_id', right_on='id', suffixes=('', '_property'))
-        except:
-            st.error("Errore nell'unione dei dati. Assicurati che i dati siano nel formato corretto.")
-            df = df_bookings
-    else:
-        df = df_bookings
+    # Bookings joined to properties, typed and with nights/ADR: rebuilt only when the data changes
+    df = get_booking_facts(bookings, properties)
     
     # Create tabs
     tabs = st.tabs(["Report Personalizzato", "Report AI", "Report Salvati"])
@@ -107,27 +100,8 @@ def build_custom_report(df):
             format_func=lambda x: property_options.get(x, x)
         )
         
-        # Apply filters to dataframe
-        filtered_df = df.copy()
-        
-        # Date filters
-        if 'checkin_date' in filtered_df.columns:
-            try:
-                filtered_df['checkin_date'] = pd.to_datetime(filtered_df['checkin_date'])
-                filtered_df = filtered_df[filtered_df['checkin_date'].dt.date >= start_date]
-            except:
-                st.warning("Errore nella conversione delle date di check-in. Il filtro per data di check-in non è stato applicato.")
-        
-        if 'checkout_date' in filtered_df.columns:
-            try:
-                filtered_df['checkout_date'] = pd.to_datetime(filtered_df['checkout_date'])
-                filtered_df = filtered_df[filtered_df['checkout_date'].dt.date <= end_date]
-            except:
-                st.warning("Errore nella conversione delle date di check-out. Il filtro per data di check-out non è stato applicato.")
-        
-        # Property filter
-        if selected_property != "all" and 'property_id' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['property_id'] == selected_property]
+        # Apply filters to dataframe (dates are already typed in the booking facts table)
+        filtered_df = filter_booking_facts(df, start_date, end_date, selected_property)
         
         # Show filtered data preview
         if not filtered_df.empty:
@@ -239,33 +213,7 @@ def build_custom_report(df):
             with col2:
                 if st.button("Download Excel"):
                     # Create Excel file with report data
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                        # Add filtered data
-                        filtered_df.to_excel(writer, sheet_name="Dati", index=False)
-                        
-                        # Add report metadata
-                        metadata = pd.DataFrame([
-                            {"Campo": "Titolo", "Valore": st.session_state.current_report.get("title", "")},
-                            {"Campo": "Descrizione", "Valore": st.session_state.current_report.get("description", "")},
-                            {"Campo": "Autore", "Valore": st.session_state.current_report.get("author", "")},
-                            {"Campo": "Data", "Valore": st.session_state.current_report.get("date", "")},
-                            {"Campo": "Sezioni", "Valore": len(st.session_state.current_report.get("sections", []))}
-                        ])
-                        
-                        metadata.to_excel(writer, sheet_name="Metadata", index=False)
-                        
-                        # Add a sheet for each section
-                        for i, section in enumerate(st.session_state.current_report.get("sections", [])):
-                            # Create a dataframe with section data
-                            section_df = pd.DataFrame([
-                                {"Campo": "Titolo", "Valore": section.get("title", "")},
-                                {"Campo": "Contenuto", "Valore": section.get("content", "")}
-                            ])
-                            
-                            section_df.to_excel(writer, sheet_name=f"Sezione {i+1}", index=False)
-                    
-                    buffer.seek(0)
+                    buffer = export_report_excel(st.session_state.current_report, filtered_df)
                     
                     st.download_button(
                         label="Scarica Excel",
@@ -276,16 +224,8 @@ def build_custom_report(df):
             
             with col3:
                 if st.button("Salva Report"):
-                    # Create reports directory if it doesn't exist
-                    os.makedirs('data/reports', exist_ok=True)
-                    
-                    # Generate a filename
-                    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                    filepath = os.path.join('data/reports', filename)
-                    
-                    # Save report to file
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        json.dump(st.session_state.current_report, f, ensure_ascii=False, indent=2)
+                    # Save the report file and add it to the catalog
+                    filename = save_report(st.session_state.current_report, prefix="report")
                     
                     st.success(f"Report salvato come {filename}!")
     else:
@@ -326,27 +266,8 @@ def create_ai_report(df):
             key="ai_property"
         )
         
-        # Apply filters to dataframe
-        filtered_df = df.copy()
-        
-        # Date filters
-        if 'checkin_date' in filtered_df.columns:
-            try:
-                filtered_df['checkin_date'] = pd.to_datetime(filtered_df['checkin_date'])
-                filtered_df = filtered_df[filtered_df['checkin_date'].dt.date >= start_date]
-            except:
-                st.warning("Errore nella conversione delle date di check-in. Il filtro per data di check-in non è stato applicato.")
-        
-        if 'checkout_date' in filtered_df.columns:
-            try:
-                filtered_df['checkout_date'] = pd.to_datetime(filtered_df['checkout_date'])
-                filtered_df = filtered_df[filtered_df['checkout_date'].dt.date <= end_date]
-            except:
-                st.warning("Errore nella conversione delle date di check-out. Il filtro per data di check-out non è stato applicato.")
-        
-        # Property filter
-        if selected_property != "all" and 'property_id' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['property_id'] == selected_property]
+        # Apply filters to dataframe (dates are already typed in the booking facts table)
+        filtered_df = filter_booking_facts(df, start_date, end_date, selected_property)
     
     # Report type and settings
     report_type = st.selectbox(
@@ -441,33 +362,7 @@ def create_ai_report(df):
             with col2:
                 if st.button("Download Excel", key="ai_excel"):
                     # Create Excel file with report data
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                        # Add filtered data
-                        filtered_df.to_excel(writer, sheet_name="Dati", index=False)
-                        
-                        # Add report metadata
-                        metadata = pd.DataFrame([
-                            {"Campo": "Titolo", "Valore": st.session_state.ai_report.get("title", "")},
-                            {"Campo": "Descrizione", "Valore": st.session_state.ai_report.get("description", "")},
-                            {"Campo": "Autore", "Valore": st.session_state.ai_report.get("author", "")},
-                            {"Campo": "Data", "Valore": st.session_state.ai_report.get("date", "")},
-                            {"Campo": "Sezioni", "Valore": len(st.session_state.ai_report.get("sections", []))}
-                        ])
-                        
-                        metadata.to_excel(writer, sheet_name="Metadata", index=False)
-                        
-                        # Add a sheet for each section
-                        for i, section in enumerate(st.session_state.ai_report.get("sections", [])):
-                            # Create a dataframe with section data
-                            section_df = pd.DataFrame([
-                                {"Campo": "Titolo", "Valore": section.get("title", "")},
-                                {"Campo": "Contenuto", "Valore": section.get("content", "")}
-                            ])
-                            
-                            section_df.to_excel(writer, sheet_name=f"Sezione {i+1}", index=False)
-                    
-                    buffer.seek(0)
+                    buffer = export_report_excel(st.session_state.ai_report, filtered_df)
                     
                     st.download_button(
                         label="Scarica Excel",
@@ -478,92 +373,118 @@ def create_ai_report(df):
             
             with col3:
                 if st.button("Salva Report", key="ai_save"):
-                    # Create reports directory if it doesn't exist
-                    os.makedirs('data/reports', exist_ok=True)
-                    
-                    # Generate a filename
-                    filename = f"ai_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                    filepath = os.path.join('data/reports', filename)
-                    
-                    # Save report to file
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        json.dump(st.session_state.ai_report, f, ensure_ascii=False, indent=2)
+                    # Save the report file and add it to the catalog
+                    filename = save_report(st.session_state.ai_report, prefix="ai_report")
                     
                     st.success(f"Report AI salvato come {filename}!")
 
+def export_report_excel(report, df):
+    """
+    Export the report data, metadata and sections to Excel
+
+    The data sheet is written in chunks, in constant memory.
+
+    Args:
+        report (dict): Report dictionary
+        df (pandas.DataFrame): Filtered report data
+
+    Returns:
+        BytesIO: Excel file
+    """
+    metadata = pd.DataFrame([
+        {"Campo": "Titolo", "Valore": report.get("title", "")},
+        {"Campo": "Descrizione", "Valore": report.get("description", "")},
+        {"Campo": "Autore", "Valore": report.get("author", "")},
+        {"Campo": "Data", "Valore": report.get("date", "")},
+        {"Campo": "Sezioni", "Valore": len(report.get("sections", []))}
+    ])
+    
+    sheets = [{"name": "Dati", "data": df}, {"name": "Metadata", "data": metadata}]
+    
+    # Add a sheet for each section
+    for i, section in enumerate(report.get("sections", [])):
+        sheets.append({"name": f"Sezione {i+1}", "data": pd.DataFrame([
+            {"Campo": "Titolo", "Valore": section.get("title", "")},
+            {"Campo": "Contenuto", "Valore": section.get("content", "")}
+        ])})
+    
+    return write_excel(sheets)
+
 def view_saved_reports(df):
     """View and manage saved reports"""
     st.subheader("Report Salvati")
     
-    # Create reports directory if it doesn't exist
-    os.makedirs('data/reports', exist_ok=True)
+    # Index reports saved outside the catalog and drop deleted ones (only file names are listed)
+    sync_catalog()
+    
+    # Search and filters
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        search_query = st.text_input("Cerca per titolo o autore", key="saved_reports_search")
+    with col2:
+        type_filter = st.selectbox("Tipo", options=["Tutti", "Custom", "AI"], key="saved_reports_type")
     
-    # Get list of saved reports
-    report_files = [f for f in os.listdir('data/reports') if f.endswith('.json')]
+    report_type = None if type_filter == "Tutti" else type_filter
+    _, total = search_reports(search_query, report_type, page=1, per_page=1)
     
-    if not report_files:
-        st.info("Nessun report salvato. Crea un report utilizzando le schede 'Report Personalizzato' o 'Report AI'.")
+    if total == 0:
+        if search_query or report_type:
+            st.info("Nessun report corrisponde alla ricerca.")
+        else:
+            st.info("Nessun report salvato. Crea un report utilizzando le schede 'Report Personalizzato' o 'Report AI'.")
         return
     
-    # Sort reports by date (newest first)
-    report_files.sort(reverse=True)
+    # Pagination
+    total_pages = (total + REPORTS_PER_PAGE - 1) // REPORTS_PER_PAGE
+    page = st.number_input(f"Pagina (di {total_pages})", min_value=1, max_value=total_pages, value=1, step=1,
+                           key="saved_reports_page") if total_pages > 1 else 1
     
-    # Create a list of reports with metadata
-    reports_meta = []
-    
-    for file in report_files:
-        filepath = os.path.join('data/reports', file)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                report = json.load(f)
-                
-                # Extract creation date from filename or use report date
-                if "_" in file:
-                    date_str = file.split("_")[1].split(".")[0]
-                    if len(date_str) == 8:  # YYYYMMDD format
-                        created_date = f"{date_str[6:8]}/{date_str[4:6]}/{date_str[0:4]}"
-                    else:
-                        created_date = report.get("date", "N/A")
-                else:
-                    created_date = report.get("date", "N/A")
-                
-                reports_meta.append({
-                    "filename": file,
-                    "title": report.get("title", "Untitled"),
-                    "date": report.get("date", "N/A"),
-                    "created": created_date,
-                    "author": report.get("author", ""),
-                    "sections": len(report.get("sections", [])),
-                    "type": "AI" if "ai_report" in file else "Custom"
-                })
-        except:
-            reports_meta.append({
-                "filename": file,
-                "title": "Error loading report",
-                "date": "N/A",
-                "created": "N/A",
-                "author": "",
-                "sections": 0,
-                "type": "Unknown"
-            })
+    reports_meta, total = search_reports(search_query, report_type, page=page)
+    st.caption(f"{total} report trovati")
     
     # Display reports in a table
     reports_df = pd.DataFrame(reports_meta)
-    st.dataframe(reports_df, use_container_width=True)
+    reports_df["created"] = pd.to_datetime(reports_df["created_at"]).dt.strftime("%d/%m/%Y")
+    st.dataframe(
+        reports_df[["filename", "title", "date", "created", "author", "sections", "type"]],
+        use_container_width=True
+    )
+    
+    # I PDF della pagina vengono convertiti in parallelo e raccolti in un unico ZIP
+    if st.button("Esporta pagina in PDF (ZIP)", key="saved_reports_pdf_zip"):
+        with st.spinner("Generazione dei PDF in corso..."):
+            readable_meta, reports = [], []
+            for meta in reports_meta:
+                try:
+                    reports.append(load_report(meta["filename"]))
+                    readable_meta.append(meta)
+                except (OSError, ValueError) as e:
+                    st.warning(f"Report {meta['filename']} non leggibile, escluso dallo ZIP: {str(e)}")
+            pdf_buffers = generate_pdf_reports(reports, df)
+        if pdf_buffers:
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for meta, pdf_buffer in zip(readable_meta, pdf_buffers):
+                    archive.writestr(f"{os.path.splitext(meta['filename'])[0]}.pdf", pdf_buffer.getvalue())
+            st.download_button(
+                label="Scarica ZIP",
+                data=zip_buffer.getvalue(),
+                file_name=f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip"
+            )
     
     # Select a report to view
+    titles = {r["filename"]: r["title"] for r in reports_meta}
     selected_report = st.selectbox(
         "Seleziona un Report da Visualizzare",
-        options=report_files,
-        format_func=lambda x: next((r["title"] for r in reports_meta if r["filename"] == x), x)
+        options=list(titles.keys()),
+        format_func=lambda x: titles.get(x, x)
     )
     
     if selected_report:
-        filepath = os.path.join('data/reports', selected_report)
-        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                report = json.load(f)
+            # Only the selected report is read from disk
+            report = load_report(selected_report)
             
             with st.expander("Visualizza Report", expanded=True):
                 st.subheader(report.get("title", "Untitled Report"))
@@ -595,7 +516,7 @@ def view_saved_reports(df):
                 
                 with col3:
                     if st.button("Delete Report", key="delete_report"):
-                        os.remove(filepath)
+                        delete_report(selected_report)
                         st.success(f"Report {selected_report} eliminato.")
                         st.rerun()
         except Exception as e:
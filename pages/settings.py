@@ -4,12 +4,14 @@ import json
 import os
 from datetime import datetime
 import re
+from utils.conversation_memory import DEFAULT_MAX_TURNS, DEFAULT_TOKEN_BUDGET
+from utils.llm_telemetry import get_feature_summary, get_daily_spend
 
 def show_settings():
     st.markdown("<h1 class='main-header'>Impostazioni</h1>", unsafe_allow_html=True)
     
     # Create tabs for different settings categories
-    tabs = st.tabs(["Profilo", "Integrazione API", "Notifiche", "Backup e Ripristino", "Preferenze"])
+    tabs = st.tabs(["Profilo", "Integrazione API", "Notifiche", "Backup e Ripristino", "Preferenze", "Utilizzo AI"])
     
     with tabs[0]:
         show_profile_settings()
@@ -25,6 +27,9 @@ def show_settings():
     
     with tabs[4]:
         show_preferences()
+    
+    with tabs[5]:
+        show_ai_usage()
 
 def show_profile_settings():
     st.subheader("Profilo Utente")
@@ -842,7 +847,9 @@ def show_preferences():
             "notifications_sound": True,
             "auto_translate": True,
             "default_checkin_time": "15:00",
-            "default_checkout_time": "10:00"
+            "default_checkout_time": "10:00",
+            "history_max_turns": DEFAULT_MAX_TURNS,
+            "history_token_budget": DEFAULT_TOKEN_BUDGET
         }
     
     preferences = st.session_state.preferences
@@ -932,6 +939,27 @@ def show_preferences():
         help="Traduce automaticamente i messaggi degli ospiti nella lingua selezionata"
     )
     
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        history_max_turns = st.number_input(
+            "Messaggi Recenti nel Contesto AI",
+            min_value=1,
+            max_value=50,
+            value=preferences.get("history_max_turns", DEFAULT_MAX_TURNS),
+            help="Numero di messaggi recenti inviati integralmente al co-host virtuale; i precedenti vengono riassunti"
+        )
+    
+    with col2:
+        history_token_budget = st.number_input(
+            "Budget Token Cronologia",
+            min_value=200,
+            max_value=8000,
+            step=100,
+            value=preferences.get("history_token_budget", DEFAULT_TOKEN_BUDGET),
+            help="Numero massimo di token (stimati) di cronologia e riassunto inviati per ogni richiesta"
+        )
+    
     # Save preferences button
     if st.button("Salva Preferenze"):
         # Update preferences
@@ -944,9 +972,53 @@ def show_preferences():
             "notifications_sound": notifications_sound,
             "auto_translate": auto_translate,
             "default_checkin_time": default_checkin_time,
-            "default_checkout_time": default_checkout_time
+            "default_checkout_time": default_checkout_time,
+            "history_max_turns": history_max_turns,
+            "history_token_budget": history_token_budget
         })
         
         st.success("Preferenze salvate con successo!")
         # In a real app, would save to database
+
+def show_ai_usage():
+    st.subheader("Utilizzo AI")
+    st.write("""
+    Latenza, token e costi stimati delle chiamate ai modelli AI, suddivisi per funzionalità.
+    """)
+    
+    days = st.selectbox(
+        "Periodo",
+        [1, 7, 30, 90],
+        index=2,
+        format_func=lambda x: "Ultime 24 ore" if x == 1 else f"Ultimi {x} giorni",
+        key="ai_usage_days"
+    )
+    
+    summary = get_feature_summary(days)
+    
+    if summary.empty:
+        st.info("Nessuna chiamata AI registrata nel periodo selezionato.")
+        return
+    
+    # Metriche complessive
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Chiamate", int(summary["Chiamate"].sum()))
+    
+    with col2:
+        st.metric("Errori", int(summary["Errori"].sum()))
+    
+    with col3:
+        st.metric("Cache Hit", int(summary["Cache hit"].sum()))
+    
+    with col4:
+        st.metric("Costo Stimato", f"${summary['Costo (USD)'].sum():.2f}")
+    
+    st.markdown("### Latenza e Token per Funzionalità")
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+    
+    st.markdown("### Spesa Giornaliera (USD)")
+    daily_spend = get_daily_spend(days)
+    st.bar_chart(daily_spend)
 import time
\ No newline at end of file
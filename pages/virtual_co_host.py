@@ -7,8 +7,10 @@ import uuid
 from datetime import datetime, timedelta
 import re
 import random
-from utils.ai_assistant import generate_response, virtual_co_host
+from utils.ai_assistant import generate_response, virtual_co_host, translate_template
+from utils.translation_memory import fill_placeholders, get_translation_memory_stats
 from utils.database import get_all_properties, get_property, get_all_bookings, get_booking
+from utils.conversation_memory import build_conversation_window, DEFAULT_MAX_TURNS, DEFAULT_TOKEN_BUDGET
 
 def show_virtual_co_host():
     st.markdown("<h1 class='main-header'>Co-Host Virtuale AI</h1>", unsafe_allow_html=True)
@@ -711,25 +713,37 @@ def show_faq_management():
                     else:
                         preview_data[var] = st.text_input(f"{var}")
                 
-                # Generate preview
-                preview_text = selected_resp['text']
-                for var, value in preview_data.items():
-                    preview_text = preview_text.replace("{" + var + "}", value)
+                preview_language = st.selectbox(
+                    "Lingua Anteprima",
+                    ["Italiano", "English", "Français", "Español", "Deutsch"],
+                    key="preview_response_language"
+                )
+                
+                # Generate preview (the template is translated once per language, then filled)
+                if preview_language == "Italiano":
+                    preview_text = fill_placeholders(selected_resp['text'], preview_data)
+                else:
+                    preview_text = translate_template(selected_resp['text'], preview_language.lower(), preview_data)
                 
                 st.markdown("**Anteprima:**")
                 st.markdown(f"<div style='background-color: #f0f2f6; padding: 15px; border-radius: 5px;'>{preview_text}</div>", unsafe_allow_html=True)
+                
+                memory_stats = get_translation_memory_stats()
+                st.caption(
+                    f"Memoria di traduzione: {memory_stats['entries']} traduzioni salvate, "
+                    f"{memory_stats['hits']} riutilizzi"
+                )
 
 # Helper functions
 def get_conversation_history():
-    """Get formatted conversation history for AI context"""
-    messages = st.session_state.active_chat.get("messages", [])
-    history = []
-    
-    for msg in messages:
-        role = "user" if msg["sender"] == "guest" else "assistant"
-        history.append({"role": role, "content": msg["text"]})
-    
-    return history
+    """Get formatted conversation history for AI context, windowed to the token budget"""
+    preferences = st.session_state.get("preferences", {})
+    
+    return build_conversation_window(
+        st.session_state.active_chat,
+        max_turns=preferences.get("history_max_turns", DEFAULT_MAX_TURNS),
+        token_budget=preferences.get("history_token_budget", DEFAULT_TOKEN_BUDGET)
+    )
 
 def save_conversation(conversation):
     """Save a conversation to the active conversations"""
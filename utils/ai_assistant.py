@@ -5,27 +5,43 @@ import time
 from datetime import datetime
 import streamlit as st
 import random
-from openai import OpenAI
+from utils.llm_backends import create_backend_from_env
+from utils.llm_telemetry import enable_llm_telemetry
+from utils.translation_memory import get_cached_translation, store_translation, delete_translation, get_placeholders, fill_placeholders
+from utils.message_templates import (
+    BOOKING_PLACEHOLDERS, get_default_template, get_property_fingerprint, is_valid_template,
+    get_stored_template, store_template, render_message
+)
 
-# Initialize OpenAI client
-def get_openai_client():
+# Initialize the shared LLM backend
+def get_llm_backend():
     """
-    Get OpenAI API client with appropriate error handling
+    Get the LLM backend with appropriate error handling
+    
+    OPENAI_API_URL selects a local OpenAI-compatible server, otherwise the
+    OpenAI API is used with OPENAI_API_KEY. The backend is shared across
+    calls, so connections, response cache and metrics are reused. Every
+    call is recorded in the LLM telemetry.
     """
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        if not st.session_state.get("openai_warning_shown"):
-            st.warning("OPENAI_API_KEY non configurata. Le funzionalità AI utilizzeranno risposte simulate.")
-            st.session_state.openai_warning_shown = True
-        return None
+    enable_llm_telemetry()
     
     try:
-        return OpenAI(api_key=api_key)
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+        # do not change this unless explicitly requested by the user
+        backend = create_backend_from_env("OPENAI", "gpt-4o")
     except Exception as e:
         st.error(f"Errore nell'inizializzazione del client OpenAI: {str(e)}")
         return None
+    
+    if not backend:
+        if not st.session_state.get("openai_warning_shown"):
+            st.warning("OPENAI_API_KEY non configurata. Le funzionalità AI utilizzeranno risposte simulate.")
+            st.session_state.openai_warning_shown = True
+        return None
+    
+    return backend
 
-def generate_response(prompt, conversation_history=None, system_message=None, json_response=False):
+def generate_response(prompt, conversation_history=None, system_message=None, json_response=False, feature="co_host"):
     """
     Generate a response using OpenAI API
     
@@ -34,13 +50,14 @@ def generate_response(prompt, conversation_history=None, system_message=None, js
         conversation_history (list, optional): List of previous messages
         system_message (str, optional): System message to set context
         json_response (bool, optional): Whether to request a JSON response
+        feature (str, optional): Feature making the call, used in telemetry
         
     Returns:
         str: Generated response text
     """
-    client = get_openai_client()
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate a response if API key is not available
         return simulate_response(prompt, json_response)
     
@@ -63,17 +80,15 @@ def generate_response(prompt, conversation_history=None, system_message=None, js
         # Set response format for JSON if requested
         response_format = {"type": "json_object"} if json_response else None
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=messages,
             response_format=response_format,
             temperature=0.7,
-            max_tokens=800
+            max_tokens=800,
+            feature=feature
         )
         
-        return response.choices[0].message.content
+        return response
     
     except Exception as e:
         st.error(f"Errore nella generazione della risposta AI: {str(e)}")
@@ -92,9 +107,9 @@ def virtual_co_host(guest_message, property_data=None, conversation_history=None
     Returns:
         str: Co-host response
     """
-    client = get_openai_client()
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate a response if API key is not available
         return simulate_virtual_co_host(guest_message, property_data, language)
     
@@ -163,16 +178,14 @@ def virtual_co_host(guest_message, property_data=None, conversation_history=None
         # Add the current message
         messages.append({"role": "user", "content": guest_message})
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=messages,
             temperature=0.7,
-            max_tokens=500
+            max_tokens=500,
+            feature="co_host"
         )
         
-        return response.choices[0].message.content
+        return response
     
     except Exception as e:
         st.error(f"Errore nella generazione della risposta del co-host virtuale: {str(e)}")
@@ -189,9 +202,9 @@ def analyze_guest_messages(message, conversation_history=None):
     Returns:
         dict: Analysis results
     """
-    client = get_openai_client()
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate analysis if API key is not available
         return {
             "intent": random.choice(["question", "request", "complaint", "compliment", "booking_inquiry"]),
@@ -226,22 +239,22 @@ def analyze_guest_messages(message, conversation_history=None):
         # Add the current message
         messages.append({"role": "user", "content": message})
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        # Identical messages (e.g. repeated FAQ) reuse the cached analysis
+        response = backend.complete(
             messages=messages,
+            use_cache=True,
             response_format={"type": "json_object"},
-            temperature=0.3
+            temperature=0.3,
+            feature="co_host"
         )
         
         # Parse the JSON response
         try:
-            analysis = json.loads(response.choices[0].message.content)
+            analysis = json.loads(response)
             return analysis
         except json.JSONDecodeError:
             st.error("Errore nella decodifica della risposta JSON")
-            return {"error": "Formato JSON non valido", "raw_response": response.choices[0].message.content}
+            return {"error": "Formato JSON non valido", "raw_response": response}
     
     except Exception as e:
         st.error(f"Errore nell'analisi del messaggio: {str(e)}")
@@ -258,9 +271,9 @@ def dynamic_pricing_recommendation(property_data, market_data=None):
     Returns:
         dict: Pricing recommendations
     """
-    client = get_openai_client()
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate recommendations if API key is not available
         base_price = float(property_data.get('base_price', 100))
         return {
@@ -352,25 +365,23 @@ def dynamic_pricing_recommendation(property_data, market_data=None):
         Rispondi in formato JSON con tutti questi elementi.
         """
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": "Sei un esperto di revenue management e dynamic pricing per strutture ricettive."},
                 {"role": "user", "content": prompt}
             ],
             response_format={"type": "json_object"},
-            temperature=0.5
+            temperature=0.5,
+            feature="pricing"
         )
         
         # Parse JSON response
         try:
-            recommendations = json.loads(response.choices[0].message.content)
+            recommendations = json.loads(response)
             return recommendations
         except json.JSONDecodeError:
             st.error("Errore nella decodifica della risposta JSON per le raccomandazioni di prezzo")
-            return {"error": "Formato JSON non valido", "raw_response": response.choices[0].message.content}
+            return {"error": "Formato JSON non valido", "raw_response": response}
     
     except Exception as e:
         st.error(f"Errore nella generazione delle raccomandazioni di prezzo: {str(e)}")
@@ -386,9 +397,9 @@ def generate_property_description(property_data):
     Returns:
         str: Generated property description
     """
-    client = get_openai_client()
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate a description if API key is not available
         property_type = property_data.get('type', 'appartamento')
         bedrooms = property_data.get('bedrooms', 1)
@@ -423,18 +434,16 @@ def generate_property_description(property_data):
         5. Essere di circa 150-200 parole
         """
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": "Sei un copywriter esperto nella creazione di descrizioni immobiliari accattivanti."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7
+            temperature=0.7,
+            feature="listing"
         )
         
-        return response.choices[0].message.content
+        return response
     
     except Exception as e:
         st.error(f"Errore nella generazione della descrizione dell'immobile: {str(e)}")
@@ -444,6 +453,10 @@ def generate_automated_messages(message_type, booking_data, guest_name=None, pro
     """
     Generate automated messages for different guest communication scenarios
     
+    The message is produced from a template compiled once per property, language
+    and message type (see compile_message_template) and filled locally with the
+    booking data, so repeated messages need no API calls.
+    
     Args:
         message_type (str): Type of message (welcome, check_in, check_out, etc.)
         booking_data (dict): Booking information
@@ -454,8 +467,6 @@ def generate_automated_messages(message_type, booking_data, guest_name=None, pro
     Returns:
         str: Generated message
     """
-    client = get_openai_client()
-    
     # If guest name is not provided, try to get it from booking data
     if not guest_name and booking_data:
         guest_name = booking_data.get('guest_name', 'Ospite')
@@ -465,44 +476,39 @@ def generate_automated_messages(message_type, booking_data, guest_name=None, pro
         # In a real app, we would fetch property data here
         property_data = {"name": "Appartamento", "address": "Via Example 123", "city": "Milano"}
     
-    if not client:
-        # Simulate automated messages if API key is not available
-        templates = {
-            "welcome": {
-                "italiano": f"Gentile {guest_name}, grazie per aver scelto il nostro alloggio! Siamo lieti di darti il benvenuto e non vediamo l'ora di ospitarti.",
-                "english": f"Dear {guest_name}, thank you for choosing our accommodation! We are pleased to welcome you and look forward to hosting you."
-            },
-            "check_in": {
-                "italiano": f"Gentile {guest_name}, oggi è il giorno del tuo check-in! Puoi arrivare dalle 15:00 in poi. Ti aspettiamo all'indirizzo indicato.",
-                "english": f"Dear {guest_name}, today is your check-in day! You can arrive from 3:00 PM onwards. We'll be waiting for you at the indicated address."
-            },
-            "check_out": {
-                "italiano": f"Gentile {guest_name}, domani è previsto il check-out entro le 10:00. Ti ringraziamo per aver scelto il nostro alloggio!",
-                "english": f"Dear {guest_name}, tomorrow is your check-out day by 10:00 AM. Thank you for choosing our accommodation!"
-            },
-            "reminder": {
-                "italiano": f"Gentile {guest_name}, questo è un promemoria per la tua prenotazione. Se hai domande, non esitare a contattarci.",
-                "english": f"Dear {guest_name}, this is a reminder about your booking. If you have any questions, feel free to contact us."
-            }
-        }
-        
-        lang = language.lower()
-        if lang not in ["italiano", "english"]:
-            lang = "italiano"  # Default to Italian
+    template = compile_message_template(message_type, property_data, language)
+    return render_message(template, booking_data, guest_name)
+
+def compile_message_template(message_type, property_data=None, language="italiano", force=False):
+    """
+    Get the message template for a property, generating it with AI if needed
+    
+    The template is regenerated only when the property data used to write it changes.
+    
+    Args:
+        message_type (str): Type of message (welcome, check_in, check_out, etc.)
+        property_data (dict, optional): Property information
+        language (str): Language to use
+        force (bool, optional): Whether to regenerate the template anyway
         
-        if message_type in templates:
-            return templates[message_type][lang]
-        else:
-            return templates["welcome"][lang]
+    Returns:
+        str: Template with booking placeholders such as {guest_name}
+    """
+    property_id = (property_data or {}).get('id')
+    property_hash = get_property_fingerprint(property_data)
+    
+    if property_id and not force:
+        stored = get_stored_template(property_id, message_type, language, property_hash)
+        if stored:
+            return stored
+    
+    backend = get_llm_backend()
+    
+    if not backend:
+        # Simulate automated messages if API key is not available
+        return get_default_template(message_type, language)
     
     try:
-        # Prepare context
-        booking_context = ""
-        if booking_data:
-            for key, value in booking_data.items():
-                if key not in ['id', 'created_at', 'updated_at', 'property_id']:
-                    booking_context += f"{key}: {value}\n"
-        
         property_context = ""
         if property_data:
             for key, value in property_data.items():
@@ -530,69 +536,121 @@ def generate_automated_messages(message_type, booking_data, guest_name=None, pro
             "thank_you": "Crea un messaggio di ringraziamento dopo il check-out."
         }
         
+        placeholders = ", ".join("{" + field + "}" for field in BOOKING_PLACEHOLDERS)
+        
         system_message = f"""
         Sei un host professionale di immobili in affitto a breve termine.
-        Genera un messaggio automatico per la comunicazione con gli ospiti.
+        Genera un modello di messaggio automatico per la comunicazione con gli ospiti.
         
         {message_type_instructions.get(message_type, "Crea un messaggio informativo per l'ospite.")}
         Il messaggio deve essere cordiale, informativo e professionale.
         
+        Il modello verrà usato per tutte le prenotazioni dell'immobile: per i dati della
+        prenotazione usa esclusivamente questi segnaposto, scritti esattamente così: {placeholders}.
+        Usa sempre {{guest_name}}. Non usare altri segnaposto o parentesi graffe.
+        
         {lang_system_message}
         """
         
         prompt = f"""
-        Genera un messaggio per il cliente con queste informazioni:
+        Genera il modello di messaggio con queste informazioni:
         
         Tipo di messaggio: {message_type}
-        Nome ospite: {guest_name}
-        
-        Dati prenotazione:
-        {booking_context}
         
         Dati immobile:
         {property_context}
         """
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7
+            temperature=0.7,
+            feature="messaging"
         )
         
-        return response.choices[0].message.content
+        template = response.strip()
+        
+        if not is_valid_template(template):
+            st.warning("Il modello generato contiene segnaposto non validi. Verrà usato il modello predefinito.")
+            return get_default_template(message_type, language)
+        
+        if property_id:
+            store_template(property_id, message_type, language, property_hash, template)
+        
+        return template
     
     except Exception as e:
         st.error(f"Errore nella generazione del messaggio automatico: {str(e)}")
         
         # Fallback to templates
-        templates = {
-            "welcome": f"Gentile {guest_name}, grazie per aver scelto il nostro alloggio!",
-            "check_in": f"Gentile {guest_name}, oggi è il giorno del tuo check-in! Puoi arrivare dalle 15:00 in poi.",
-            "check_out": f"Gentile {guest_name}, domani è previsto il check-out entro le 10:00. Grazie!",
-            "reminder": f"Gentile {guest_name}, questo è un promemoria per la tua prenotazione."
-        }
+        return get_default_template(message_type, language)
+
+def generate_bulk_messages(message_type, bookings, properties, language="italiano"):
+    """
+    Generate the same automated message for many bookings
+    
+    Templates are compiled at most once per property; once they exist the
+    whole batch is rendered locally without API calls.
+    
+    Args:
+        message_type (str): Type of message (welcome, check_in, check_out, etc.)
+        bookings (list): Bookings to generate messages for
+        properties (list): Properties, used to look up each booking's property
+        language (str): Language to use
         
-        return templates.get(message_type, f"Gentile {guest_name}, grazie per la tua prenotazione.")
+    Returns:
+        list: Dictionaries with booking_id, guest_name, guest_phone and message
+    """
+    property_dict = {p.get('id'): p for p in properties}
+    templates = {}
+    results = []
+    
+    for booking in bookings:
+        property_id = booking.get('property_id')
+        if property_id not in templates:
+            templates[property_id] = compile_message_template(message_type, property_dict.get(property_id), language)
+        
+        results.append({
+            "booking_id": booking.get('id'),
+            "guest_name": booking.get('guest_name'),
+            "guest_phone": booking.get('guest_phone'),
+            "message": render_message(templates[property_id], booking)
+        })
+    
+    return results
 
-def translate_message(message, target_language):
+def translate_message(message, target_language, use_memory=True, keep_placeholders=False):
     """
     Translate a message to the target language
     
+    Translations are looked up in the translation memory first, so the same
+    text is sent to the API only once per target language.
+    
     Args:
         message (str): Message to translate
         target_language (str): Target language
+        use_memory (bool, optional): Whether to use the translation memory
+        keep_placeholders (bool, optional): Whether to keep {placeholders} untranslated;
+            translations that alter them are neither stored nor reused
         
     Returns:
         str: Translated message
     """
-    client = get_openai_client()
+    placeholders = get_placeholders(message) if keep_placeholders else None
+    
+    if use_memory:
+        cached = get_cached_translation(message, target_language)
+        if cached is not None:
+            if placeholders is None or get_placeholders(cached) == placeholders:
+                return cached
+            # Voce con segnaposto alterati: la eliminiamo e ritraduciamo
+            delete_translation(message, target_language)
+    
+    backend = get_llm_backend()
     
-    if not client:
+    if not backend:
         # Simulate translation if API key is not available
         prefix_map = {
             "english": "[EN] ",
@@ -605,6 +663,10 @@ def translate_message(message, target_language):
         return prefix + message
     
     try:
+        placeholder_instructions = ""
+        if keep_placeholders:
+            placeholder_instructions = " Non tradurre e non modificare i segnaposto tra parentesi graffe, come {guest_name}."
+        
         prompt = f"""
         Traduci questo messaggio in {target_language}:
         
@@ -613,23 +675,54 @@ def translate_message(message, target_language):
         Fornisci solo il testo tradotto, senza note o spiegazioni.
         """
         
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
-                {"role": "system", "content": f"Sei un traduttore professionale. Traduci il messaggio in {target_language} mantenendo lo stesso tono e stile."},
+                {"role": "system", "content": f"Sei un traduttore professionale. Traduci il messaggio in {target_language} mantenendo lo stesso tono e stile.{placeholder_instructions}"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3
+            temperature=0.3,
+            feature="translation"
         )
         
-        return response.choices[0].message.content
+        translated = response
+        
+        # Le traduzioni simulate, fallite o con segnaposto alterati non vengono salvate nella memoria
+        if use_memory and translated and (placeholders is None or get_placeholders(translated) == placeholders):
+            store_translation(message, target_language, translated)
+        
+        return translated
     
     except Exception as e:
         st.error(f"Errore nella traduzione del messaggio: {str(e)}")
         return message  # Return original message if translation fails
 
+def translate_template(template, target_language, values=None):
+    """
+    Translate a message template before filling its placeholders
+    
+    The template (e.g. "Gentile {guest_name}, ...") is translated once per
+    language and cached, then filled locally for each guest.
+    
+    Args:
+        template (str): Template with placeholders like {guest_name}
+        target_language (str): Target language
+        values (dict, optional): Values for the placeholders
+        
+    Returns:
+        str: Translated message, filled with the values if provided
+    """
+    placeholders = get_placeholders(template)
+    translated = translate_message(template, target_language, keep_placeholders=bool(placeholders))
+    
+    # Se il modello ha alterato i segnaposto, traduciamo direttamente il messaggio compilato
+    if placeholders and get_placeholders(translated) != placeholders:
+        if values is None:
+            st.warning("La traduzione ha alterato i segnaposto del modello: viene mostrato il testo originale.")
+            return template
+        return translate_message(fill_placeholders(template, values), target_language)
+    
+    return fill_placeholders(translated, values) if values else translated
+
 # Helper functions for simulation mode
 def simulate_response(prompt, json_format=False):
     """Simulate an AI response for when OpenAI API is not available"""
@@ -1,21 +1,12 @@
 import os
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from sklearn.ensemble import IsolationForest
 import streamlit as st
-from openai import OpenAI
-
-# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-# do not change this unless explicitly requested by the user
-
-# Get API key from environment variable
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+from utils.ai_assistant import get_llm_backend
+from utils.data_profiler import get_data_profile, describe_profile, get_dataframe_fingerprint
+from utils.anomaly_service import load_model, train_model, score_dataframe
+from utils.clustering_engine import get_clusters
 
 def generate_ai_data_insights(df, question=None):
     """
@@ -28,7 +19,8 @@ def generate_ai_data_insights(df, question=None):
     Returns:
         str: Generated insights about the data
     """
-    if OPENAI_API_KEY is None:
+    backend = get_llm_backend()
+    if backend is None:
         return "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."
     
     try:
@@ -42,16 +34,16 @@ def generate_ai_data_insights(df, question=None):
             prompt = f"Analyze this dataset and provide valuable insights about the data. Focus on patterns, anomalies, and actionable findings. Keep the analysis concise and insightful.\n\nDataset summary:\n{data_description}"
         
         # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": "You are a data analyst expert providing insights based on data summaries. Keep your answers concise, data-focused, and actionable."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=800
+            max_tokens=800,
+            feature="insights"
         )
         
-        return response.choices[0].message.content
+        return response
     
     except Exception as e:
         return f"Error generating AI insights: {str(e)}"
@@ -66,7 +58,8 @@ def suggest_visualizations_with_ai(df):
     Returns:
         list: List of suggested visualization types and configurations
     """
-    if OPENAI_API_KEY is None:
+    backend = get_llm_backend()
+    if backend is None:
         return [{"error": "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."}]
     
     try:
@@ -98,18 +91,18 @@ Only include visualization types from this list: bar, line, scatter, pie, histog
 """
         
         # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": "You are a data visualization expert who suggests effective charts based on dataset summaries."},
                 {"role": "user", "content": prompt}
             ],
             response_format={"type": "json_object"},
-            max_tokens=800
+            max_tokens=800,
+            feature="insights"
         )
         
         # Parse the response
-        suggestions = response.choices[0].message.content
+        suggestions = response
         import json
         return json.loads(suggestions)
     
@@ -120,58 +113,24 @@ def get_data_description(df):
     """
     Create a comprehensive description of the dataframe
     
+    Built from the cached data profile, so repeated prompts on the same
+    dataset do not recompute the statistics.
+    
     Args:
         df (pandas.DataFrame): The dataframe to describe
         
     Returns:
         str: Text description of the dataframe
     """
-    # Basic info
-    description = f"Dataset shape: {df.shape[0]} rows, {df.shape[1]} columns\n\n"
-    
-    # Column info
-    description += "Columns:\n"
-    for col in df.columns:
-        col_type = df[col].dtype
-        description += f"- {col} ({col_type}): "
-        
-        # Add column statistics based on data type
-        if pd.api.types.is_numeric_dtype(df[col]):
-            description += f"min={df[col].min()}, max={df[col].max()}, mean={df[col].mean():.2f}, null_count={df[col].isna().sum()}\n"
-        elif pd.api.types.is_string_dtype(df[col]) or pd.api.types.is_categorical_dtype(df[col]):
-            unique_count = df[col].nunique()
-            description += f"unique_values={unique_count}, null_count={df[col].isna().sum()}\n"
-            
-            # Add sample values for categorical columns
-            if unique_count < 10:
-                top_values = df[col].value_counts().head(5).to_dict()
-                description += f"   Most common values: {top_values}\n"
-        else:
-            description += f"unique_values={df[col].nunique()}, null_count={df[col].isna().sum()}\n"
-    
-    # Add correlation info for numeric columns
-    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-    if len(numeric_cols) >= 2:
-        description += "\nCorrelations between numeric columns:\n"
-        corr = df[numeric_cols].corr()
-        
-        # Get top 5 correlations
-        corr_pairs = []
-        for i in range(len(numeric_cols)):
-            for j in range(i+1, len(numeric_cols)):
-                corr_pairs.append((numeric_cols[i], numeric_cols[j], corr.iloc[i, j]))
-        
-        # Sort by absolute correlation and take top 5
-        corr_pairs.sort(key=lambda x: abs(x[2]), reverse=True)
-        for col1, col2, corr_val in corr_pairs[:5]:
-            description += f"- {col1} and {col2}: {corr_val:.2f}\n"
-    
-    return description
+    return describe_profile(get_data_profile(df))
 
 def detect_anomalies(df, numeric_cols=None, contamination=0.05):
     """
     Detect anomalies in the dataset using Isolation Forest
     
+    The fitted model is cached per dataset content and column set, so
+    changing the contamination only moves the threshold (no refit).
+    
     Args:
         df (pandas.DataFrame): The dataframe to analyze
         numeric_cols (list, optional): List of numeric columns to use
@@ -186,42 +145,32 @@ def detect_anomalies(df, numeric_cols=None, contamination=0.05):
     if not numeric_cols:
         return pd.DataFrame({"error": ["No numeric columns available for anomaly detection"]})
     
-    # Create a copy of the data
-    df_copy = df.copy()
-    
     # Select only rows with no missing values in the numeric columns
-    df_clean = df_copy.dropna(subset=numeric_cols)
+    df_clean = df.dropna(subset=numeric_cols)
     
     if df_clean.shape[0] < 10:
         return pd.DataFrame({"error": ["Not enough data points for anomaly detection after removing rows with missing values"]})
     
     try:
-        # Scale the data
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(df_clean[numeric_cols])
-        
-        # Detect anomalies
-        model = IsolationForest(contamination=contamination, random_state=42)
-        df_clean['anomaly_score'] = model.fit_predict(scaled_data)
-        
-        # Convert to binary labels and scores
-        df_clean['is_anomaly'] = df_clean['anomaly_score'].apply(lambda x: 'Yes' if x == -1 else 'No')
+        values = df_clean[numeric_cols].to_numpy(dtype=float)
+        fingerprint = get_dataframe_fingerprint(df_clean[numeric_cols])
         
-        # Calculate anomaly score (negative of decision function, higher = more anomalous)
-        decision_scores = model.decision_function(scaled_data)
-        df_clean['anomaly_score'] = -decision_scores
-        
-        # Sort by anomaly score (descending)
-        df_anomalies = df_clean.sort_values('anomaly_score', ascending=False)
+        if fingerprint is None:
+            model = train_model("dataset", values, numeric_cols)
+        else:
+            name = f"dataset_{fingerprint[:16]}"
+            model = load_model(name, numeric_cols) or train_model(name, values, numeric_cols)
         
-        return df_anomalies
+        # Score and sort by anomaly score (descending)
+        df_anomalies = score_dataframe(model, df_clean, contamination)
+        return df_anomalies.sort_values('anomaly_score', ascending=False)
     
     except Exception as e:
         return pd.DataFrame({"error": [f"Error in anomaly detection: {str(e)}"]})
 
 def identify_clusters(df, numeric_cols=None, n_clusters=3):
     """
-    Identify clusters in the dataset using KMeans
+    Identify clusters in the dataset using KMeans (MiniBatchKMeans on large data)
     
     Args:
         df (pandas.DataFrame): The dataframe to analyze
@@ -237,29 +186,15 @@ def identify_clusters(df, numeric_cols=None, n_clusters=3):
     if not numeric_cols:
         return pd.DataFrame({"error": ["No numeric columns available for clustering"]}), None
     
-    # Create a copy of the data
-    df_copy = df.copy()
-    
     # Select only rows with no missing values in the numeric columns
-    df_clean = df_copy.dropna(subset=numeric_cols)
+    df_clean = df.dropna(subset=numeric_cols)
     
     if df_clean.shape[0] < n_clusters + 1:
         return pd.DataFrame({"error": [f"Not enough data points for {n_clusters} clusters after removing rows with missing values"]}), None
     
     try:
-        # Scale the data
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(df_clean[numeric_cols])
-        
-        # Apply KMeans
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        df_clean['cluster'] = kmeans.fit_predict(scaled_data)
-        
-        # Calculate cluster centers in original space
-        centers = pd.DataFrame(scaler.inverse_transform(kmeans.cluster_centers_), columns=numeric_cols)
-        centers['cluster'] = range(n_clusters)
-        
-        return df_clean, centers
+        # Fitted models are cached per (data, columns, k)
+        return get_clusters(df_clean, numeric_cols, n_clusters)
     
     except Exception as e:
         return pd.DataFrame({"error": [f"Error in clustering: {str(e)}"]}), None
@@ -268,78 +203,16 @@ def create_data_profile(df):
     """
     Create a comprehensive profile of the dataset
     
+    Statistics are computed in one pass per dtype group and cached by
+    dataframe content (see utils.data_profiler).
+    
     Args:
         df (pandas.DataFrame): The dataframe to profile
         
     Returns:
         dict: Dictionary with profiling information
     """
-    profile = {
-        'basic_info': {
-            'rows': df.shape[0],
-            'columns': df.shape[1],
-            'memory_usage': df.memory_usage(deep=True).sum() / (1024 * 1024),  # In MB
-            'duplicate_rows': df.duplicated().sum()
-        },
-        'column_info': [],
-        'correlations': [],
-        'missing_values': {}
-    }
-    
-    # Column information
-    for col in df.columns:
-        col_info = {
-            'name': col,
-            'type': str(df[col].dtype),
-            'missing': df[col].isna().sum(),
-            'missing_percent': round((df[col].isna().sum() / len(df)) * 100, 2),
-            'unique_values': df[col].nunique()
-        }
-        
-        # Add statistics based on data type
-        if pd.api.types.is_numeric_dtype(df[col]):
-            col_info.update({
-                'min': df[col].min(),
-                'max': df[col].max(),
-                'mean': df[col].mean(),
-                'median': df[col].median(),
-                'std': df[col].std()
-            })
-        elif pd.api.types.is_string_dtype(df[col]) or pd.api.types.is_categorical_dtype(df[col]):
-            # For categorical data, add most common values
-            if df[col].nunique() < 20:  # Only for columns with reasonable number of categories
-                value_counts = df[col].value_counts().head(5).to_dict()
-                col_info['most_common'] = value_counts
-        
-        profile['column_info'].append(col_info)
-    
-    # Correlations for numeric columns
-    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-    if len(numeric_cols) >= 2:
-        corr = df[numeric_cols].corr()
-        
-        # Get top correlations
-        for i in range(len(numeric_cols)):
-            for j in range(i+1, len(numeric_cols)):
-                profile['correlations'].append({
-                    'column1': numeric_cols[i],
-                    'column2': numeric_cols[j],
-                    'correlation': round(corr.iloc[i, j], 2)
-                })
-        
-        # Sort by absolute correlation
-        profile['correlations'].sort(key=lambda x: abs(x['correlation']), reverse=True)
-    
-    # Missing values summary
-    missing_cols = df.columns[df.isna().any()].tolist()
-    for col in missing_cols:
-        missing_count = df[col].isna().sum()
-        profile['missing_values'][col] = {
-            'count': missing_count,
-            'percent': round((missing_count / len(df)) * 100, 2)
-        }
-    
-    return profile
+    return get_data_profile(df)
 
 def generate_report_with_ai(df, report_type='overview'):
     """
@@ -352,13 +225,14 @@ def generate_report_with_ai(df, report_type='overview'):
     Returns:
         str: Generated report text
     """
-    if OPENAI_API_KEY is None:
+    backend = get_llm_backend()
+    if backend is None:
         return "OpenAI API key not found. Please set the OPENAI_API_KEY environment variable."
     
     try:
         # Prepare data profile
         profile = create_data_profile(df)
-        data_description = get_data_description(df)
+        data_description = describe_profile(profile)
         
         # Build the prompt based on report type
         if report_type == 'overview':
@@ -409,16 +283,16 @@ Use a concise, business-oriented tone. Focus on actionable insights rather than
 """
         
         # Call OpenAI API
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
+        response = backend.complete(
             messages=[
                 {"role": "system", "content": "You are a data science expert creating professional data reports. Your reports are clear, insightful, and actionable."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1500
+            max_tokens=1500,
+            feature="insights"
         )
         
-        return response.choices[0].message.content
+        return response
     
     except Exception as e:
         return f"Error generating AI report: {str(e)}"
@@ -0,0 +1,379 @@
+import hashlib
+import math
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+# Cartella dei modelli salvati su disco (prenotazioni e prezzi)
+MODELS_DIR = os.path.join("data", "models", "anomaly")
+
+# Modelli tenuti in memoria per i dataset caricati dall'utente
+MEMORY_CACHE_SIZE = 16
+
+# Politica di riaddestramento
+MIN_TRAINING_ROWS = 20
+RETRAIN_INTERVAL = timedelta(days=7)
+RETRAIN_GROWTH = 0.2  # Nuove righe rispetto all'addestramento (20%)
+DRIFT_THRESHOLD = 0.5  # Spostamento della media in deviazioni standard
+
+DEFAULT_CONTAMINATION = 0.05
+
+# Soglia (in deviazioni standard) per indicare quali valori rendono anomala una riga
+EXPLAIN_Z_SCORE = 2.5
+
+# Caratteristiche usate per prenotazioni e prezzi
+BOOKING_FEATURES = ["price_per_night", "nights", "guests", "total_price", "lead_time_days", "price_ratio"]
+PRICE_FEATURES = ["price_per_night", "price_ratio"]
+
+_memory_models = OrderedDict()
+_models_lock = threading.Lock()
+
+def _average_path_length(n_samples):
+    """Average path length of an unsuccessful BST search, as in IsolationForest"""
+    if n_samples <= 1:
+        return 0.0
+    if n_samples == 2:
+        return 1.0
+    return 2.0 * (math.log(n_samples - 1.0) + np.euler_gamma) - 2.0 * (n_samples - 1.0) / n_samples
+
+def compile_forest(forest):
+    """
+    Flatten the trees of a fitted IsolationForest into plain lists
+
+    Scoring a single row by walking these lists avoids the per-call overhead
+    of scikit-learn input validation, which dominates for one row.
+
+    Args:
+        forest (IsolationForest): Fitted model
+
+    Returns:
+        tuple: (trees, denominator) where each tree is (left, right, feature, threshold, leaf_length)
+    """
+    trees = []
+    for estimator, features in zip(forest.estimators_, forest.estimators_features_):
+        tree = estimator.tree_
+        left = tree.children_left.tolist()
+        right = tree.children_right.tolist()
+        threshold = tree.threshold.tolist()
+        feature = [int(features[f]) if f >= 0 else -1 for f in tree.feature.tolist()]
+
+        # Lunghezza del percorso di ogni foglia: profondità più correzione per i campioni residui
+        depth = [0] * len(left)
+        leaf_length = [0.0] * len(left)
+        for node in range(len(left)):
+            if left[node] == -1:
+                leaf_length[node] = depth[node] + _average_path_length(int(tree.n_node_samples[node]))
+            else:
+                depth[left[node]] = depth[node] + 1
+                depth[right[node]] = depth[node] + 1
+
+        trees.append((left, right, feature, threshold, leaf_length))
+
+    denominator = len(trees) * _average_path_length(forest.max_samples_)
+    return trees, denominator
+
+class AnomalyModel:
+    """
+    Fitted IsolationForest for a set of columns, with what is needed to score
+    new rows without refitting
+
+    The contamination only moves the decision threshold, so it is computed
+    from the training scores instead of refitting the forest.
+    """
+
+    def __init__(self, name, columns, forest, train_data):
+        self.name = name
+        self.columns = list(columns)
+        self.forest = forest
+        self.trees, self.denominator = compile_forest(forest)
+        self.train_scores = np.sort(forest.score_samples(train_data))
+        self.reference_mean = train_data.mean(axis=0)
+        self.reference_std = train_data.std(axis=0)
+        self.n_samples = len(train_data)
+        self.fitted_at = datetime.now()
+
+    def threshold(self, contamination=DEFAULT_CONTAMINATION):
+        """Score below which a row is an anomaly for the given contamination"""
+        return float(np.percentile(self.train_scores, 100.0 * contamination))
+
+    def score_samples(self, values):
+        """
+        Score a matrix of rows (higher is more normal, as in scikit-learn)
+
+        Args:
+            values (numpy.ndarray): Rows with the model columns, no missing values
+
+        Returns:
+            numpy.ndarray: Scores
+        """
+        return self.forest.score_samples(values)
+
+    def score_row(self, row):
+        """
+        Score a single row walking the compiled trees
+
+        Args:
+            row (list): Values of the model columns
+
+        Returns:
+            float: Score (higher is more normal)
+        """
+        total = 0.0
+        for left, right, feature, threshold, leaf_length in self.trees:
+            node = 0
+            while left[node] != -1:
+                node = left[node] if row[feature[node]] <= threshold[node] else right[node]
+            total += leaf_length[node]
+        return -(2.0 ** (-total / self.denominator))
+
+    def explain(self, row):
+        """Get the columns whose value is far from the training distribution"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_scores = np.abs((np.asarray(row, dtype=float) - self.reference_mean) / self.reference_std)
+        return [col for col, z in zip(self.columns, z_scores) if np.isfinite(z) and z > EXPLAIN_Z_SCORE]
+
+    def needs_retrain(self, values):
+        """
+        Check if the model is stale for the current data
+
+        The model is retrained when it is older than RETRAIN_INTERVAL, when the
+        data grew by more than RETRAIN_GROWTH, or when the mean of any column
+        moved by more than DRIFT_THRESHOLD standard deviations.
+
+        Args:
+            values (numpy.ndarray): Current data with the model columns
+
+        Returns:
+            bool: True if the model should be refitted
+        """
+        if datetime.now() - self.fitted_at > RETRAIN_INTERVAL:
+            return True
+        if len(values) > self.n_samples * (1 + RETRAIN_GROWTH):
+            return True
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drift = np.abs(values.mean(axis=0) - self.reference_mean) / self.reference_std
+        return bool(np.any(np.nan_to_num(drift) > DRIFT_THRESHOLD))
+
+def get_model_key(name, columns):
+    """Get the storage key of the model of a dataset and column set"""
+    columns_hash = hashlib.sha1("|".join(map(str, columns)).encode("utf-8")).hexdigest()[:12]
+    return f"{name}_{columns_hash}"
+
+def get_model_path(key):
+    return os.path.join(MODELS_DIR, f"{key}.pkl")
+
+def load_model(name, columns):
+    """
+    Get a fitted model from memory or from disk
+
+    Args:
+        name (str): Dataset name
+        columns (list): Columns of the model
+
+    Returns:
+        AnomalyModel: Fitted model, or None if never trained
+    """
+    key = get_model_key(name, columns)
+
+    with _models_lock:
+        if key in _memory_models:
+            _memory_models.move_to_end(key)
+            return _memory_models[key]
+
+    path = get_model_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    except Exception:
+        # Modello corrotto o di una versione incompatibile: verrà riaddestrato
+        return None
+
+    _remember_model(key, model)
+    return model
+
+def _remember_model(key, model):
+    with _models_lock:
+        _memory_models[key] = model
+        _memory_models.move_to_end(key)
+        while len(_memory_models) > MEMORY_CACHE_SIZE:
+            _memory_models.popitem(last=False)
+
+def train_model(name, values, columns, persist=False):
+    """
+    Fit and store the model of a dataset and column set
+
+    Args:
+        name (str): Dataset name
+        values (numpy.ndarray): Training rows with the model columns
+        columns (list): Columns of the model
+        persist (bool): Whether to save the model to disk
+
+    Returns:
+        AnomalyModel: Fitted model
+    """
+    # IsolationForest usa solo split sui singoli assi: non serve standardizzare
+    forest = IsolationForest(n_estimators=100, random_state=42, n_jobs=-1)
+    forest.fit(values)
+    model = AnomalyModel(name, columns, forest, values)
+
+    key = get_model_key(name, columns)
+    _remember_model(key, model)
+
+    if persist:
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        # Scrittura atomica per non lasciare file a metà se il processo si interrompe
+        tmp_path = get_model_path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(model, f)
+        os.replace(tmp_path, get_model_path(key))
+
+    return model
+
+def get_or_train_model(name, values, columns, persist=False):
+    """
+    Get the model of a dataset, refitting it only if missing or stale
+
+    Args:
+        name (str): Dataset name
+        values (numpy.ndarray): Current rows with the model columns
+        columns (list): Columns of the model
+        persist (bool): Whether to save the model to disk
+
+    Returns:
+        AnomalyModel: Fitted model, or None if there are too few rows
+    """
+    model = load_model(name, columns)
+    if model is not None and not model.needs_retrain(values):
+        return model
+
+    if len(values) < MIN_TRAINING_ROWS:
+        return model
+
+    return train_model(name, values, columns, persist=persist)
+
+def score_dataframe(model, df, contamination=DEFAULT_CONTAMINATION):
+    """
+    Label the rows of a dataframe with anomaly scores
+
+    Args:
+        model (AnomalyModel): Fitted model
+        df (pandas.DataFrame): Rows to score, with no missing values in the model columns
+        contamination (float): Expected proportion of anomalies
+
+    Returns:
+        pandas.DataFrame: Copy with 'anomaly_score' (higher = more anomalous) and 'is_anomaly'
+    """
+    scores = model.threshold(contamination) - model.score_samples(df[model.columns].to_numpy(dtype=float))
+    return df.assign(
+        anomaly_score=scores,
+        is_anomaly=np.where(scores > 0, 'Yes', 'No')
+    )
+
+def build_booking_features(bookings, properties=None):
+    """
+    Build the numeric features of bookings for anomaly detection
+
+    Args:
+        bookings (list): Booking dictionaries
+        properties (list, optional): Property dictionaries, for the price ratio
+
+    Returns:
+        pandas.DataFrame: One row per booking with BOOKING_FEATURES
+    """
+    df = pd.DataFrame(bookings)
+    if df.empty:
+        return pd.DataFrame(columns=BOOKING_FEATURES)
+
+    checkin = pd.to_datetime(df.get("checkin_date"), errors="coerce")
+    checkout = pd.to_datetime(df.get("checkout_date"), errors="coerce")
+    created = pd.to_datetime(df.get("created_at", pd.Series(pd.NaT, index=df.index)), errors="coerce")
+    created = created.fillna(pd.Timestamp.now())
+
+    features = pd.DataFrame(index=df.index)
+    features["price_per_night"] = pd.to_numeric(df.get("price_per_night"), errors="coerce")
+    features["nights"] = (checkout - checkin).dt.days
+    features["guests"] = pd.to_numeric(df.get("guests", 1), errors="coerce")
+    features["total_price"] = pd.to_numeric(df.get("total_price"), errors="coerce")
+    features["lead_time_days"] = (checkin - created.dt.normalize()).dt.days
+
+    base_prices = {p.get("id"): p.get("base_price") for p in (properties or [])}
+    base_price = pd.to_numeric(df.get("property_id", pd.Series(index=df.index)).map(base_prices), errors="coerce")
+    features["price_ratio"] = (features["price_per_night"] / base_price).fillna(1.0)
+
+    return features
+
+def refresh_booking_models(bookings, properties=None):
+    """
+    Make sure the booking and price models are up to date
+
+    Cheap when nothing changed: models are only refitted when stale.
+
+    Args:
+        bookings (list): Booking dictionaries
+        properties (list, optional): Property dictionaries
+
+    Returns:
+        dict: Models by name ("bookings", "prices"), None where data is insufficient
+    """
+    features = build_booking_features(
+        [b for b in bookings if b.get("status") != "cancellata"], properties
+    ).dropna()
+
+    return {
+        "bookings": get_or_train_model("bookings", features[BOOKING_FEATURES].to_numpy(dtype=float),
+                                       BOOKING_FEATURES, persist=True),
+        "prices": get_or_train_model("prices", features[PRICE_FEATURES].to_numpy(dtype=float),
+                                     PRICE_FEATURES, persist=True)
+    }
+
+def _check_row(name, columns, row, contamination):
+    model = load_model(name, columns)
+    if model is None or any(pd.isna(value) for value in row):
+        return None
+
+    score = model.threshold(contamination) - model.score_row(row)
+    return {
+        "is_anomaly": score > 0,
+        "anomaly_score": score,
+        "columns": model.explain(row) if score > 0 else []
+    }
+
+def check_booking(booking, properties=None, contamination=DEFAULT_CONTAMINATION):
+    """
+    Score a new booking against the stored booking model, without refitting
+
+    Args:
+        booking (dict): Booking being inserted
+        properties (list, optional): Property dictionaries, for the price ratio
+        contamination (float): Expected proportion of anomalies
+
+    Returns:
+        dict: is_anomaly, anomaly_score and the unusual columns, or None if no model is available
+    """
+    row = build_booking_features([booking], properties).iloc[0][BOOKING_FEATURES].tolist()
+    return _check_row("bookings", BOOKING_FEATURES, row, contamination)
+
+def check_price(property_data, price, contamination=DEFAULT_CONTAMINATION):
+    """
+    Check a new nightly price of a property against the prices paid in past bookings
+
+    Args:
+        property_data (dict): Property information, with base_price
+        price (float): New nightly price
+        contamination (float): Expected proportion of anomalies
+
+    Returns:
+        dict: is_anomaly, anomaly_score and the unusual columns, or None if no model is available
+    """
+    base_price = property_data.get("base_price") or price
+    row = [float(price), float(price) / float(base_price) if base_price else 1.0]
+    return _check_row("prices", PRICE_FEATURES, row, contamination)
@@ -0,0 +1,162 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Colonne numeriche delle prenotazioni e degli immobili convertite in float
+NUMERIC_BOOKING_COLUMNS = ["guests", "price_per_night", "cleaning_fee", "total_price"]
+NUMERIC_PROPERTY_COLUMNS = ["bedrooms", "bathrooms", "max_guests", "base_price", "current_price", "cleaning_fee"]
+
+# Colonne derivate aggiunte a ogni prenotazione
+DERIVED_COLUMNS = ["nights", "room_revenue", "adr", "revenue_per_night"]
+
+_state = {
+    # id prenotazione -> impronta del contenuto
+    "digests": {},
+    # Righe tipizzate delle prenotazioni, indicizzate per id
+    "bookings": None,
+    "properties_digest": None,
+    "facts": None
+}
+_state_lock = threading.Lock()
+
+def _digest(record):
+    """
+    Get an in-process digest of a booking dictionary
+
+    Hashing the items tuple is several times faster than serializing the
+    booking, which keeps change detection cheap on every rerun.
+    """
+    try:
+        return hash(tuple(record.items()))
+    except TypeError:
+        # Valori non hashabili (liste, dizionari): usiamo la rappresentazione testuale
+        return hash(repr(record))
+
+def build_booking_rows(bookings):
+    """
+    Build typed booking rows with the derived stay metrics
+
+    Args:
+        bookings (list): Booking dictionaries
+
+    Returns:
+        pandas.DataFrame: One row per booking, with dates as datetime, numbers as float,
+        nights, room revenue (total minus cleaning), ADR and revenue per night
+    """
+    df = pd.DataFrame(bookings)
+    if df.empty:
+        return df
+
+    for col in ("checkin_date", "checkout_date", "created_at"):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in NUMERIC_BOOKING_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    if "checkin_date" in df.columns and "checkout_date" in df.columns:
+        nights = (df["checkout_date"] - df["checkin_date"]).dt.days
+    else:
+        nights = pd.Series(np.nan, index=df.index)
+    total = df["total_price"] if "total_price" in df.columns else pd.Series(np.nan, index=df.index)
+    cleaning = df["cleaning_fee"].fillna(0) if "cleaning_fee" in df.columns else 0
+
+    # Le notti nulle o negative non hanno una tariffa media
+    valid_nights = nights.where(nights > 0)
+    df["nights"] = nights
+    df["room_revenue"] = total - cleaning
+    df["adr"] = df["room_revenue"] / valid_nights
+    df["revenue_per_night"] = total / valid_nights
+    return df
+
+def build_property_rows(properties):
+    """Build typed property rows for the join"""
+    df = pd.DataFrame(properties)
+    for col in NUMERIC_PROPERTY_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+def join_properties(booking_rows, property_rows):
+    """Join bookings to their properties, with the column names used by the Report Builder"""
+    if booking_rows.empty or property_rows.empty or "property_id" not in booking_rows.columns:
+        return booking_rows
+    return booking_rows.merge(property_rows, how='left', left_on='property_id', right_on='id', suffixes=('', '_property'))
+
+def _refresh_bookings(bookings):
+    """Rebuild only the booking rows that were added or changed since the last call"""
+    keys = [booking.get("id", f"__position_{position}") for position, booking in enumerate(bookings)]
+    digests = {key: _digest(booking) for key, booking in zip(keys, bookings)}
+
+    cached = _state["bookings"]
+    if cached is not None and digests == _state["digests"]:
+        return cached, False
+
+    changed = [key for key in keys if _state["digests"].get(key) != digests[key]]
+    if cached is None or len(changed) == len(keys) or len(digests) < len(keys):
+        # Prima costruzione, tutto cambiato o id duplicati: ricostruiamo l'intera tabella
+        rows = build_booking_rows(bookings)
+        rows.index = pd.Index(keys[:len(rows)])
+    else:
+        # Le righe invariate restano quelle già tipizzate, ricalcoliamo solo le nuove o modificate
+        changed_set = set(changed)
+        new_rows = build_booking_rows([b for key, b in zip(keys, bookings) if key in changed_set])
+        new_rows.index = pd.Index(changed)
+        keep = np.fromiter((key in digests and key not in changed_set for key in cached.index), dtype=bool, count=len(cached))
+        kept = cached[keep]
+        rows = pd.concat([kept, new_rows]).loc[keys]
+
+    _state["digests"] = digests
+    _state["bookings"] = rows
+    return rows, True
+
+def get_booking_facts(bookings, properties):
+    """
+    Get the booking facts table: bookings joined to properties with nights, ADR and revenue per night
+
+    The table is materialized once and refreshed incrementally: only bookings
+    that were added or changed are re-typed, and the join is redone only when
+    bookings or properties changed. While nothing changes the same dataframe
+    object is returned, so callers must not modify it in place.
+
+    Args:
+        bookings (list): Booking dictionaries (st.session_state.bookings)
+        properties (list): Property dictionaries (st.session_state.properties)
+
+    Returns:
+        pandas.DataFrame: One row per booking, in the order of the bookings list
+    """
+    with _state_lock:
+        rows, bookings_changed = _refresh_bookings(bookings or [])
+
+        properties_digest = hash(repr(properties or []))
+        if bookings_changed or properties_digest != _state["properties_digest"] or _state["facts"] is None:
+            facts = join_properties(rows.reset_index(drop=True), build_property_rows(properties or []))
+            _state["properties_digest"] = properties_digest
+            _state["facts"] = facts
+
+        return _state["facts"]
+
+def filter_booking_facts(facts, start_date=None, end_date=None, property_id=None):
+    """
+    Filter booking facts by stay dates and property without copying the table
+
+    Args:
+        facts (pandas.DataFrame): Booking facts table
+        start_date (datetime.date, optional): First check-in date
+        end_date (datetime.date, optional): Last check-out date
+        property_id (str, optional): Property to keep, None or "all" for every property
+
+    Returns:
+        pandas.DataFrame: Matching rows
+    """
+    mask = np.ones(len(facts), dtype=bool)
+
+    if start_date is not None and "checkin_date" in facts.columns:
+        mask &= (facts["checkin_date"] >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None and "checkout_date" in facts.columns:
+        mask &= (facts["checkout_date"] < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+    if property_id not in (None, "all") and "property_id" in facts.columns:
+        mask &= (facts["property_id"] == property_id).to_numpy()
+
+    return facts if mask.all() else facts[mask]
@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+
+# Oltre queste soglie i grafici ricevono dati aggregati o campionati invece delle righe originali
+HISTOGRAM_AGGREGATE_ROWS = 10_000
+MAX_LINE_POINTS = 2_000
+MAX_SCATTER_POINTS = 20_000
+MAX_DISTRIBUTION_POINTS = 20_000
+
+# Oltre questo numero di punti i grafici a dispersione e a linee usano WebGL
+WEBGL_THRESHOLD = 5_000
+
+# Griglia usata per stimare la densità dei punti nei grafici a dispersione
+DENSITY_GRID = 64
+
+def _numeric_positions(series):
+    """
+    Get float positions of a column for binning and geometry
+
+    Dates become nanoseconds, text becomes category codes.
+
+    Args:
+        series (pandas.Series): Column to convert
+
+    Returns:
+        numpy.ndarray: Float values, NaN where missing
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype="datetime64[ns]").astype("int64").astype(float)
+        values[series.isna().to_numpy()] = np.nan
+        return values
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        codes, _ = pd.factorize(series)
+        return np.where(codes >= 0, codes, np.nan).astype(float)
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+def _group_codes(df, color):
+    """Get integer group codes for the color column (a single group if none)"""
+    if not color or color not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    codes, _ = pd.factorize(df[color], use_na_sentinel=False)
+    return codes
+
+def bin_histogram(df, x, color=None, nbins=30):
+    """
+    Count values in equal-width bins with NumPy, per color group
+
+    Args:
+        df (pandas.DataFrame): Data to bin
+        x (str): Numeric or date column
+        color (str, optional): Column splitting the counts into groups
+        nbins (int): Number of bins
+
+    Returns:
+        tuple: (dataframe with x (bin center), count and the color column, bin width)
+    """
+    positions = _numeric_positions(df[x])
+    valid = ~np.isnan(positions)
+    positions = positions[valid]
+    if positions.size == 0:
+        return pd.DataFrame(columns=[x, "count"] + ([color] if color else [])), 1
+
+    edges = np.histogram_bin_edges(positions, bins=max(int(nbins or 30), 1))
+    centers = (edges[:-1] + edges[1:]) / 2
+    width = float(edges[1] - edges[0]) if len(edges) > 1 else 1.0
+
+    frames = []
+    if color:
+        groups = df[color].to_numpy()[valid]
+        codes, uniques = pd.factorize(groups, use_na_sentinel=False)
+        # Un solo passaggio: indice di bin e gruppo combinati in un unico bincount
+        bins = np.clip(np.searchsorted(edges, positions, side="right") - 1, 0, len(centers) - 1)
+        counts = np.bincount(codes * len(centers) + bins, minlength=len(uniques) * len(centers))
+        counts = counts.reshape(len(uniques), len(centers))
+        for i, group in enumerate(uniques):
+            frames.append(pd.DataFrame({x: centers, "count": counts[i], color: group}))
+    else:
+        counts, _ = np.histogram(positions, bins=edges)
+        frames.append(pd.DataFrame({x: centers, "count": counts}))
+
+    binned = pd.concat(frames, ignore_index=True)
+    if pd.api.types.is_datetime64_any_dtype(df[x]):
+        binned[x] = pd.to_datetime(binned[x].astype("int64"))
+        width = width / 1e6  # Plotly misura la larghezza delle barre sugli assi temporali in millisecondi
+    return binned, width
+
+def lttb_indices(x, y, threshold):
+    """
+    Select points of a series with Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last point and, for each bucket, the point forming
+    the largest triangle with the previous selection and the next bucket
+    average, so peaks and troughs survive.
+
+    Args:
+        x (numpy.ndarray): Float x positions, in plotting order
+        y (numpy.ndarray): Float y values
+        threshold (int): Number of points to keep
+
+    Returns:
+        numpy.ndarray: Indices of the selected points
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    bucket_edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        next_start, next_end = end, bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas)) if end > start else start
+        selected[i + 1] = previous
+
+    return selected
+
+def downsample_lines(df, x, y, color=None, max_points=MAX_LINE_POINTS):
+    """
+    Downsample each line of a line chart with LTTB
+
+    Args:
+        df (pandas.DataFrame): Data of the chart, in plotting order
+        x (str): X column
+        y (str): Numeric y column
+        color (str, optional): Column splitting the data into lines
+        max_points (int): Points kept per line
+
+    Returns:
+        pandas.DataFrame: Selected rows, in their original order
+    """
+    codes = _group_codes(df, color)
+    x_values = _numeric_positions(df[x])
+    y_values = _numeric_positions(df[y])
+
+    keep = []
+    for code in np.unique(codes):
+        rows = np.flatnonzero(codes == code)
+        # Le righe senza valori restano escluse: Plotly le mostrerebbe come interruzioni
+        rows = rows[~np.isnan(x_values[rows]) & ~np.isnan(y_values[rows])]
+        gx = x_values[rows]
+        if len(gx) > 1 and np.any(np.diff(gx) < 0):
+            # Asse non ordinato: la geometria usa la posizione nella serie
+            gx = np.arange(len(rows), dtype=float)
+        keep.append(rows[lttb_indices(gx, y_values[rows], max_points)])
+
+    if not keep:
+        return df
+    return df.iloc[np.sort(np.concatenate(keep))]
+
+def density_sample(df, x, y, max_points=MAX_SCATTER_POINTS, seed=42):
+    """
+    Sample scatter points keeping sparse regions and outliers intact
+
+    Points are bucketed in a grid; every cell keeps at most the same number
+    of points, chosen so that the total stays under max_points. Dense cells
+    are thinned while isolated points are always kept.
+
+    Args:
+        df (pandas.DataFrame): Data of the chart
+        x (str): X column
+        y (str): Y column
+        max_points (int): Maximum number of points
+        seed (int): Random seed, fixed so reruns show the same points
+
+    Returns:
+        pandas.DataFrame: Sampled rows, in their original order
+    """
+    if len(df) <= max_points:
+        return df
+
+    cells = np.zeros(len(df), dtype=np.int64)
+    for column, scale in ((x, 1), (y, DENSITY_GRID)):
+        positions = _numeric_positions(df[column])
+        finite = positions[~np.isnan(positions)]
+        if finite.size == 0:
+            continue
+        low, high = finite.min(), finite.max()
+        span = (high - low) or 1.0
+        index = np.clip(((positions - low) / span * DENSITY_GRID).astype(np.int64, copy=False), 0, DENSITY_GRID - 1)
+        # I valori mancanti finiscono in una cella a parte
+        index = np.where(np.isnan(positions), DENSITY_GRID - 1, index)
+        cells += index * scale
+
+    counts = np.bincount(cells)
+    counts = counts[counts > 0]
+
+    # Ricerca binaria del tetto per cella che rispetta il numero massimo di punti
+    low, high = 1, int(counts.max())
+    while low < high:
+        cap = (low + high + 1) // 2
+        if np.minimum(counts, cap).sum() <= max_points:
+            low = cap
+        else:
+            high = cap - 1
+    cap = low
+
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), cells))
+    sorted_cells = cells[order]
+    first = np.searchsorted(sorted_cells, sorted_cells, side="left")
+    rank = np.arange(len(df)) - first
+    return df.iloc[np.sort(order[rank < cap])]
+
+def sample_distribution(df, y, color=None, x=None, max_points=MAX_DISTRIBUTION_POINTS, seed=42):
+    """
+    Sample rows for box and violin plots, stratified by group, keeping each group's extremes
+
+    Args:
+        df (pandas.DataFrame): Data of the chart
+        y (str): Value column
+        color (str, optional): Color group column
+        x (str, optional): Category column
+        max_points (int): Maximum number of rows
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: Sampled rows, in their original order
+    """
+    if len(df) <= max_points:
+        return df
+
+    group_columns = [col for col in (x, color) if col and col in df.columns]
+    if group_columns:
+        groups = df.groupby(group_columns, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    else:
+        groups = np.zeros(len(df), dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    # Campionamento proporzionale: ogni gruppo conserva la stessa quota di righe
+    keep = rng.random(len(df)) < max_points / len(df)
+
+    positions = _numeric_positions(df[y])
+    valid = ~np.isnan(positions)
+    by_group = pd.Series(positions[valid], index=np.flatnonzero(valid)).groupby(groups[valid])
+    for extreme in (by_group.idxmin(), by_group.idxmax()):
+        keep[extreme.to_numpy(dtype=np.int64)] = True
+
+    return df.iloc[np.flatnonzero(keep)]
+
+def use_webgl(n_points, config):
+    """Check if a scatter or line chart should be drawn with WebGL"""
+    if config.get('webgl') is not None:
+        return bool(config['webgl'])
+    return n_points > WEBGL_THRESHOLD
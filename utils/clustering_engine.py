@@ -0,0 +1,230 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+from utils.data_profiler import get_dataframe_fingerprint
+from utils.anomaly_service import build_booking_features
+
+# Valori di k precalcolati per la curva del gomito e del silhouette
+K_RANGE = range(2, 11)
+
+# Oltre questo numero di righe usiamo MiniBatchKMeans
+LARGE_DATASET_ROWS = 20_000
+MINI_BATCH_SIZE = 2048
+
+# Campione usato per il silhouette score (costo quadratico sulle righe)
+SILHOUETTE_SAMPLE = 2000
+
+MAX_WORKERS = 4
+CACHE_SIZE = 64
+
+_cluster_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def prepare_data(df, columns):
+    """
+    Select and scale the clustering columns
+
+    Args:
+        df (pandas.DataFrame): The dataframe to cluster
+        columns (list): Numeric columns to use
+
+    Returns:
+        tuple: (rows without missing values, scaled matrix, fitted scaler, cache key prefix)
+    """
+    df_clean = df.dropna(subset=columns)
+    scaler = StandardScaler()
+    scaled = scaler.fit_transform(df_clean[columns].to_numpy(dtype=float))
+    fingerprint = get_dataframe_fingerprint(df_clean[columns])
+    return df_clean, scaled, scaler, (fingerprint, tuple(columns)) if fingerprint else None
+
+def fit_clusters(scaled, k):
+    """
+    Fit k clusters, with MiniBatchKMeans on large data
+
+    Args:
+        scaled (numpy.ndarray): Scaled rows
+        k (int): Number of clusters
+
+    Returns:
+        dict: labels, centers (scaled space), inertia and silhouette
+    """
+    if len(scaled) > LARGE_DATASET_ROWS:
+        model = MiniBatchKMeans(n_clusters=k, batch_size=MINI_BATCH_SIZE, n_init=3, random_state=42)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = model.fit_predict(scaled)
+
+    silhouette = None
+    if len(np.unique(labels)) > 1:
+        silhouette = float(silhouette_score(
+            scaled, labels, sample_size=min(len(scaled), SILHOUETTE_SAMPLE), random_state=42
+        ))
+
+    return {
+        "labels": labels,
+        "centers": model.cluster_centers_,
+        "inertia": float(model.inertia_),
+        "silhouette": silhouette
+    }
+
+def _get_or_fit(key, scaled, k):
+    if key is None:
+        return fit_clusters(scaled, k)
+
+    cache_key = key + (k,)
+    with _cache_lock:
+        if cache_key in _cluster_cache:
+            _cluster_cache.move_to_end(cache_key)
+            return _cluster_cache[cache_key]
+
+    result = fit_clusters(scaled, k)
+
+    with _cache_lock:
+        _cluster_cache[cache_key] = result
+        while len(_cluster_cache) > CACHE_SIZE:
+            _cluster_cache.popitem(last=False)
+
+    return result
+
+def get_clusters(df, columns, k):
+    """
+    Get the clusters of a dataframe, reusing the cached model for (data, columns, k)
+
+    Args:
+        df (pandas.DataFrame): The dataframe to cluster
+        columns (list): Numeric columns to use
+        k (int): Number of clusters
+
+    Returns:
+        tuple: (Dataframe with cluster labels, cluster centers in original units)
+    """
+    df_clean, scaled, scaler, key = prepare_data(df, columns)
+    result = _get_or_fit(key, scaled, k)
+
+    centers = pd.DataFrame(scaler.inverse_transform(result["centers"]), columns=columns)
+    centers['cluster'] = range(k)
+
+    return df_clean.assign(cluster=result["labels"]), centers
+
+def get_k_curve(df, columns, k_values=K_RANGE):
+    """
+    Fit every k in parallel and return inertia and silhouette curves
+
+    The fitted models stay in the cache, so switching k afterwards is instant.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to cluster
+        columns (list): Numeric columns to use
+        k_values (iterable): Numbers of clusters to evaluate
+
+    Returns:
+        pandas.DataFrame: Columns k, inertia and silhouette
+    """
+    df_clean, scaled, _, key = prepare_data(df, columns)
+    k_values = [k for k in k_values if k < len(df_clean)]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda k: _get_or_fit(key, scaled, k), k_values))
+
+    return pd.DataFrame({
+        "k": k_values,
+        "inertia": [result["inertia"] for result in results],
+        "silhouette": [result["silhouette"] for result in results]
+    })
+
+def suggest_k(curve):
+    """Get the k with the best silhouette score, or None if not available"""
+    scored = curve.dropna(subset=["silhouette"])
+    if scored.empty:
+        return None
+    return int(scored.loc[scored["silhouette"].idxmax(), "k"])
+
+def build_guest_segments(bookings, properties=None):
+    """
+    Build one row per guest from the booking store
+
+    Args:
+        bookings (list): Booking dictionaries
+        properties (list, optional): Property dictionaries
+
+    Returns:
+        pandas.DataFrame: Guest features (bookings, spend, stay length, lead time, party size, price)
+    """
+    df = pd.DataFrame(bookings)
+    if df.empty:
+        return pd.DataFrame()
+
+    features = build_booking_features(bookings, properties)
+    # Gli ospiti sono identificati dall'email, o dal nome se manca
+    email = df.get("guest_email", pd.Series("", index=df.index)).fillna("").str.strip().str.lower()
+    features["guest"] = email.where(email != "", df["guest_name"].str.strip().str.lower())
+    features["guest_name"] = df["guest_name"]
+
+    grouped = features.groupby("guest")
+    return pd.DataFrame({
+        "guest_name": grouped["guest_name"].first(),
+        "bookings": grouped.size(),
+        "total_spent": grouped["total_price"].sum(),
+        "avg_nights": grouped["nights"].mean(),
+        "avg_lead_time_days": grouped["lead_time_days"].mean(),
+        "avg_guests": grouped["guests"].mean(),
+        "avg_price_per_night": grouped["price_per_night"].mean()
+    }).reset_index(drop=True)
+
+def build_property_segments(bookings, properties):
+    """
+    Build one row per property from the booking store
+
+    Args:
+        bookings (list): Booking dictionaries
+        properties (list): Property dictionaries
+
+    Returns:
+        pandas.DataFrame: Property features (bookings, nights, revenue, ADR, stay length, cancellations)
+    """
+    df = pd.DataFrame(bookings)
+    if df.empty or not properties:
+        return pd.DataFrame()
+
+    features = build_booking_features(bookings, properties)
+    features["property_id"] = df["property_id"]
+    features["cancelled"] = (df.get("status", pd.Series("", index=df.index)) == "cancellata").astype(float)
+
+    active = features[features["cancelled"] == 0]
+    grouped = active.groupby("property_id")
+    segments = pd.DataFrame({
+        "bookings": grouped.size(),
+        "nights_booked": grouped["nights"].sum(),
+        "revenue": grouped["total_price"].sum(),
+        "avg_nights": grouped["nights"].mean(),
+        "avg_lead_time_days": grouped["lead_time_days"].mean()
+    })
+    segments["adr"] = segments["revenue"] / segments["nights_booked"].replace(0, np.nan)
+    segments["cancellation_rate"] = features.groupby("property_id")["cancelled"].mean()
+
+    names = {p.get("id"): p.get("name") for p in properties}
+    segments.insert(0, "property_name", segments.index.map(names))
+    return segments.reset_index(drop=True)
+
+# Preset di segmentazione: funzione che costruisce i dati, colonne e k predefinito
+SEGMENTATION_PRESETS = {
+    "guests": {
+        "label": "Guest Segmentation",
+        "builder": lambda bookings, properties: build_guest_segments(bookings, properties),
+        "columns": ["bookings", "total_spent", "avg_nights", "avg_lead_time_days", "avg_guests"],
+        "id_column": "guest_name",
+        "k": 4
+    },
+    "properties": {
+        "label": "Property Segmentation",
+        "builder": lambda bookings, properties: build_property_segments(bookings, properties),
+        "columns": ["nights_booked", "revenue", "adr", "avg_nights", "cancellation_rate"],
+        "id_column": "property_name",
+        "k": 3
+    }
+}
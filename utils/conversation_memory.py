@@ -0,0 +1,203 @@
+import re
+import streamlit as st
+from utils.ai_assistant import get_llm_backend
+
+# Valori predefiniti per la finestra di conversazione inviata al modello
+DEFAULT_MAX_TURNS = 6
+DEFAULT_TOKEN_BUDGET = 1500
+
+# Quota del budget riservata al riassunto dei turni più vecchi
+SUMMARY_BUDGET_SHARE = 0.3
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a text without a tokenizer
+
+    Uses the common approximation of ~4 characters per token, which is
+    accurate enough to keep requests within budget.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+def estimate_messages_tokens(messages):
+    """
+    Estimate the number of tokens of a list of chat messages
+
+    Args:
+        messages (list): Messages in OpenAI format ({"role", "content"})
+
+    Returns:
+        int: Estimated token count, including per-message overhead
+    """
+    # Ogni messaggio ha un overhead di circa 4 token per ruolo e separatori
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Truncate a text so that it fits into a token budget
+
+    Args:
+        text (str): Text to truncate
+        max_tokens (int): Maximum number of tokens
+
+    Returns:
+        str: Truncated text
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max(0, max_tokens * 4 - 3)
+    return text[:max_chars].rstrip() + "..."
+
+def simulate_summary(previous_summary, messages, max_tokens=None):
+    """
+    Build an extractive summary of older messages without calling the API
+
+    Keeps the first sentence of every folded message, so the summary is
+    deterministic and can be tested offline. When the summary exceeds the
+    budget the oldest lines are dropped, so it keeps rolling forward with
+    the newest turns.
+
+    Args:
+        previous_summary (str): Summary produced so far
+        messages (list): Chat messages to fold into the summary
+        max_tokens (int, optional): Maximum size of the updated summary
+
+    Returns:
+        str: Updated summary
+    """
+    lines = previous_summary.split("\n") if previous_summary else []
+
+    for msg in messages:
+        sender = "Ospite" if msg["sender"] == "guest" else "Co-Host"
+        text = " ".join(msg.get("text", "").split())
+        first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        if first_sentence:
+            lines.append(f"- {sender}: {first_sentence}")
+
+    if max_tokens is not None:
+        # Le righe più vecchie escono per prime; l'ultima resta anche se va troncata
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+
+    return "\n".join(lines)
+
+def summarize_messages(previous_summary, messages, max_tokens):
+    """
+    Fold a block of messages into the rolling conversation summary
+
+    Only the new messages and the previous summary are sent to the model,
+    so the cost of each update does not depend on the conversation length.
+
+    Args:
+        previous_summary (str): Summary produced so far
+        messages (list): Chat messages to fold into the summary
+        max_tokens (int): Maximum size of the updated summary
+
+    Returns:
+        str: Updated summary
+    """
+    if not messages:
+        return previous_summary
+
+    backend = get_llm_backend()
+
+    if not backend:
+        # Modalità simulazione: riassunto estrattivo locale
+        return truncate_to_tokens(simulate_summary(previous_summary, messages, max_tokens), max_tokens)
+
+    try:
+        transcript = "\n".join(
+            f"{'Ospite' if msg['sender'] == 'guest' else 'Co-Host'}: {msg['text']}"
+            for msg in messages
+        )
+
+        prompt = f"""
+        Riassunto attuale della conversazione:
+        {previous_summary or "Nessuno"}
+
+        Nuovi messaggi da integrare:
+        {transcript}
+
+        Aggiorna il riassunto includendo i nuovi messaggi. Mantieni richieste,
+        orari, preferenze e problemi segnalati dall'ospite. Rispondi solo con il riassunto.
+        """
+
+        response = backend.complete(
+            messages=[
+                {"role": "system", "content": "Sei un assistente che riassume conversazioni tra ospiti e host in modo conciso e fedele."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            feature="co_host"
+        )
+
+        return truncate_to_tokens(response.strip(), max_tokens)
+
+    except Exception as e:
+        st.error(f"Errore nell'aggiornamento del riassunto della conversazione: {str(e)}")
+        return truncate_to_tokens(simulate_summary(previous_summary, messages, max_tokens), max_tokens)
+
+def build_conversation_window(chat, max_turns=DEFAULT_MAX_TURNS, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Build the conversation history to send to the model within a token budget
+
+    The last `max_turns` messages are kept verbatim; older messages are folded
+    into a rolling summary stored in the chat itself ("summary" and
+    "summarized_count"), so each message is summarized only once.
+
+    Args:
+        chat (dict): Active chat with a "messages" list
+        max_turns (int): Number of recent messages kept verbatim
+        token_budget (int): Maximum tokens for summary and history together
+
+    Returns:
+        list: Messages in OpenAI format, summary first if present
+    """
+    messages = chat.get("messages", [])
+    summary = chat.get("summary", "")
+    summarized_count = chat.get("summarized_count", 0)
+    summary_budget = int(token_budget * SUMMARY_BUDGET_SHARE)
+
+    # Il riassunto non può coprire più messaggi di quelli presenti (es. chat resettata)
+    if summarized_count > len(messages):
+        summary, summarized_count = "", 0
+
+    # Determiniamo i messaggi recenti che rientrano nel budget
+    window_start = max(summarized_count, len(messages) - max_turns)
+    history_budget = token_budget - (summary_budget if summary or window_start > 0 else 0)
+
+    recent = messages[window_start:]
+    while recent and estimate_messages_tokens(
+        [{"content": msg["text"]} for msg in recent]
+    ) > history_budget:
+        recent = recent[1:]
+        window_start += 1
+
+    # Integriamo nel riassunto solo i messaggi usciti dalla finestra dall'ultimo aggiornamento
+    if window_start > summarized_count:
+        summary = summarize_messages(summary, messages[summarized_count:window_start], summary_budget)
+        summarized_count = window_start
+        chat["summary"] = summary
+        chat["summarized_count"] = summarized_count
+
+    history = []
+    if summary:
+        history.append({
+            "role": "system",
+            "content": f"Riassunto della conversazione precedente:\n{summary}"
+        })
+
+    for msg in recent:
+        role = "user" if msg["sender"] == "guest" else "assistant"
+        history.append({"role": role, "content": msg["text"]})
+
+    return history
@@ -0,0 +1,175 @@
+import json
+import threading
+from collections import OrderedDict
+import pandas as pd
+import plotly.io as pio
+from utils.data_processor import filter_dataframe
+from utils.data_profiler import get_dataframe_fingerprint
+from utils.visualization import create_visualization
+
+# Dataframe filtrati condivisi tra i pannelli con gli stessi filtri
+FILTERED_CACHE_SIZE = 16
+
+# Figure serializzate in JSON, una per combinazione di dati, filtri, tipo e configurazione
+FIGURE_CACHE_SIZE = 128
+
+_filtered_cache = OrderedDict()
+_figure_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Ultimo dataframe di cui abbiamo calcolato l'impronta: st.session_state.data resta lo stesso
+# oggetto tra un rerun e l'altro, quindi non serve rileggere tutti i valori ogni volta
+_last_fingerprint = {"df": None, "fingerprint": None}
+
+def get_session_fingerprint(df):
+    """
+    Get the fingerprint of a dataframe, reusing it while the same object is passed
+
+    Args:
+        df (pandas.DataFrame): The dataset shown by the dashboard
+
+    Returns:
+        str: Fingerprint, or None if the dataframe cannot be hashed
+    """
+    with _cache_lock:
+        if _last_fingerprint["df"] is df:
+            return _last_fingerprint["fingerprint"]
+
+    fingerprint = get_dataframe_fingerprint(df)
+
+    with _cache_lock:
+        _last_fingerprint["df"] = df
+        _last_fingerprint["fingerprint"] = fingerprint
+    return fingerprint
+
+def _tag_types(value):
+    """Tag containers and scalars with their type, so that e.g. a range (1, 5) and a multi-select [1, 5] differ"""
+    if isinstance(value, dict):
+        items = [[_tag_types(k), _tag_types(v)] for k, v in value.items()]
+        return ["dict", sorted(items, key=lambda item: json.dumps(item))]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_tag_types(item) for item in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort(key=lambda item: json.dumps(item))
+        return [type(value).__name__, items]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return [type(value).__name__, value]
+    return [type(value).__name__, str(value)]
+
+def _freeze(value):
+    """Get a stable string for filters and configurations, independent of key order"""
+    return json.dumps(_tag_types(value))
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+def _cache_put(cache, key, value, size):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+def get_filtered_frame(df, filters, fingerprint=None):
+    """
+    Get the dataframe filtered by a panel, shared by every panel with the same filters
+
+    Args:
+        df (pandas.DataFrame): The dataset
+        filters (dict): Panel filters in the filter_dataframe format
+        fingerprint (str, optional): Fingerprint of df, computed if not given
+
+    Returns:
+        pandas.DataFrame: Filtered dataframe (df itself when there are no filters)
+    """
+    if not filters:
+        return df
+
+    fingerprint = fingerprint or get_session_fingerprint(df)
+    if fingerprint is None:
+        return filter_dataframe(df, filters)
+
+    key = (fingerprint, _freeze(filters))
+    filtered_df = _cache_get(_filtered_cache, key)
+    if filtered_df is None:
+        filtered_df = filter_dataframe(df, filters)
+        _cache_put(_filtered_cache, key, filtered_df, FILTERED_CACHE_SIZE)
+    return filtered_df
+
+def build_panel_figure(filtered_df, viz_type, config):
+    """
+    Build the figure of a panel, counting values when a bar or pie chart has no value column
+
+    Args:
+        filtered_df (pandas.DataFrame): Data after the panel filters
+        viz_type (str): Type of visualization
+        config (dict): Panel configuration
+
+    Returns:
+        plotly.graph_objects.Figure: The panel figure
+    """
+    config = config.copy()
+
+    if viz_type == "bar" and config.get("y") is None:
+        # Bar chart with counts
+        value_counts = filtered_df[config["x"]].value_counts()
+        # Le colonne category contano anche le categorie assenti dopo i filtri
+        value_counts = value_counts[value_counts > 0]
+        temp_df = pd.DataFrame({
+            config["x"]: value_counts.index,
+            "count": value_counts.values
+        })
+        config["y"] = "count"
+        return create_visualization(temp_df, viz_type, config)
+    if viz_type == "pie" and config.get("values") is None:
+        # Pie chart with counts
+        value_counts = filtered_df[config["names"]].value_counts()
+        value_counts = value_counts[value_counts > 0]
+        temp_df = pd.DataFrame({
+            config["names"]: value_counts.index,
+            "count": value_counts.values
+        })
+        config["values"] = "count"
+        return create_visualization(temp_df, viz_type, config)
+
+    return create_visualization(filtered_df, viz_type, config)
+
+def get_panel_figure(df, panel, fingerprint=None):
+    """
+    Get the figure of a dashboard panel, computed once per (data, filters, type, config)
+
+    The figure is serialized to JSON the first time and rebuilt from the
+    cached JSON afterwards, so reruns skip filtering, counting and figure
+    construction for panels that did not change.
+
+    Args:
+        df (pandas.DataFrame): The dataset
+        panel (dict): Dashboard panel with 'filters', 'type', 'config' and 'height'
+        fingerprint (str, optional): Fingerprint of df, computed if not given
+
+    Returns:
+        plotly.graph_objects.Figure: The panel figure
+    """
+    fingerprint = fingerprint or get_session_fingerprint(df)
+    key = None
+    if fingerprint is not None:
+        key = (fingerprint, _freeze(panel["filters"]), panel["type"], _freeze(panel["config"]))
+        figure_json = _cache_get(_figure_cache, key)
+        if figure_json is not None:
+            fig = pio.from_json(figure_json)
+            fig.update_layout(height=panel["height"])
+            return fig
+
+    filtered_df = get_filtered_frame(df, panel["filters"], fingerprint)
+    fig = build_panel_figure(filtered_df, panel["type"], panel["config"])
+
+    if key is not None:
+        _cache_put(_figure_cache, key, fig.to_json(), FIGURE_CACHE_SIZE)
+
+    # L'altezza non fa parte della chiave: cambiarla non ricalcola la figura
+    fig.update_layout(height=panel["height"])
+    return fig
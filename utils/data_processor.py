@@ -1,7 +1,9 @@
 import pandas as pd
 import os
 import json
-import io
+from utils.query_plan import optimize_plan, execute_plan
+from utils.ingestion import load_dataset
+from utils.table_export import write_excel
 
 def get_file_extension(filename):
     """
@@ -19,6 +21,10 @@ def load_data(file_obj, file_extension):
     """
     Load data from different file formats
     
+    Dtypes are inferred from a sample and compacted, and the parsed data is
+    cached by content hash (see utils.ingestion), so loading the same file
+    again skips parsing.
+    
     Args:
         file_obj: File object from st.file_uploader
         file_extension (str): File extension to determine the loading method
@@ -27,14 +33,7 @@ def load_data(file_obj, file_extension):
         pandas.DataFrame: The loaded data
     """
     try:
-        if file_extension in ['csv']:
-            return pd.read_csv(file_obj)
-        elif file_extension in ['xlsx', 'xls']:
-            return pd.read_excel(file_obj)
-        elif file_extension in ['json']:
-            return pd.read_json(file_obj)
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
+        return load_dataset(file_obj, file_extension)
     except Exception as e:
         raise Exception(f"Error loading file: {str(e)}")
 
@@ -82,6 +81,9 @@ def filter_dataframe(df, filters):
     """
     Apply a set of filters to a dataframe
     
+    All filters are combined into a single boolean mask, so the data is
+    indexed once and never copied defensively.
+    
     Args:
         df (pandas.DataFrame): The dataframe to filter
         filters (dict): Dictionary of filters to apply
@@ -89,27 +91,17 @@ def filter_dataframe(df, filters):
     Returns:
         pandas.DataFrame: Filtered dataframe
     """
-    filtered_df = df.copy()
-    
-    for col, filter_value in filters.items():
-        if col in filtered_df.columns:
-            if isinstance(filter_value, tuple) and len(filter_value) == 2:
-                # Range filter for numeric columns
-                min_val, max_val = filter_value
-                filtered_df = filtered_df[(filtered_df[col] >= min_val) & (filtered_df[col] <= max_val)]
-            elif isinstance(filter_value, list):
-                # Multi-select filter for categorical columns
-                filtered_df = filtered_df[filtered_df[col].isin(filter_value)]
-            else:
-                # Simple equality filter
-                filtered_df = filtered_df[filtered_df[col] == filter_value]
-    
-    return filtered_df
+    return transform_dataframe(df, [{'type': 'filter', 'filters': filters}])
 
 def transform_dataframe(df, transformations):
     """
     Apply a series of transformations to a dataframe
     
+    The transformations are optimized as a query plan before running:
+    filters are pushed before group-bys and sorts and fused into one mask,
+    unused columns are dropped first and the result is materialized once
+    (see utils.query_plan).
+    
     Args:
         df (pandas.DataFrame): The dataframe to transform
         transformations (list): List of transformation operations
@@ -117,43 +109,7 @@ def transform_dataframe(df, transformations):
     Returns:
         pandas.DataFrame: Transformed dataframe
     """
-    transformed_df = df.copy()
-    
-    for transform in transformations:
-        transform_type = transform.get('type')
-        
-        if transform_type == 'filter':
-            transformed_df = filter_dataframe(transformed_df, transform.get('filters', {}))
-        
-        elif transform_type == 'group_by':
-            groupby_cols = transform.get('columns', [])
-            agg_functions = transform.get('aggregations', {})
-            if groupby_cols and agg_functions:
-                transformed_df = transformed_df.groupby(groupby_cols).agg(agg_functions).reset_index()
-        
-        elif transform_type == 'sort':
-            sort_col = transform.get('column')
-            ascending = transform.get('ascending', True)
-            if sort_col:
-                transformed_df = transformed_df.sort_values(by=sort_col, ascending=ascending)
-        
-        elif transform_type == 'select_columns':
-            columns = transform.get('columns', [])
-            if columns:
-                transformed_df = transformed_df[columns]
-        
-        elif transform_type == 'rename_columns':
-            rename_dict = transform.get('rename_map', {})
-            if rename_dict:
-                transformed_df = transformed_df.rename(columns=rename_dict)
-        
-        elif transform_type == 'fillna':
-            col = transform.get('column')
-            value = transform.get('value')
-            if col and value is not None:
-                transformed_df[col] = transformed_df[col].fillna(value)
-    
-    return transformed_df
+    return execute_plan(df, optimize_plan(transformations, df.columns))
 
 def convert_df_to_csv(df):
     """
@@ -177,10 +133,7 @@ def convert_df_to_excel(df):
     Returns:
         bytes: Excel file as bytes
     """
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-    return output.getvalue()
+    return write_excel([{"name": "Sheet1", "data": df}]).getvalue()
 
 def get_data_summary(df):
     """
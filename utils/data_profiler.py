@@ -0,0 +1,225 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Numero massimo di profili conservati in memoria (uno per dataset)
+PROFILE_CACHE_SIZE = 8
+
+# Soglie di cardinalità oltre le quali non calcoliamo i valori più frequenti
+MAX_CATEGORIES_PROFILE = 20
+MAX_CATEGORIES_DESCRIPTION = 10
+
+_profile_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_dataframe_fingerprint(df):
+    """
+    Get a fingerprint of the content of a dataframe
+
+    Hashes values, index, column names and dtypes in a single vectorized pass,
+    so that equal dataframes share the same cached profile.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to fingerprint
+
+    Returns:
+        str: SHA-1 hex digest, or None if the dataframe contains unhashable values
+    """
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    except TypeError:
+        # Celle con liste o dizionari non sono hashabili: niente cache
+        return None
+
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    return digest.hexdigest()
+
+def is_categorical_column(series):
+    """Check if a column should be profiled as categorical (strings or categories)"""
+    return isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series)
+
+def compute_numeric_stats(df, numeric_cols):
+    """
+    Compute min, max, mean, median and std of all numeric columns at once
+
+    Args:
+        df (pandas.DataFrame): The dataframe to profile
+        numeric_cols (list): Numeric columns (booleans included)
+
+    Returns:
+        pandas.DataFrame: One row per statistic, one column per numeric column
+    """
+    if not numeric_cols:
+        return pd.DataFrame()
+
+    numeric = df[numeric_cols]
+    bool_cols = [col for col in numeric_cols if pd.api.types.is_bool_dtype(numeric[col])]
+    if bool_cols:
+        numeric = numeric.astype({col: "float64" for col in bool_cols})
+
+    # Le riduzioni su DataFrame lavorano per blocchi di dtype, non colonna per colonna
+    return pd.DataFrame({
+        "min": numeric.min(),
+        "max": numeric.max(),
+        "mean": numeric.mean(),
+        "median": numeric.median(),
+        "std": numeric.std()
+    }).T
+
+def compute_correlations(df):
+    """
+    Compute the pairwise correlations of the numeric columns
+
+    Args:
+        df (pandas.DataFrame): The dataframe to profile
+
+    Returns:
+        list: Pairs sorted by absolute correlation, strongest first
+    """
+    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+    if len(numeric_cols) < 2:
+        return []
+
+    corr = df[numeric_cols].corr().to_numpy()
+    rows, cols = np.triu_indices(len(numeric_cols), k=1)
+
+    correlations = [
+        {
+            'column1': numeric_cols[i],
+            'column2': numeric_cols[j],
+            'correlation': round(corr[i, j], 2)
+        }
+        for i, j in zip(rows, cols)
+    ]
+    correlations.sort(key=lambda x: abs(x['correlation']), reverse=True)
+    return correlations
+
+def build_data_profile(df):
+    """
+    Build the profile of a dataframe without caching
+
+    Missing values and distinct counts are computed for all columns at once,
+    numeric statistics once for the whole numeric group, and value counts only
+    for low-cardinality categorical columns.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to profile
+
+    Returns:
+        dict: Dictionary with profiling information
+    """
+    rows = len(df)
+    missing = df.isna().sum()
+    unique = df.nunique()
+
+    numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    numeric_stats = compute_numeric_stats(df, numeric_cols)
+
+    profile = {
+        'basic_info': {
+            'rows': rows,
+            'columns': df.shape[1],
+            'memory_usage': df.memory_usage(deep=True).sum() / (1024 * 1024),  # In MB
+            'duplicate_rows': df.duplicated().sum()
+        },
+        'column_info': [],
+        'correlations': compute_correlations(df),
+        'missing_values': {},
+        'categorical_columns': []
+    }
+
+    for col in df.columns:
+        col_info = {
+            'name': col,
+            'type': str(df[col].dtype),
+            'missing': missing[col],
+            'missing_percent': round((missing[col] / rows) * 100, 2) if rows else 0.0,
+            'unique_values': unique[col]
+        }
+
+        if col in numeric_stats:
+            col_info.update(numeric_stats[col].to_dict())
+        elif is_categorical_column(df[col]):
+            profile['categorical_columns'].append(col)
+            # Solo per colonne con un numero ragionevole di categorie
+            if unique[col] < MAX_CATEGORIES_PROFILE:
+                value_counts = df[col].value_counts()
+                col_info['most_common'] = value_counts[value_counts > 0].head(5).to_dict()
+
+        profile['column_info'].append(col_info)
+
+        if missing[col] > 0:
+            profile['missing_values'][col] = {
+                'count': missing[col],
+                'percent': col_info['missing_percent']
+            }
+
+    return profile
+
+def get_data_profile(df):
+    """
+    Get the profile of a dataframe, reusing the cached one if the content is unchanged
+
+    Args:
+        df (pandas.DataFrame): The dataframe to profile
+
+    Returns:
+        dict: Dictionary with profiling information (shared, do not modify)
+    """
+    fingerprint = get_dataframe_fingerprint(df)
+    if fingerprint is None:
+        return build_data_profile(df)
+
+    with _cache_lock:
+        if fingerprint in _profile_cache:
+            _profile_cache.move_to_end(fingerprint)
+            return _profile_cache[fingerprint]
+
+    profile = build_data_profile(df)
+
+    with _cache_lock:
+        _profile_cache[fingerprint] = profile
+        while len(_profile_cache) > PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+
+    return profile
+
+def describe_profile(profile):
+    """
+    Render a data profile as the text description used in AI prompts
+
+    Args:
+        profile (dict): Profile returned by get_data_profile
+
+    Returns:
+        str: Text description of the dataframe
+    """
+    basic_info = profile['basic_info']
+    description = f"Dataset shape: {basic_info['rows']} rows, {basic_info['columns']} columns\n\n"
+
+    categorical_columns = set(profile['categorical_columns'])
+
+    description += "Columns:\n"
+    for col_info in profile['column_info']:
+        description += f"- {col_info['name']} ({col_info['type']}): "
+
+        if 'mean' in col_info:
+            description += f"min={col_info['min']}, max={col_info['max']}, mean={col_info['mean']:.2f}, null_count={col_info['missing']}\n"
+        elif col_info['name'] in categorical_columns:
+            description += f"unique_values={col_info['unique_values']}, null_count={col_info['missing']}\n"
+
+            # Add sample values for categorical columns
+            if col_info['unique_values'] < MAX_CATEGORIES_DESCRIPTION and 'most_common' in col_info:
+                description += f"   Most common values: {col_info['most_common']}\n"
+        else:
+            description += f"unique_values={col_info['unique_values']}, null_count={col_info['missing']}\n"
+
+    if profile['correlations']:
+        description += "\nCorrelations between numeric columns:\n"
+        for pair in profile['correlations'][:5]:
+            description += f"- {pair['column1']} and {pair['column2']}: {pair['correlation']:.2f}\n"
+
+    return description
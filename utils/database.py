@@ -1,6 +1,7 @@
 import os
 import json
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Date
+from sqlalchemy import event, inspect, text, create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Date, update, select, PrimaryKeyConstraint
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, timedelta
@@ -26,6 +27,7 @@ class Property(Base):
     type = Column(String(50))
     city = Column(String(100))
     address = Column(String(255))
+    zip = Column(String(10))  # CAP
     bedrooms = Column(Integer, default=1)
     bathrooms = Column(Float, default=1.0)
     max_guests = Column(Integer, default=2)
@@ -49,6 +51,7 @@ class Property(Base):
             "type": self.type,
             "city": self.city,
             "address": self.address,
+            "zip": self.zip,
             "bedrooms": self.bedrooms,
             "bathrooms": self.bathrooms,
             "max_guests": self.max_guests,
@@ -71,9 +74,17 @@ class Booking(Base):
     guest_name = Column(String(100), nullable=False)
     guest_email = Column(String(100))
     guest_phone = Column(String(50))
+    # Dati fiscali dell'ospite, obbligatori nella fattura elettronica
+    guest_fiscal_code = Column(String(16))
+    guest_vat_number = Column(String(30))
+    guest_address = Column(String(255))
+    guest_zip = Column(String(10))
+    guest_city = Column(String(100))
+    guest_country = Column(String(50), default="IT")
     checkin_date = Column(Date, nullable=False)
     checkout_date = Column(Date, nullable=False)
     guests = Column(Integer, default=1)
+    guest_ages = Column(Text)  # Età dei minori, JSON (gli altri ospiti sono adulti)
     price_per_night = Column(Float, nullable=False)
     cleaning_fee = Column(Float, default=0)
     total_price = Column(Float, nullable=False)
@@ -98,9 +109,16 @@ class Booking(Base):
             "guest_name": self.guest_name,
             "guest_email": self.guest_email,
             "guest_phone": self.guest_phone,
+            "guest_fiscal_code": self.guest_fiscal_code,
+            "guest_vat_number": self.guest_vat_number,
+            "guest_address": self.guest_address,
+            "guest_zip": self.guest_zip,
+            "guest_city": self.guest_city,
+            "guest_country": self.guest_country,
             "checkin_date": self.checkin_date.isoformat() if self.checkin_date else None,
             "checkout_date": self.checkout_date.isoformat() if self.checkout_date else None,
             "guests": self.guests,
+            "guest_ages": json.loads(self.guest_ages) if self.guest_ages else [],
             "price_per_night": self.price_per_night,
             "cleaning_fee": self.cleaning_fee,
             "total_price": self.total_price,
@@ -130,8 +148,9 @@ class Invoice(Base):
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
     
-    # Relazione
+    # Relazioni
     booking = relationship("Booking", back_populates="invoices")
+    tourist_tax_charge = relationship("TouristTaxCharge", uselist=False, cascade="all, delete-orphan")
     
     def to_dict(self):
         return {
@@ -148,6 +167,72 @@ class Invoice(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
 
+class TouristTaxCharge(Base):
+    __tablename__ = 'tourist_tax_charges'
+    
+    # Imposta di soggiorno collegata alla fattura (non soggetta a IVA, riversata al comune)
+    invoice_id = Column(String(36), ForeignKey('invoices.id'), primary_key=True)
+    booking_id = Column(String(36), nullable=False, index=True)
+    city = Column(String(100))
+    taxed_nights = Column(Integer, default=0)
+    guest_nights = Column(Float, default=0)  # Notti tassate per ospite, pesate per età
+    amount = Column(Float, default=0)
+    computed_at = Column(DateTime, default=datetime.now)
+    
+    def to_dict(self):
+        return {
+            "invoice_id": self.invoice_id,
+            "booking_id": self.booking_id,
+            "city": self.city,
+            "taxed_nights": self.taxed_nights,
+            "guest_nights": self.guest_nights,
+            "amount": self.amount,
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None
+        }
+
+class InvoiceSequence(Base):
+    __tablename__ = 'invoice_sequences'
+    
+    year = Column(Integer, primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)  # Ultimo numero assegnato nell'anno
+
+class FiscalLedgerEntry(Base):
+    __tablename__ = 'fiscal_ledger_entries'
+    
+    # Contributo di ogni prenotazione al registro fiscale, per poterlo sottrarre quando cambia
+    booking_id = Column(String(36), primary_key=True)
+    day = Column(Date, nullable=False)  # Giorno di check-in
+    property_id = Column(String(36), nullable=False)
+    invoiced = Column(Boolean, default=False)  # Importi della fattura o stimati
+    gross = Column(Float, default=0)
+    taxable = Column(Float, default=0)
+    vat = Column(Float, default=0)
+    cleaning_fees = Column(Float, default=0)
+    commissions = Column(Float, default=0)
+
+class FiscalLedgerDay(Base):
+    __tablename__ = 'fiscal_ledger'
+    
+    # Totali giornalieri per immobile, aggiornati a ogni modifica di prenotazioni e fatture
+    day = Column(Date, nullable=False)
+    property_id = Column(String(36), nullable=False)
+    bookings = Column(Integer, default=0)
+    gross = Column(Float, default=0)
+    taxable = Column(Float, default=0)
+    vat = Column(Float, default=0)
+    cleaning_fees = Column(Float, default=0)
+    commissions = Column(Float, default=0)
+    
+    __table_args__ = (PrimaryKeyConstraint('day', 'property_id'),)
+
+class AppState(Base):
+    __tablename__ = 'app_state'
+    
+    # Indicatori persistenti dello stato dei dati derivati (es. registro fiscale già costruito)
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255))
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class CleaningService(Base):
     __tablename__ = 'cleaning_services'
     
@@ -196,12 +281,147 @@ class CleaningTask(Base):
             "booking_id": self.booking_id
         }
 
+class TranslationMemory(Base):
+    __tablename__ = 'translation_memory'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_hash = Column(String(64), nullable=False, index=True)  # SHA-256 del testo normalizzato
+    target_language = Column(String(30), nullable=False, index=True)
+    source_text = Column(Text, nullable=False)
+    translated_text = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    last_used_at = Column(DateTime, default=datetime.now, index=True)  # Usato per l'eviction LRU
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "source_hash": self.source_hash,
+            "target_language": self.target_language,
+            "source_text": self.source_text,
+            "translated_text": self.translated_text,
+            "hit_count": self.hit_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "last_used_at": self.last_used_at.isoformat() if self.last_used_at else None
+        }
+
+class MessageTemplate(Base):
+    __tablename__ = 'message_templates'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    property_id = Column(String(36), nullable=False, index=True)
+    message_type = Column(String(30), nullable=False)
+    language = Column(String(30), nullable=False)
+    property_hash = Column(String(64), nullable=False)  # Impronta dei dati dell'immobile usati per il template
+    template_text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "property_id": self.property_id,
+            "message_type": self.message_type,
+            "language": self.language,
+            "property_hash": self.property_hash,
+            "template_text": self.template_text,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class LLMCallSample(Base):
+    __tablename__ = 'llm_call_samples'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
+    feature = Column(String(30), nullable=False, index=True)  # co_host, pricing, insights, translation, ...
+    backend = Column(String(30))
+    model = Column(String(100))
+    latency_ms = Column(Float, default=0.0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)  # Costo stimato in USD
+    cache_hit = Column(Boolean, default=False)
+    error = Column(Text)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
+            "feature": self.feature,
+            "backend": self.backend,
+            "model": self.model,
+            "latency_ms": self.latency_ms,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.cost,
+            "cache_hit": self.cache_hit,
+            "error": self.error
+        }
+
+class SavedReport(Base):
+    __tablename__ = 'saved_reports'
+    
+    filename = Column(String(255), primary_key=True)  # File JSON in data/reports con il contenuto del report
+    title = Column(String(255), index=True)
+    author = Column(String(100), index=True)
+    report_type = Column(String(20), index=True)  # Custom, AI
+    report_date = Column(String(20))  # Data indicata nel report (gg/mm/aaaa)
+    sections = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    
+    def to_dict(self):
+        return {
+            "filename": self.filename,
+            "title": self.title,
+            "author": self.author,
+            "type": self.report_type,
+            "date": self.report_date,
+            "sections": self.sections,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+def _add_missing_columns():
+    """Aggiunge alle tabelle dei database esistenti le colonne introdotte dopo la loro creazione"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
 # Creazione delle tabelle nel database
 Base.metadata.create_all(engine)
+_add_missing_columns()
 
 # Creazione della sessione
 Session = sessionmaker(bind=engine)
 
+@event.listens_for(Session, "after_flush")
+def _update_fiscal_ledger(session, flush_context):
+    """Aggiorna registro fiscale e imposta di soggiorno per le prenotazioni modificate nel flush, nella stessa transazione"""
+    booking_ids = set()
+    changed_bookings = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Booking):
+            booking_ids.add(obj.id)
+            changed_bookings.add(obj.id)
+        elif isinstance(obj, Invoice):
+            booking_ids.add(obj.booking_id)
+    booking_ids.discard(None)
+    changed_bookings.discard(None)
+    
+    if booking_ids:
+        from utils.fiscal_ledger import refresh_fiscal_ledger
+        refresh_fiscal_ledger(session.connection(), booking_ids)
+    
+    if changed_bookings:
+        # Date, ospiti o stato cambiati: l'imposta già collegata alle fatture va ricalcolata
+        from utils.tourist_tax import refresh_tourist_tax_charges
+        refresh_tourist_tax_charges(session.connection(), changed_bookings)
+
 # Funzioni di utilità per accedere al database
 def get_db_session():
     """Ottiene una sessione di database"""
@@ -251,6 +471,10 @@ def init_db():
                     bookings_data = json.load(f)
                     
                     for booking_data in bookings_data:
+                        # Convertiamo le età degli ospiti in JSON string
+                        if isinstance(booking_data.get('guest_ages'), list):
+                            booking_data['guest_ages'] = json.dumps(booking_data['guest_ages'])
+                        
                         # Gestiamo le date
                         for date_field in ['checkin_date', 'checkout_date']:
                             if date_field in booking_data and booking_data[date_field]:
@@ -384,6 +608,10 @@ def add_booking(booking_data):
     """Aggiunge una nuova prenotazione al database"""
     session = get_db_session()
     
+    # Gestiamo le età degli ospiti
+    if isinstance(booking_data.get('guest_ages'), list):
+        booking_data['guest_ages'] = json.dumps(booking_data['guest_ages'])
+    
     # Gestiamo le date
     for date_field in ['checkin_date', 'checkout_date']:
         if date_field in booking_data and booking_data[date_field]:
@@ -411,6 +639,10 @@ def update_booking(booking_id, booking_data):
         session.close()
         return None
     
+    # Gestiamo le età degli ospiti
+    if isinstance(booking_data.get('guest_ages'), list):
+        booking_data['guest_ages'] = json.dumps(booking_data['guest_ages'])
+    
     # Gestiamo le date
     for date_field in ['checkin_date', 'checkout_date']:
         if date_field in booking_data and booking_data[date_field]:
@@ -448,6 +680,78 @@ def delete_booking(booking_id):
     session.close()
     return True
 
+def format_invoice_number(year, number):
+    """Formatta un numero di fattura, es. INV-2025-0001"""
+    return f"INV-{year}-{number:04d}"
+
+def _last_invoice_number(session, year):
+    """Trova l'ultimo numero già usato nell'anno dalle fatture esistenti (solo alla creazione della sequenza)"""
+    prefix = f"INV-{year}-"
+    numbers = session.query(Invoice.invoice_number).filter(Invoice.invoice_number.like(f"{prefix}%"))
+    last = 0
+    for (invoice_number,) in numbers:
+        suffix = invoice_number[len(prefix):]
+        if suffix.isdigit():
+            last = max(last, int(suffix))
+    return last
+
+def reserve_invoice_numbers(session, year=None, count=1):
+    """
+    Riserva un blocco di numeri di fattura consecutivi per l'anno
+    
+    L'incremento della sequenza è un solo UPDATE eseguito nella transazione
+    della sessione: il database blocca gli altri scrittori fino al commit,
+    quindi sessioni concorrenti non ottengono mai lo stesso numero, e se la
+    transazione viene annullata i numeri tornano disponibili.
+    
+    Args:
+        session: Sessione del database; la transazione va confermata dal chiamante
+        year (int, optional): Anno della numerazione (default: anno corrente)
+        count (int): Quantità di numeri da riservare
+        
+    Returns:
+        list: Numeri di fattura formattati, in ordine
+    """
+    year = year or datetime.now().year
+    if count <= 0:
+        return []
+    
+    increment = update(InvoiceSequence).where(InvoiceSequence.year == year) \
+        .values(last_number=InvoiceSequence.last_number + count)
+    
+    if session.execute(increment).rowcount == 0:
+        # Primo numero dell'anno: la sequenza parte dall'ultima fattura già emessa
+        session.execute(
+            sqlite_insert(InvoiceSequence)
+            .values(year=year, last_number=_last_invoice_number(session, year))
+            .on_conflict_do_nothing(index_elements=['year'])
+        )
+        session.execute(increment)
+    
+    last_number = session.execute(select(InvoiceSequence.last_number).where(InvoiceSequence.year == year)).scalar_one()
+    return [format_invoice_number(year, number) for number in range(last_number - count + 1, last_number + 1)]
+
+def _build_invoice(booking, invoice_number):
+    """Costruisce la fattura di una prenotazione, con IVA standard inclusa nel totale"""
+    # Calcoliamo l'importo IVA
+    tax_percentage = 22.0  # IVA standard italiana
+    amount_without_tax = booking.total_price / (1 + tax_percentage/100)
+    tax_amount = booking.total_price - amount_without_tax
+    
+    return Invoice(
+        id=str(uuid.uuid4()),
+        booking_id=booking.id,
+        invoice_number=invoice_number,
+        date=datetime.now().date(),
+        amount=booking.total_price,
+        tax_amount=tax_amount,
+        tax_percentage=tax_percentage,
+        status="Emessa" if booking.payment_status == "Pagato" else "In attesa",
+        payment_date=datetime.now().date() if booking.payment_status == "Pagato" else None,
+        notes=f"Fattura per prenotazione {booking.guest_name} dal {booking.checkin_date} al {booking.checkout_date}",
+        created_at=datetime.now()
+    )
+
 def create_invoice_for_booking(booking_id):
     """Crea una fattura per una prenotazione"""
     session = get_db_session()
@@ -464,34 +768,71 @@ def create_invoice_for_booking(booking_id):
         session.close()
         return result
     
-    # Otteniamo il prossimo numero di fattura
-    invoice_count = session.query(Invoice).count()
-    invoice_number = f"INV-{datetime.now().year}-{invoice_count + 1:04d}"
-    
-    # Calcoliamo l'importo IVA
-    tax_percentage = 22.0  # IVA standard italiana
-    amount_without_tax = booking.total_price / (1 + tax_percentage/100)
-    tax_amount = booking.total_price - amount_without_tax
+    # Otteniamo il prossimo numero di fattura dalla sequenza dell'anno, nella stessa transazione della fattura
+    invoice_number = reserve_invoice_numbers(session)[0]
     
-    # Creiamo la nuova fattura
-    new_invoice = Invoice(
-        booking_id=booking_id,
-        invoice_number=invoice_number,
-        date=datetime.now().date(),
-        amount=booking.total_price,
-        tax_amount=tax_amount,
-        tax_percentage=tax_percentage,
-        status="Emessa" if booking.payment_status == "Pagato" else "In attesa",
-        payment_date=datetime.now().date() if booking.payment_status == "Pagato" else None,
-        notes=f"Fattura per prenotazione {booking.guest_name} dal {booking.checkin_date} al {booking.checkout_date}"
-    )
+    new_invoice = _build_invoice(booking, invoice_number)
     
     session.add(new_invoice)
     session.commit()
     result = new_invoice.to_dict()
     session.close()
+    
+    # Calcoliamo l'imposta di soggiorno della nuova fattura
+    from utils.tourist_tax import attach_tourist_tax_to_invoices
+    attach_tourist_tax_to_invoices([result["id"]])
     return result
 
+def create_invoices_for_bookings(booking_ids):
+    """
+    Crea le fatture di più prenotazioni in una sola transazione
+    
+    Le prenotazioni vengono caricate con una sola query, quelle che hanno già
+    una fattura vengono saltate, i numeri vengono riservati in blocco e tutte
+    le fatture sono inserite con un unico executemany.
+    
+    Args:
+        booking_ids (list): Id delle prenotazioni da fatturare
+        
+    Returns:
+        dict: Riepilogo con 'created' (fatture create), 'skipped' (prenotazioni già fatturate)
+              e 'missing' (prenotazioni non trovate)
+    """
+    booking_ids = list(dict.fromkeys(booking_ids))
+    session = get_db_session()
+    try:
+        bookings = {booking.id: booking for booking in session.query(Booking).filter(Booking.id.in_(booking_ids))}
+        invoiced = {booking_id for (booking_id,) in
+                    session.query(Invoice.booking_id).filter(Invoice.booking_id.in_(booking_ids))}
+        
+        to_invoice = [bookings[booking_id] for booking_id in booking_ids
+                      if booking_id in bookings and booking_id not in invoiced]
+        invoice_numbers = reserve_invoice_numbers(session, count=len(to_invoice))
+        new_invoices = [_build_invoice(booking, number) for booking, number in zip(to_invoice, invoice_numbers)]
+        
+        session.bulk_save_objects(new_invoices)
+        
+        # Gli inserimenti in blocco non passano dal flush: aggiorniamo il registro fiscale qui
+        from utils.fiscal_ledger import refresh_fiscal_ledger
+        refresh_fiscal_ledger(session.connection(), [booking.id for booking in to_invoice])
+        session.commit()
+        
+        # Calcoliamo l'imposta di soggiorno delle nuove fatture, con una sola query
+        if new_invoices:
+            from utils.tourist_tax import attach_tourist_tax_to_invoices
+            attach_tourist_tax_to_invoices([invoice.id for invoice in new_invoices])
+        
+        return {
+            "created": [invoice.to_dict() for invoice in new_invoices],
+            "skipped": [booking_id for booking_id in booking_ids if booking_id in invoiced],
+            "missing": [booking_id for booking_id in booking_ids if booking_id not in bookings]
+        }
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 def get_all_invoices():
     """Recupera tutte le fatture dal database"""
     session = get_db_session()
@@ -0,0 +1,434 @@
+import os
+import re
+import threading
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from utils.invoice_export import load_invoice_documents, BATCH_SIZE
+
+try:
+    from lxml import etree as lxml_etree
+    LXML_INSTALLED = True
+except ImportError:
+    LXML_INSTALLED = False
+
+# Copia locale dello schema ufficiale FatturaPA 1.2 (Agenzia delle Entrate), usata per validare ogni documento;
+# importa xmldsig-core-schema.xsd dalla stessa cartella, perché lxml non scarica gli import remoti
+XSD_PATH = os.path.join("data", "schemas", "Schema_del_file_xml_FatturaPA_v1.2.2.xsd")
+
+# Archivi ZIP pronti per il caricamento sul Sistema di Interscambio
+EXPORT_DIR = os.path.join("data", "exports", "fatturapa")
+
+NAMESPACE = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+DS_NAMESPACE = "http://www.w3.org/2000/09/xmldsig#"
+
+# Fatture verso privati: i clienti sono consumatori finali senza codice destinatario
+FORMATO_TRASMISSIONE = "FPR12"
+CODICE_DESTINATARIO_PRIVATI = "0000000"
+
+# Regime fiscale ordinario, se non indicato nelle impostazioni fiscali
+DEFAULT_REGIME_FISCALE = "RF01"
+
+# Modalità di pagamento FatturaPA per i metodi usati nelle prenotazioni
+PAYMENT_METHODS = {
+    "contanti": "MP01",
+    "assegno": "MP02",
+    "bonifico": "MP05",
+    "carta di credito": "MP08",
+    "carta": "MP08",
+    "paypal": "MP08",
+}
+DEFAULT_PAYMENT_METHOD = "MP05"
+
+# Natura dell'operazione per le fatture senza IVA (operazioni esenti)
+NATURA_ESENTE = "N4"
+
+COUNTRY_CODES = {"italia": "IT", "italy": "IT"}
+
+_BASE36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+_schema = {"path": None, "mtime": None, "schema": None}
+_schema_lock = threading.Lock()
+
+ET.register_namespace("p", NAMESPACE)
+ET.register_namespace("ds", DS_NAMESPACE)
+ET.register_namespace("xsi", XSI_NAMESPACE)
+
+def _country_code(country):
+    """Get the ISO 3166 code of a country name from the settings (default IT)"""
+    country = (country or "").strip()
+    if len(country) == 2:
+        return country.upper()
+    return COUNTRY_CODES.get(country.lower(), "IT")
+
+def _split_vat_number(vat_number, country="IT"):
+    """Split a VAT number like IT12345678901 into country code and number"""
+    vat_number = re.sub(r"\s", "", vat_number or "").upper()
+    if len(vat_number) > 2 and vat_number[:2].isalpha():
+        return vat_number[:2], vat_number[2:]
+    return _country_code(country), vat_number
+
+def _amount(value):
+    """Format an amount with the two decimals required by the schema"""
+    return f"{round(float(value or 0), 2):.2f}"
+
+def _base36(number, width=5):
+    digits = ""
+    while number:
+        number, remainder = divmod(number, 36)
+        digits = _BASE36[remainder] + digits
+    return digits.rjust(width, "0")[-width:]
+
+def progressive_number(invoice_data):
+    """
+    Get the 5-character progressive of the file name from the invoice number
+
+    Invoice numbers like INV-2025-0042 map to a unique base-36 code per
+    year and sequence, so the same invoice always gets the same file name.
+    """
+    match = re.search(r"(\d{4})\D+(\d+)$", invoice_data.get("invoice_number") or "")
+    if match:
+        return _base36(int(match.group(1)) % 100 * 100000 + int(match.group(2)) % 100000)
+    return _base36(zlib.crc32(str(invoice_data.get("id")).encode("utf-8")))
+
+def get_file_name(company_info, invoice_data):
+    """Get the SDI file name: country code, transmitter id and progressive"""
+    country, vat = _split_vat_number(company_info.get("vat_number"), company_info.get("country"))
+    transmitter = company_info.get("fiscal_code") or vat
+    return f"{country}{transmitter}_{progressive_number(invoice_data)}.xml"
+
+def check_company_info(company_info):
+    """
+    Check the company data required in every FatturaPA header
+
+    Args:
+        company_info (dict): Company information from the fiscal settings
+
+    Returns:
+        list: Error messages, empty if the data is complete
+    """
+    errors = []
+    for key, label in (("name", "Nome Azienda"), ("address", "Indirizzo"), ("city", "Città"),
+                       ("zip", "CAP"), ("vat_number", "Partita IVA")):
+        if not (company_info or {}).get(key):
+            errors.append(f"Campo obbligatorio mancante: {label}")
+
+    if company_info:
+        _, vat = _split_vat_number(company_info.get("vat_number"), company_info.get("country"))
+        if vat and not re.fullmatch(r"[0-9A-Z]{1,28}", vat):
+            errors.append("Partita IVA non valida")
+        if company_info.get("zip") and not re.fullmatch(r"\d{5}", str(company_info["zip"])):
+            errors.append("Il CAP deve essere di 5 cifre")
+    return errors
+
+def check_buyer_info(booking_data):
+    """
+    Check the guest data SDI requires for the buyer (CessionarioCommittente)
+
+    SDI rejects invoices whose buyer has neither a fiscal code nor a VAT
+    number (check 00417), so missing data is reported instead of filled in.
+
+    Args:
+        booking_data (dict): Booking of the invoice
+
+    Returns:
+        list: Error messages, empty if the data is complete
+    """
+    errors = []
+    fiscal_code = re.sub(r"\s", "", booking_data.get("guest_fiscal_code") or "").upper()
+    vat_number = booking_data.get("guest_vat_number")
+    if not fiscal_code and not vat_number:
+        errors.append("Codice fiscale o partita IVA dell'ospite mancante")
+    elif fiscal_code and not re.fullmatch(r"[A-Z0-9]{11,16}", fiscal_code):
+        errors.append("Codice fiscale dell'ospite non valido")
+
+    for key, label in (("guest_address", "Indirizzo"), ("guest_city", "Comune")):
+        if not booking_data.get(key):
+            errors.append(f"{label} dell'ospite mancante")
+    if _country_code(booking_data.get("guest_country")) == "IT" \
+            and not re.fullmatch(r"\d{5}", str(booking_data.get("guest_zip") or "")):
+        errors.append("CAP dell'ospite mancante o non di 5 cifre")
+    return errors
+
+def _sub(parent, tag, text=None):
+    element = ET.SubElement(parent, tag)
+    if text is not None:
+        element.text = str(text)
+    return element
+
+def _sede(parent, tag, address, zip_code, city, country):
+    sede = _sub(parent, tag)
+    _sub(sede, "Indirizzo", address[:60])
+    # Per gli indirizzi esteri le specifiche SDI prevedono il CAP convenzionale 00000
+    _sub(sede, "CAP", zip_code if country == "IT" else "00000")
+    _sub(sede, "Comune", city[:60])
+    _sub(sede, "Nazione", country)
+
+def _document_lines(invoice_data, booking_data):
+    """
+    Split the taxable amount of an invoice in stay and cleaning lines
+
+    Returns:
+        list: (description, taxable amount) tuples; rounding differences go to the stay line
+    """
+    tax_rate = float(invoice_data.get("tax_percentage") or 0)
+    taxable = round(float(invoice_data.get("amount") or 0) - float(invoice_data.get("tax_amount") or 0), 2)
+    cleaning = round(float(booking_data.get("cleaning_fee") or 0) / (1 + tax_rate / 100), 2)
+    cleaning = min(cleaning, taxable)
+
+    nights = booking_data.get("nights")
+    stay = f"Soggiorno dal {booking_data.get('checkin_date')} al {booking_data.get('checkout_date')}"
+    if nights:
+        stay += f" ({nights} notti)"
+
+    lines = [(stay, round(taxable - cleaning, 2))]
+    if cleaning > 0:
+        lines.append(("Pulizia finale", cleaning))
+    return lines
+
+def build_invoice_xml(invoice_data, booking_data, property_data, company_info):
+    """
+    Build the FatturaPA XML document of an invoice
+
+    Args:
+        invoice_data (dict): Invoice dictionary
+        booking_data (dict): Booking of the invoice, with 'nights'
+        property_data (dict): Property of the booking
+        company_info (dict): Company information from the fiscal settings
+
+    Returns:
+        bytes: UTF-8 XML document
+
+    Raises:
+        ValueError: If the company or guest data required by SDI is missing
+    """
+    missing = check_company_info(company_info) + check_buyer_info(booking_data)
+    if missing:
+        raise ValueError("; ".join(missing))
+
+    root = ET.Element(f"{{{NAMESPACE}}}FatturaElettronica", {
+        "versione": FORMATO_TRASMISSIONE,
+        f"{{{XSI_NAMESPACE}}}schemaLocation": f"{NAMESPACE} {os.path.basename(XSD_PATH)}"
+    })
+    company_country = _country_code(company_info.get("country"))
+    vat_country, vat = _split_vat_number(company_info.get("vat_number"), company_info.get("country"))
+
+    # Intestazione: trasmissione, cedente (l'azienda) e cessionario (l'ospite)
+    header = _sub(root, "FatturaElettronicaHeader")
+
+    transmission = _sub(header, "DatiTrasmissione")
+    transmitter = _sub(transmission, "IdTrasmittente")
+    _sub(transmitter, "IdPaese", vat_country)
+    _sub(transmitter, "IdCodice", company_info.get("fiscal_code") or vat)
+    _sub(transmission, "ProgressivoInvio", progressive_number(invoice_data))
+    _sub(transmission, "FormatoTrasmissione", FORMATO_TRASMISSIONE)
+    _sub(transmission, "CodiceDestinatario", CODICE_DESTINATARIO_PRIVATI)
+
+    supplier = _sub(header, "CedentePrestatore")
+    supplier_data = _sub(supplier, "DatiAnagrafici")
+    supplier_vat = _sub(supplier_data, "IdFiscaleIVA")
+    _sub(supplier_vat, "IdPaese", vat_country)
+    _sub(supplier_vat, "IdCodice", vat)
+    if company_info.get("fiscal_code"):
+        _sub(supplier_data, "CodiceFiscale", company_info["fiscal_code"])
+    _sub(_sub(supplier_data, "Anagrafica"), "Denominazione", company_info.get("name", "")[:80])
+    _sub(supplier_data, "RegimeFiscale", company_info.get("regime_fiscale") or DEFAULT_REGIME_FISCALE)
+    _sede(supplier, "Sede", company_info.get("address"), company_info.get("zip"),
+          company_info.get("city"), company_country)
+    if company_info.get("phone") or company_info.get("email"):
+        contacts = _sub(supplier, "Contatti")
+        if company_info.get("phone"):
+            _sub(contacts, "Telefono", re.sub(r"\D", "", company_info["phone"])[:12])
+        if company_info.get("email"):
+            _sub(contacts, "Email", company_info["email"])
+
+    customer = _sub(header, "CessionarioCommittente")
+    customer_data = _sub(customer, "DatiAnagrafici")
+    guest_country = _country_code(booking_data.get("guest_country"))
+    if booking_data.get("guest_vat_number"):
+        guest_vat_country, guest_vat = _split_vat_number(booking_data["guest_vat_number"], guest_country)
+        guest_vat_id = _sub(customer_data, "IdFiscaleIVA")
+        _sub(guest_vat_id, "IdPaese", guest_vat_country)
+        _sub(guest_vat_id, "IdCodice", guest_vat)
+    if booking_data.get("guest_fiscal_code"):
+        _sub(customer_data, "CodiceFiscale", re.sub(r"\s", "", booking_data["guest_fiscal_code"]).upper())
+    _sub(_sub(customer_data, "Anagrafica"), "Denominazione", (booking_data.get("guest_name") or "-")[:80])
+    _sede(customer, "Sede", booking_data["guest_address"], str(booking_data.get("guest_zip") or ""),
+          booking_data["guest_city"], guest_country)
+
+    # Corpo: dati del documento, righe, riepilogo IVA e pagamento
+    body = _sub(root, "FatturaElettronicaBody")
+    general = _sub(_sub(body, "DatiGenerali"), "DatiGeneraliDocumento")
+    _sub(general, "TipoDocumento", "TD01")
+    _sub(general, "Divisa", "EUR")
+    _sub(general, "Data", invoice_data.get("date"))
+    _sub(general, "Numero", invoice_data.get("invoice_number"))
+    _sub(general, "ImportoTotaleDocumento", _amount(invoice_data.get("amount")))
+
+    tax_rate = float(invoice_data.get("tax_percentage") or 0)
+    services = _sub(body, "DatiBeniServizi")
+    lines = _document_lines(invoice_data, booking_data)
+    for number, (description, taxable) in enumerate(lines, start=1):
+        line = _sub(services, "DettaglioLinee")
+        _sub(line, "NumeroLinea", number)
+        _sub(line, "Descrizione", description[:1000])
+        _sub(line, "PrezzoUnitario", _amount(taxable))
+        _sub(line, "PrezzoTotale", _amount(taxable))
+        _sub(line, "AliquotaIVA", _amount(tax_rate))
+        if tax_rate == 0:
+            _sub(line, "Natura", NATURA_ESENTE)
+
+    summary = _sub(services, "DatiRiepilogo")
+    _sub(summary, "AliquotaIVA", _amount(tax_rate))
+    if tax_rate == 0:
+        _sub(summary, "Natura", NATURA_ESENTE)
+    _sub(summary, "ImponibileImporto", _amount(sum(taxable for _, taxable in lines)))
+    _sub(summary, "Imposta", _amount(invoice_data.get("tax_amount")))
+    if tax_rate:
+        _sub(summary, "EsigibilitaIVA", "I")
+
+    payment = _sub(body, "DatiPagamento")
+    _sub(payment, "CondizioniPagamento", "TP02")
+    payment_detail = _sub(payment, "DettaglioPagamento")
+    method = (booking_data.get("payment_method") or "").strip().lower()
+    _sub(payment_detail, "ModalitaPagamento", PAYMENT_METHODS.get(method, DEFAULT_PAYMENT_METHOD))
+    _sub(payment_detail, "ImportoPagamento", _amount(invoice_data.get("amount")))
+
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+def get_schema(xsd_path=XSD_PATH):
+    """
+    Get the compiled FatturaPA schema, loaded once and reloaded only if the file changes
+
+    Returns:
+        lxml.etree.XMLSchema: The schema, or None if lxml or the XSD file is not available
+
+    Raises:
+        ValueError: If the XSD file, or a schema it imports, cannot be parsed
+    """
+    if not LXML_INSTALLED or not os.path.exists(xsd_path):
+        return None
+
+    mtime = os.path.getmtime(xsd_path)
+    with _schema_lock:
+        if _schema["path"] != xsd_path or _schema["mtime"] != mtime:
+            try:
+                _schema["schema"] = lxml_etree.XMLSchema(lxml_etree.parse(xsd_path))
+            except (lxml_etree.XMLSchemaParseError, lxml_etree.XMLSyntaxError, OSError) as e:
+                raise ValueError(f"Schema XSD FatturaPA non valido ({xsd_path}): {e}") from e
+            _schema["path"] = xsd_path
+            _schema["mtime"] = mtime
+        return _schema["schema"]
+
+def validate_invoice_xml(xml_bytes, schema):
+    """
+    Validate a FatturaPA document against the schema
+
+    Args:
+        xml_bytes (bytes): XML document
+        schema (lxml.etree.XMLSchema): Schema returned by get_schema
+
+    Returns:
+        list: Validation error messages, empty if the document is valid
+    """
+    document = lxml_etree.fromstring(xml_bytes)
+    if schema.validate(document):
+        return []
+    return [f"Riga {error.line}: {error.message}" for error in schema.error_log]
+
+def generate_invoice_documents(invoice_ids, company_info, validate=True):
+    """
+    Generate FatturaPA documents one batch of invoices at a time
+
+    Invoices are loaded with their booking and property in one query per
+    batch, so memory holds at most one batch whatever the number of invoices.
+
+    Args:
+        invoice_ids (list): Ids of the invoices
+        company_info (dict): Company information from the fiscal settings
+        validate (bool): Validate each document against the local XSD, when available
+
+    Yields:
+        tuple: (invoice id, file name, XML bytes or None, list of error messages)
+    """
+    schema = get_schema() if validate else None
+
+    for start in range(0, len(invoice_ids), BATCH_SIZE):
+        batch_ids = invoice_ids[start:start + BATCH_SIZE]
+        documents = load_invoice_documents(batch_ids)
+
+        for invoice_id in batch_ids:
+            if invoice_id not in documents:
+                yield invoice_id, None, None, ["Fattura o prenotazione non trovata"]
+                continue
+
+            invoice_data, booking_data, property_data = documents[invoice_id]
+            file_name = get_file_name(company_info, invoice_data)
+            buyer_errors = check_buyer_info(booking_data)
+            if buyer_errors:
+                yield invoice_id, file_name, None, buyer_errors
+                continue
+            try:
+                xml_bytes = build_invoice_xml(invoice_data, booking_data, property_data, company_info)
+                errors = validate_invoice_xml(xml_bytes, schema) if schema is not None else []
+            except Exception as e:
+                xml_bytes, errors = None, [str(e)]
+            yield invoice_id, file_name, xml_bytes, errors
+
+def export_fatturapa_archive(invoice_ids, company_info, output=None, name=None, progress_callback=None, validate=True):
+    """
+    Generate the FatturaPA documents of many invoices into a ZIP archive for upload to SDI
+
+    Each document is written to the archive as soon as it is generated and
+    validated; documents failing validation are left out and reported.
+
+    Args:
+        invoice_ids (list): Ids of the invoices
+        company_info (dict): Company information from the fiscal settings
+        output (str or file, optional): Path or stream of the archive (default: a new file in EXPORT_DIR)
+        name (str, optional): Name of the archive in EXPORT_DIR, without extension
+        progress_callback (callable, optional): Called with (processed, total) after every invoice
+        validate (bool): Validate each document against the local XSD, when available
+
+    Returns:
+        dict: Summary with the archive path, exported and rejected invoices and whether the XSD was used
+
+    Raises:
+        ValueError: If the company data is incomplete or the XSD file cannot be parsed
+    """
+    company_errors = check_company_info(company_info)
+    if company_errors:
+        raise ValueError("; ".join(company_errors))
+
+    if output is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        output = os.path.join(EXPORT_DIR, f"{name or 'fatturapa_' + datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+
+    summary = {
+        "path": output if isinstance(output, str) else None,
+        "exported": 0,
+        "errors": [],
+        "validated": validate and get_schema() is not None
+    }
+
+    total = len(invoice_ids)
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        written = set()
+        for processed, (invoice_id, file_name, xml_bytes, errors) in enumerate(
+                generate_invoice_documents(list(invoice_ids), company_info, validate), start=1):
+            if errors or xml_bytes is None:
+                summary["errors"].append({"invoice_id": invoice_id, "file_name": file_name, "errors": errors})
+            elif file_name in written:
+                summary["errors"].append({"invoice_id": invoice_id, "file_name": file_name,
+                                          "errors": ["Nome file già usato da un'altra fattura (numero duplicato)"]})
+            else:
+                archive.writestr(file_name, xml_bytes)
+                written.add(file_name)
+                summary["exported"] += 1
+
+            if progress_callback:
+                progress_callback(processed, total)
+
+    return summary
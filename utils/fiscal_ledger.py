@@ -0,0 +1,226 @@
+from collections import defaultdict
+from sqlalchemy import select, delete, insert, func, or_, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from utils.database import get_db_session, Booking, Invoice, FiscalLedgerEntry, FiscalLedgerDay, AppState
+
+# Stime usate quando una prenotazione non ha ancora una fattura
+DEFAULT_VAT_RATE = 0.22  # 22% IVA
+COMMISSION_RATE = 0.10  # 10% commissione
+
+# Importi aggregati per giorno e immobile
+AMOUNT_COLUMNS = ["gross", "taxable", "vat", "cleaning_fees", "commissions"]
+
+# Prenotazioni aggiornate per ogni query IN
+REFRESH_CHUNK_SIZE = 500
+
+# Indicatore in app_state: il registro contiene lo storico di tutte le prenotazioni
+LEDGER_BUILT_KEY = "fiscal_ledger_built"
+
+def estimate_fiscal_amounts(gross, vat=None):
+    """
+    Split gross revenue into taxable amount, VAT and commissions
+
+    Works on floats and on NumPy arrays or pandas series alike.
+
+    Args:
+        gross: Gross revenue, VAT included
+        vat (optional): VAT actually invoiced; estimated at DEFAULT_VAT_RATE if not given
+
+    Returns:
+        tuple: (taxable, vat, commissions)
+    """
+    if vat is None:
+        vat = gross / (1 + DEFAULT_VAT_RATE) * DEFAULT_VAT_RATE
+    return gross - vat, vat, gross * COMMISSION_RATE
+
+def _booking_entries(connection, booking_ids):
+    """Compute the ledger entry of each booking, using its invoice when there is one"""
+    rows = connection.execute(
+        select(Booking.id, Booking.property_id, Booking.checkin_date, Booking.status,
+               Booking.total_price, Booking.cleaning_fee, Invoice.amount, Invoice.tax_amount)
+        .outerjoin(Invoice, (Invoice.booking_id == Booking.id)
+                   & or_(Invoice.status.is_(None), Invoice.status != "Annullata"))
+        .where(Booking.id.in_(booking_ids))
+    ).all()
+
+    entries = {}
+    for booking_id, property_id, day, status, total_price, cleaning_fee, invoice_amount, invoice_tax in rows:
+        # Le prenotazioni cancellate non producono ricavi; con più fatture vale la prima
+        if booking_id in entries or status == "cancellata" or day is None:
+            continue
+        if invoice_amount is not None:
+            gross = invoice_amount
+            taxable, vat, commissions = estimate_fiscal_amounts(gross, invoice_tax or 0)
+        else:
+            gross = total_price or 0
+            taxable, vat, commissions = estimate_fiscal_amounts(gross)
+        entries[booking_id] = {
+            "booking_id": booking_id,
+            "day": day,
+            "property_id": property_id,
+            "invoiced": invoice_amount is not None,
+            "gross": gross,
+            "taxable": taxable,
+            "vat": vat,
+            "cleaning_fees": cleaning_fee or 0,
+            "commissions": commissions
+        }
+    return list(entries.values())
+
+def _apply_to_days(connection, entries, sign):
+    """Add (sign=1) or subtract (sign=-1) booking entries from the per-day totals"""
+    totals = defaultdict(lambda: dict.fromkeys(AMOUNT_COLUMNS + ["bookings"], 0))
+    for entry in entries:
+        day_totals = totals[(entry["day"], entry["property_id"])]
+        day_totals["bookings"] += sign
+        for column in AMOUNT_COLUMNS:
+            day_totals[column] += sign * (entry[column] or 0)
+    if not totals:
+        return
+
+    statement = sqlite_insert(FiscalLedgerDay)
+    statement = statement.on_conflict_do_update(
+        index_elements=["day", "property_id"],
+        set_={column: getattr(FiscalLedgerDay, column) + getattr(statement.excluded, column)
+              for column in AMOUNT_COLUMNS + ["bookings"]}
+    )
+    connection.execute(statement, [
+        {"day": day, "property_id": property_id, **values}
+        for (day, property_id), values in totals.items()
+    ])
+
+def refresh_fiscal_ledger(connection, booking_ids):
+    """
+    Update the ledger for bookings that were added, changed or deleted
+
+    The previous entries of the bookings are subtracted from the daily totals
+    and the new ones added, so the cost depends on the bookings that changed,
+    not on the size of the history. Runs on the caller's connection, inside
+    its transaction.
+
+    Args:
+        connection: SQLAlchemy connection of the current transaction
+        booking_ids (iterable): Ids of the changed bookings
+    """
+    booking_ids = list(set(booking_ids))
+    for start in range(0, len(booking_ids), REFRESH_CHUNK_SIZE):
+        chunk = booking_ids[start:start + REFRESH_CHUNK_SIZE]
+
+        previous = connection.execute(
+            select(FiscalLedgerEntry.__table__).where(FiscalLedgerEntry.booking_id.in_(chunk))
+        ).mappings().all()
+        _apply_to_days(connection, previous, -1)
+        connection.execute(delete(FiscalLedgerEntry).where(FiscalLedgerEntry.booking_id.in_(chunk)))
+
+        entries = _booking_entries(connection, chunk)
+        if entries:
+            connection.execute(insert(FiscalLedgerEntry), entries)
+        _apply_to_days(connection, entries, 1)
+
+    connection.execute(delete(FiscalLedgerDay).where(FiscalLedgerDay.bookings <= 0))
+
+def rebuild_fiscal_ledger():
+    """Rebuild the whole ledger from bookings and invoices"""
+    session = get_db_session()
+    try:
+        connection = session.connection()
+        connection.execute(delete(FiscalLedgerEntry))
+        connection.execute(delete(FiscalLedgerDay))
+        booking_ids = [booking_id for (booking_id,) in connection.execute(select(Booking.id))]
+        refresh_fiscal_ledger(connection, booking_ids)
+        session.merge(AppState(key=LEDGER_BUILT_KEY, value="1"))
+        session.commit()
+    finally:
+        session.close()
+
+def ensure_fiscal_ledger():
+    """
+    Build the ledger the first time, for databases created before it existed
+
+    A marker saved with the full build is checked, not the entries: on an
+    upgraded database the after_flush hook can add the entries of new
+    bookings before the history has been built.
+    """
+    session = get_db_session()
+    try:
+        built = session.get(AppState, LEDGER_BUILT_KEY) is not None
+    finally:
+        session.close()
+    if not built:
+        rebuild_fiscal_ledger()
+
+def _period_key(period):
+    """Get the SQL expression grouping ledger days by month, quarter or year"""
+    year = func.strftime('%Y', FiscalLedgerDay.day)
+    if period == "month":
+        return func.strftime('%Y-%m', FiscalLedgerDay.day)
+    if period == "quarter":
+        quarter = (cast(func.strftime('%m', FiscalLedgerDay.day), Integer) + 2) // 3
+        return func.printf('%s-Q%d', year, quarter)
+    return year
+
+def get_fiscal_summary(period="quarter", start_date=None, end_date=None, property_id=None):
+    """
+    Get fiscal totals grouped by period from the ledger
+
+    Args:
+        period (str): "month", "quarter" or "year"
+        start_date (datetime.date, optional): First check-in day included
+        end_date (datetime.date, optional): Last check-in day included
+        property_id (str, optional): Property to include, None for all
+
+    Returns:
+        list: One dictionary per period with bookings, gross, taxable, vat, cleaning_fees and commissions
+    """
+    ensure_fiscal_ledger()
+
+    key = _period_key(period).label("period")
+    query = select(key, func.sum(FiscalLedgerDay.bookings).label("bookings"),
+                   *[func.sum(getattr(FiscalLedgerDay, column)).label(column) for column in AMOUNT_COLUMNS])
+    if start_date is not None:
+        query = query.where(FiscalLedgerDay.day >= start_date)
+    if end_date is not None:
+        query = query.where(FiscalLedgerDay.day <= end_date)
+    if property_id is not None:
+        query = query.where(FiscalLedgerDay.property_id == property_id)
+
+    session = get_db_session()
+    try:
+        rows = session.execute(query.group_by(key).order_by(key)).mappings().all()
+        return [dict(row) for row in rows]
+    finally:
+        session.close()
+
+def get_fiscal_totals(start_date=None, end_date=None, property_id=None, by_property=False):
+    """
+    Get fiscal totals of a date range from the ledger
+
+    Args:
+        start_date (datetime.date, optional): First check-in day included
+        end_date (datetime.date, optional): Last check-in day included
+        property_id (str, optional): Property to include, None for all
+        by_property (bool): Return one row per property instead of a single total
+
+    Returns:
+        dict or list: Totals with bookings, gross, taxable, vat, cleaning_fees and commissions
+    """
+    ensure_fiscal_ledger()
+
+    columns = [func.coalesce(func.sum(FiscalLedgerDay.bookings), 0).label("bookings")] + \
+        [func.coalesce(func.sum(getattr(FiscalLedgerDay, column)), 0.0).label(column) for column in AMOUNT_COLUMNS]
+    query = select(FiscalLedgerDay.property_id, *columns) if by_property else select(*columns)
+    if start_date is not None:
+        query = query.where(FiscalLedgerDay.day >= start_date)
+    if end_date is not None:
+        query = query.where(FiscalLedgerDay.day <= end_date)
+    if property_id is not None:
+        query = query.where(FiscalLedgerDay.property_id == property_id)
+
+    session = get_db_session()
+    try:
+        if by_property:
+            rows = session.execute(query.group_by(FiscalLedgerDay.property_id)).mappings().all()
+            return [dict(row) for row in rows]
+        return dict(session.execute(query).mappings().one())
+    finally:
+        session.close()
@@ -0,0 +1,278 @@
+import hashlib
+import io
+import os
+import threading
+import warnings
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_INSTALLED = True
+except ImportError:
+    PYARROW_INSTALLED = False
+
+# Cartella della cache Parquet dei dataset già analizzati
+CACHE_DIR = os.path.join("data", "cache", "datasets")
+
+# Da cambiare quando cambiano le regole di inferenza, per invalidare la cache
+INGESTION_VERSION = "1"
+
+# Righe usate per inferire tipi e date dei file CSV
+SAMPLE_ROWS = 10_000
+
+# Colonne di testo convertite in categorie se poco variabili
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5
+
+# Quota minima di valori riconosciuti come date per convertire una colonna
+DATE_MIN_SHARE = 0.9
+
+# Dataset tenuti in memoria per i rerun di Streamlit
+MEMORY_CACHE_SIZE = 4
+
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def read_file_bytes(file_obj):
+    """Get the content of an uploaded file, a path or a file-like object"""
+    if isinstance(file_obj, (str, os.PathLike)):
+        with open(file_obj, "rb") as f:
+            return f.read()
+    if hasattr(file_obj, "getvalue"):
+        return file_obj.getvalue()
+    data = file_obj.read()
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+def get_content_hash(data, file_extension):
+    """Get the cache key of a file content"""
+    digest = hashlib.sha256(data)
+    digest.update(f"{file_extension}:{INGESTION_VERSION}".encode("utf-8"))
+    return digest.hexdigest()
+
+def _looks_like_dates(values):
+    """Check if most non-null values of a text column parse as dates"""
+    values = values.dropna()
+    if values.empty or pd.api.types.is_numeric_dtype(values):
+        return False
+
+    with warnings.catch_warnings():
+        # Senza formato esplicito pandas avvisa che analizza ogni valore separatamente
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(values.astype(str), errors="coerce")
+    return parsed.notna().mean() >= DATE_MIN_SHARE
+
+def _is_low_cardinality(values):
+    unique = values.nunique()
+    return 0 < unique <= CATEGORY_MAX_UNIQUE and unique <= len(values) * CATEGORY_MAX_RATIO
+
+def infer_csv_schema(sample):
+    """
+    Infer compact dtypes and date columns from a sample of a CSV file
+
+    Args:
+        sample (pandas.DataFrame): First rows parsed with default settings
+
+    Returns:
+        tuple: (dtype dict for read_csv, list of date columns)
+    """
+    dtypes = {}
+    parse_dates = []
+
+    for col in sample.columns:
+        values = sample[col]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            # I tipi numerici vengono ridotti dopo la lettura, sui valori reali
+            continue
+        if _looks_like_dates(values):
+            parse_dates.append(col)
+        elif _is_low_cardinality(values):
+            dtypes[col] = "category"
+
+    return dtypes, parse_dates
+
+def downcast_numeric(df):
+    """
+    Downcast float columns to float32 when every value is kept exactly
+
+    Integer columns stay int64: with int8/int16 columns, later arithmetic
+    in transformations and insights would overflow silently.
+
+    Args:
+        df (pandas.DataFrame): Dataframe to optimize
+
+    Returns:
+        tuple: (optimized dataframe, dict of converted columns and their new dtype)
+    """
+    converted = {}
+    columns = {}
+
+    for col in df.columns:
+        values = df[col]
+        if not pd.api.types.is_float_dtype(values):
+            continue
+
+        smaller = pd.to_numeric(values, downcast="float")
+        # float32 solo se tutti i valori restano identici
+        if not ((smaller.astype("float64") == values) | values.isna()).all():
+            continue
+
+        if smaller.dtype != values.dtype:
+            columns[col] = smaller
+            converted[col] = str(smaller.dtype)
+
+    return (df.assign(**columns) if columns else df), converted
+
+def optimize_dtypes(df):
+    """
+    Convert dates, low-cardinality text and numbers of a parsed dataframe to compact dtypes
+
+    Used for formats that cannot be read with an explicit schema (Excel, JSON).
+
+    Args:
+        df (pandas.DataFrame): Parsed dataframe
+
+    Returns:
+        tuple: (optimized dataframe, dict of converted columns and their new dtype)
+    """
+    converted = {}
+    columns = {}
+
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if _looks_like_dates(values.head(SAMPLE_ROWS)):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                columns[col] = pd.to_datetime(values, errors="coerce")
+        elif _is_low_cardinality(values):
+            columns[col] = values.astype("category")
+        else:
+            continue
+        converted[col] = str(columns[col].dtype)
+
+    df = df.assign(**columns) if columns else df
+    df, downcast = downcast_numeric(df)
+    converted.update(downcast)
+    return df, converted
+
+def read_csv_fast(data):
+    """
+    Parse a CSV with an inferred schema, using the pyarrow engine when available
+
+    Args:
+        data (bytes): CSV content
+
+    Returns:
+        tuple: (dataframe, dict of converted columns, estimated memory with default dtypes in bytes)
+    """
+    sample = pd.read_csv(io.BytesIO(data), nrows=SAMPLE_ROWS)
+    dtypes, parse_dates = infer_csv_schema(sample)
+
+    df = None
+    if PYARROW_INSTALLED:
+        try:
+            df = pd.read_csv(io.BytesIO(data), engine="pyarrow", dtype=dtypes, parse_dates=parse_dates)
+        except Exception:
+            # Opzioni o contenuti non supportati dal motore pyarrow: usiamo quello standard
+            df = None
+    if df is None:
+        df = pd.read_csv(io.BytesIO(data), dtype=dtypes, parse_dates=parse_dates)
+
+    df, converted = downcast_numeric(df)
+    converted.update({col: "category" for col in dtypes})
+    converted.update({col: str(df[col].dtype) for col in parse_dates})
+
+    # Memoria con i tipi predefiniti stimata dal campione
+    default_bytes = sample.memory_usage(deep=True).sum() / max(len(sample), 1) * len(df)
+    return df, converted, int(default_bytes)
+
+def _remember(key, df):
+    with _cache_lock:
+        _memory_cache[key] = df
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def load_dataset(file_obj, file_extension):
+    """
+    Load a dataset with compact dtypes, reusing the cached copy of the same content
+
+    The parsed dataframe is cached in memory and as Parquet keyed by the
+    content hash, so reruns and re-uploads skip parsing. The ingestion report
+    is stored in df.attrs["ingestion"].
+
+    Args:
+        file_obj: File object from st.file_uploader, path or file-like object
+        file_extension (str): File extension to determine the loading method
+
+    Returns:
+        pandas.DataFrame: The loaded data
+    """
+    data = read_file_bytes(file_obj)
+    key = get_content_hash(data, file_extension)
+
+    with _cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            # Copia leggera: chi modifica il risultato non altera la copia in cache
+            df = _memory_cache[key].copy(deep=False)
+            df.attrs["ingestion"] = dict(df.attrs.get("ingestion", {}), source="memory")
+            return df
+
+    cache_path = os.path.join(CACHE_DIR, f"{key}.parquet")
+    if PYARROW_INSTALLED and os.path.exists(cache_path):
+        try:
+            df = pd.read_parquet(cache_path)
+            df.attrs["ingestion"] = {
+                "source": "parquet_cache",
+                "content_hash": key,
+                "memory_mb": df.memory_usage(deep=True).sum() / (1024 * 1024)
+            }
+            _remember(key, df)
+            return df
+        except Exception:
+            # Cache illeggibile: rileggiamo il file originale
+            pass
+
+    if file_extension in ['csv']:
+        df, converted, default_bytes = read_csv_fast(data)
+    else:
+        if file_extension in ['xlsx', 'xls']:
+            df = pd.read_excel(io.BytesIO(data))
+        elif file_extension in ['json']:
+            df = pd.read_json(io.BytesIO(data))
+        else:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        default_bytes = int(df.memory_usage(deep=True).sum())
+        df, converted = optimize_dtypes(df)
+
+    optimized_bytes = int(df.memory_usage(deep=True).sum())
+    df.attrs["ingestion"] = {
+        "source": "parsed",
+        "content_hash": key,
+        "memory_mb": optimized_bytes / (1024 * 1024),
+        "default_memory_mb": default_bytes / (1024 * 1024),
+        "saved_percent": round((1 - optimized_bytes / default_bytes) * 100, 1) if default_bytes else 0.0,
+        "converted_columns": converted
+    }
+
+    if PYARROW_INSTALLED:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            # La cache è facoltativa: il dataset è comunque caricato
+            pass
+
+    _remember(key, df)
+    return df
+
+def get_ingestion_report(df):
+    """Get the ingestion report of a dataframe loaded with load_dataset"""
+    return df.attrs.get("ingestion", {})
@@ -0,0 +1,307 @@
+import os
+import json
+import uuid
+import zipfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from utils.database import get_db_session, Invoice, Booking, Property
+from utils.pdf_export import create_invoice_pdf
+
+# Cartella con gli archivi ZIP e lo stato dei job di esportazione
+EXPORT_DIR = os.path.join("data", "exports", "invoices")
+
+# Fatture generate per ogni apertura dell'archivio: è anche il massimo di PDF in memoria
+BATCH_SIZE = 64
+
+# Sotto questa soglia i PDF vengono generati nel processo corrente
+MIN_PARALLEL_INVOICES = 32
+
+def _job_path(job_id):
+    return os.path.join(EXPORT_DIR, f"{os.path.basename(job_id)}.json")
+
+def _save_job(job):
+    """Write the job state atomically, so an interrupted export can always resume"""
+    tmp_path = _job_path(job["id"]) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, _job_path(job["id"]))
+
+def get_export_job(job_id):
+    """
+    Load the state of an export job
+
+    Args:
+        job_id (str): Job id returned by create_export_job
+
+    Returns:
+        dict: Job state, or None if the job does not exist
+    """
+    try:
+        with open(_job_path(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def list_export_jobs():
+    """Get all export jobs, newest first"""
+    if not os.path.isdir(EXPORT_DIR):
+        return []
+    jobs = [get_export_job(name[:-5]) for name in os.listdir(EXPORT_DIR) if name.endswith('.json')]
+    return sorted([job for job in jobs if job], key=lambda job: job["created_at"], reverse=True)
+
+def create_export_job(invoice_ids, name=None):
+    """
+    Create a bulk PDF export job for a list of invoices
+
+    Args:
+        invoice_ids (list): Ids of the invoices to export
+        name (str, optional): Name of the ZIP file, without extension
+
+    Returns:
+        str: Job id, used to run or resume the export
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    job_id = str(uuid.uuid4())
+    job = {
+        "id": job_id,
+        "name": name or f"fatture_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        "invoice_ids": list(invoice_ids),
+        "completed": 0,
+        "status": "In attesa",
+        "errors": [],
+        "exported_ids": [],
+        "parts": [],
+        "created_at": datetime.now().isoformat(),
+        "completed_at": None
+    }
+    job["zip_path"] = os.path.join(EXPORT_DIR, f"{job_id}.zip")
+    _save_job(job)
+    return job_id
+
+def load_invoice_documents(invoice_ids):
+    """
+    Load invoices with their booking and property in one query
+
+    Args:
+        invoice_ids (list): Invoice ids
+
+    Returns:
+        dict: Invoice id -> (invoice, booking, property) dictionaries
+    """
+    session = get_db_session()
+    try:
+        rows = session.query(Invoice, Booking, Property) \
+            .join(Booking, Invoice.booking_id == Booking.id) \
+            .outerjoin(Property, Booking.property_id == Property.id) \
+            .filter(Invoice.id.in_(invoice_ids)).all()
+    finally:
+        session.close()
+
+    documents = {}
+    for invoice, booking, property in rows:
+        booking_data = booking.to_dict()
+        # Il PDF mostra le notti, che non sono salvate nella prenotazione
+        booking_data["nights"] = (booking.checkout_date - booking.checkin_date).days
+        documents[invoice.id] = (invoice.to_dict(), booking_data, property.to_dict() if property else {})
+    return documents
+
+def render_invoice(document):
+    """
+    Render one invoice PDF (runs in the worker processes)
+
+    Args:
+        document (tuple): (invoice, booking, property) dictionaries
+
+    Returns:
+        tuple: (invoice id, file name in the archive, PDF bytes or None, error message or None)
+    """
+    invoice_data, booking_data, property_data = document
+    filename = f"fattura_{str(invoice_data.get('invoice_number')).replace('/', '-')}.pdf"
+    try:
+        return invoice_data["id"], filename, create_invoice_pdf(invoice_data, booking_data, property_data).getvalue(), None
+    except Exception as e:
+        return invoice_data["id"], filename, None, str(e)
+
+def _exported_invoice_ids(zip_path):
+    """Get the invoices already in an archive (each entry stores its invoice id as comment)"""
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as archive:
+            return {info.comment.decode('utf-8') for info in archive.infolist()}
+    except (OSError, zipfile.BadZipFile):
+        return None
+
+def _part_path(job, index):
+    return os.path.join(EXPORT_DIR, f"{job['id']}.part{index:05d}.zip")
+
+def _write_part(job, results, progress_callback, total):
+    """
+    Write one batch of rendered PDFs to a new part archive
+
+    The part is written to a temporary file and renamed when complete, so a
+    part on disk is never truncated.
+
+    Returns:
+        tuple: (part path or None if no PDF was rendered, ids of the exported invoices)
+    """
+    part_path = _part_path(job, len(job["parts"]))
+    tmp_path = part_path + ".tmp"
+    exported = []
+
+    with zipfile.ZipFile(tmp_path, 'w') as archive:
+        written = set()
+        for invoice_id, filename, pdf_bytes, error in results:
+            if error:
+                job["errors"].append({"invoice_id": invoice_id, "error": error})
+            else:
+                if filename in written:
+                    filename = f"{filename[:-4]}_{invoice_id[:8]}.pdf"
+                entry = zipfile.ZipInfo(filename, date_time=datetime.now().timetuple()[:6])
+                entry.compress_type = zipfile.ZIP_DEFLATED
+                entry.comment = invoice_id.encode('utf-8')
+                archive.writestr(entry, pdf_bytes)
+                written.add(filename)
+                exported.append(invoice_id)
+            job["completed"] += 1
+            if progress_callback:
+                progress_callback(job["completed"], total)
+
+    if not exported:
+        os.remove(tmp_path)
+        return None, exported
+    os.replace(tmp_path, part_path)
+    return part_path, exported
+
+def _merge_parts(job):
+    """
+    Merge the part archives, and the archive of a previous run, into the job ZIP
+
+    The merged archive replaces the old one atomically; the parts are removed
+    only after the job state records that they were merged. Invoices already
+    in the archive are skipped, so parts merged by a run killed before it
+    saved the job state are not added twice.
+    """
+    sources = ([job["zip_path"]] if os.path.exists(job["zip_path"]) else []) + job["parts"]
+    tmp_path = job["zip_path"] + ".tmp"
+
+    with zipfile.ZipFile(tmp_path, 'w') as merged:
+        written = set()
+        merged_ids = set()
+        for source in sources:
+            with zipfile.ZipFile(source, 'r') as archive:
+                for info in archive.infolist():
+                    invoice_id = info.comment.decode('utf-8')
+                    if invoice_id in merged_ids:
+                        continue
+                    if invoice_id:
+                        merged_ids.add(invoice_id)
+                    filename = info.filename
+                    if filename in written:
+                        filename = f"{filename[:-4]}_{invoice_id[:8]}.pdf"
+                    entry = zipfile.ZipInfo(filename, date_time=info.date_time)
+                    entry.compress_type = zipfile.ZIP_DEFLATED
+                    entry.comment = info.comment
+                    merged.writestr(entry, archive.read(info))
+                    written.add(filename)
+    os.replace(tmp_path, job["zip_path"])
+
+    parts = job["parts"]
+    job["parts"] = []
+    _save_job(job)
+    for part in parts:
+        if os.path.exists(part):
+            os.remove(part)
+
+def _remove_orphan_parts(job):
+    """Remove parts and temporary files not recorded in the job, left by an interrupted run"""
+    prefix = f"{job['id']}.part"
+    recorded = {os.path.basename(part) for part in job["parts"]}
+    for name in os.listdir(EXPORT_DIR):
+        if (name.startswith(prefix) and name not in recorded) or name == f"{job['id']}.zip.tmp":
+            os.remove(os.path.join(EXPORT_DIR, name))
+
+def run_export_job(job_id, progress_callback=None, max_workers=None):
+    """
+    Run or resume an export job, streaming the PDFs into the job ZIP archive
+
+    Invoices are rendered in a process pool one batch at a time and each
+    batch is written to its own part archive, so memory holds at most one
+    batch. After every batch the job state records the part and the
+    invoices it contains: running the same job id again, even after the
+    process was killed, skips the invoices already exported. The parts are
+    merged into the job ZIP at the end.
+
+    Args:
+        job_id (str): Job id returned by create_export_job
+        progress_callback (callable, optional): Called with (processed, total) after every invoice
+        max_workers (int, optional): Worker processes (default: number of CPUs)
+
+    Returns:
+        dict: Final job state
+    """
+    job = get_export_job(job_id)
+    if job is None:
+        raise ValueError(f"Export job {job_id} not found")
+
+    job.setdefault("parts", [])
+    if "exported_ids" not in job:
+        # Job creati prima delle parti: le fatture esportate sono nei commenti dell'archivio
+        job["exported_ids"] = sorted(_exported_invoice_ids(job["zip_path"]) or []) \
+            if os.path.exists(job["zip_path"]) else []
+    if not job["exported_ids"] and os.path.exists(job["zip_path"]) \
+            and _exported_invoice_ids(job["zip_path"]) is None:
+        os.remove(job["zip_path"])
+    _remove_orphan_parts(job)
+
+    total = len(job["invoice_ids"])
+    exported = set(job["exported_ids"])
+    pending = [invoice_id for invoice_id in job["invoice_ids"] if invoice_id not in exported]
+    job["completed"] = total - len(pending)
+    job["errors"] = []
+    job["status"] = "In corso"
+    _save_job(job)
+
+    executor = None
+    if len(pending) >= MIN_PARALLEL_INVOICES and max_workers != 1:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch_ids = pending[start:start + BATCH_SIZE]
+            documents = load_invoice_documents(batch_ids)
+            batch = [documents[invoice_id] for invoice_id in batch_ids if invoice_id in documents]
+            for invoice_id in batch_ids:
+                if invoice_id not in documents:
+                    job["errors"].append({"invoice_id": invoice_id, "error": "Fattura o prenotazione non trovata"})
+                    job["completed"] += 1
+
+            results = executor.map(render_invoice, batch) if executor else map(render_invoice, batch)
+
+            # Ogni lotto va in un archivio separato, registrato nello stato del job appena completo
+            part_path, batch_exported = _write_part(job, results, progress_callback, total)
+            if part_path:
+                job["parts"].append(part_path)
+            job["exported_ids"].extend(batch_exported)
+            _save_job(job)
+
+        _merge_parts(job)
+    except BaseException:
+        job["status"] = "Interrotto"
+        _save_job(job)
+        raise
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    job["status"] = "Completato"
+    job["completed_at"] = datetime.now().isoformat()
+    _save_job(job)
+    return job
+
+def delete_export_job(job_id):
+    """Delete an export job and its archive"""
+    job = get_export_job(job_id)
+    paths = [job["zip_path"]] + job.get("parts", []) if job else []
+    for path in paths + [_job_path(job_id)]:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,367 @@
+# Backend LLM condivisi tra CiaoHost e LearnLevelHub.
+# Il modulo usa solo la libreria standard (requests e openai vengono importati
+# solo quando servono) e non dipende da Streamlit, così può essere caricato anche
+# da LearnLevelHub.
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_MAX_WORKERS = 4
+
+# Funzioni chiamate dopo ogni chiamata al modello, es. per salvare la telemetria
+_call_listeners = []
+
+def add_call_listener(listener):
+    """
+    Register a function called with a sample dict after every model call
+
+    The sample has backend, model, feature, latency_ms, prompt_tokens,
+    completion_tokens, cache_hit, error and timestamp.
+
+    Args:
+        listener (callable): Function receiving the sample
+    """
+    if listener not in _call_listeners:
+        _call_listeners.append(listener)
+
+class LLMBackend:
+    """
+    Base class for chat completion backends
+
+    Subclasses implement `_complete`, which receives OpenAI-style messages and
+    returns a (text, usage) tuple. The base class adds response caching,
+    concurrent batching and metrics, so every backend gets them for free.
+    """
+    name = "base"
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "errors": 0,
+            "cache_hits": 0,
+            "total_latency_ms": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    def _complete(self, messages, **options):
+        raise NotImplementedError
+
+    def _cache_key(self, messages, options):
+        payload = json.dumps({"messages": messages, "options": options}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _record(self, latency_ms, usage=None, error=None, cache_hit=False, feature=None, model=None):
+        """Update the metrics of a call and notify the call listeners"""
+        usage = usage or {}
+        with self._lock:
+            if cache_hit:
+                self.metrics["cache_hits"] += 1
+            else:
+                self.metrics["calls"] += 1
+                self.metrics["total_latency_ms"] += latency_ms
+                if error:
+                    self.metrics["errors"] += 1
+                self.metrics["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.metrics["completion_tokens"] += usage.get("completion_tokens", 0)
+
+        sample = {
+            "backend": self.name,
+            "model": model or getattr(self, "model", None) or self.name,
+            "feature": feature or "other",
+            "latency_ms": latency_ms,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cache_hit": cache_hit,
+            "error": str(error) if error else None,
+            "timestamp": time.time()
+        }
+        for listener in list(_call_listeners):
+            try:
+                listener(sample)
+            except Exception:
+                # La telemetria non deve mai interrompere una chiamata al modello
+                pass
+
+    def complete(self, messages, use_cache=False, feature=None, **options):
+        """
+        Get a chat completion
+
+        Args:
+            messages (list): Messages in OpenAI format ({"role", "content"})
+            use_cache (bool, optional): Whether to reuse responses to identical requests
+            feature (str, optional): Application feature making the call, used in telemetry
+            **options: Backend options (temperature, max_tokens, response_format, ...)
+
+        Returns:
+            str: Generated text
+        """
+        tags = {"feature": feature, "model": options.get("model")}
+        key = None
+        if use_cache and self.cache_size:
+            key = self._cache_key(messages, options)
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    cached = self._cache[key]
+                else:
+                    cached = None
+            if cached is not None:
+                self._record(0.0, cache_hit=True, **tags)
+                return cached
+
+        start = time.perf_counter()
+        try:
+            text, usage = self._complete(messages, **options)
+        except Exception as e:
+            self._record((time.perf_counter() - start) * 1000, error=e, **tags)
+            raise
+        self._record((time.perf_counter() - start) * 1000, usage=usage, **tags)
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = text
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return text
+
+    def complete_batch(self, requests, max_workers=DEFAULT_MAX_WORKERS, use_cache=False, feature=None):
+        """
+        Get many chat completions concurrently
+
+        Args:
+            requests (list): Dictionaries with "messages" and optional backend options
+            max_workers (int, optional): Maximum number of concurrent calls
+            use_cache (bool, optional): Whether to reuse responses to identical requests
+            feature (str, optional): Application feature making the calls, used in telemetry
+
+        Returns:
+            list: Generated texts, in the same order as the requests (None for failed calls)
+        """
+        def run(request):
+            options = {k: v for k, v in request.items() if k != "messages"}
+            try:
+                return self.complete(request["messages"], use_cache=use_cache, feature=feature, **options)
+            except Exception:
+                return None
+
+        if len(requests) <= 1 or max_workers <= 1:
+            return [run(request) for request in requests]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as executor:
+            return list(executor.map(run, requests))
+
+    def get_metrics(self):
+        """
+        Get a snapshot of the backend metrics
+
+        Returns:
+            dict: Metrics with the average latency of the calls
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics["backend"] = self.name
+        metrics["avg_latency_ms"] = round(metrics["total_latency_ms"] / metrics["calls"], 2) if metrics["calls"] else 0.0
+        return metrics
+
+class RuleEngineBackend(LLMBackend):
+    """
+    Deterministic backend that answers from keyword rules
+
+    Each rule is a (keywords, responses) tuple, where responses maps a language
+    to the answer text. The first rule with a keyword contained in the last
+    user message wins; otherwise `default` is called with (prompt, language).
+    """
+    name = "rules"
+
+    def __init__(self, rules, default, cache_size=0):
+        super().__init__(cache_size=cache_size)
+        self.rules = [(tuple(k.lower() for k in keywords), responses) for keywords, responses in rules]
+        self.default = default
+
+    def _complete(self, messages, language="english", **options):
+        prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        lower_prompt = prompt.lower()
+
+        for keywords, responses in self.rules:
+            if any(keyword in lower_prompt for keyword in keywords):
+                text = responses.get(language) or next(iter(responses.values()))
+                break
+        else:
+            text = self.default(prompt, language)
+
+        return text, {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+
+class HTTPChatBackend(LLMBackend):
+    """
+    Backend for any server exposing the OpenAI chat completions HTTP API
+
+    Works with local servers (llama.cpp, vLLM, Ollama, the stand-in server
+    below) and hosted OpenAI-compatible APIs. A single pooled HTTP session is
+    reused for all calls.
+    """
+    name = "http"
+
+    def __init__(self, base_url, model, api_key=None, timeout=60, pool_size=DEFAULT_MAX_WORKERS, cache_size=DEFAULT_CACHE_SIZE):
+        super().__init__(cache_size=cache_size)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _complete(self, messages, model=None, language=None, **options):
+        # `language` è usato solo dal motore a regole: per i modelli va indicato nel prompt
+        payload = {"model": model or self.model, "messages": messages}
+        payload.update({k: v for k, v in options.items() if v is not None})
+
+        response = self.session.post(f"{self.base_url}/chat/completions", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+
+        return data["choices"][0]["message"]["content"], data.get("usage") or {}
+
+class OpenAIBackend(LLMBackend):
+    """Backend using the official OpenAI client, created once and reused"""
+    name = "openai"
+
+    def __init__(self, api_key, model="gpt-4o", base_url=None, cache_size=DEFAULT_CACHE_SIZE):
+        super().__init__(cache_size=cache_size)
+        from openai import OpenAI
+
+        self.model = model
+        self.client = OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
+
+    def _complete(self, messages, model=None, language=None, **options):
+        response = self.client.chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            **{k: v for k, v in options.items() if v is not None}
+        )
+
+        usage = {}
+        if response.usage:
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens
+            }
+
+        return response.choices[0].message.content, usage
+
+# Istanze condivise: riutilizzate per mantenere pool di connessioni, cache e metriche
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_shared_backend(key, factory):
+    """
+    Get a process-wide backend instance, creating it on first use
+
+    Args:
+        key (str): Unique key of the backend configuration
+        factory (callable): Function that creates the backend
+
+    Returns:
+        LLMBackend: Shared backend instance
+    """
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = factory()
+        return _backends[key]
+
+def get_all_backend_metrics():
+    """
+    Get the metrics of every shared backend
+
+    Returns:
+        list: Metrics dictionaries, one per backend
+    """
+    with _backends_lock:
+        backends = list(_backends.items())
+    return [dict(backend.get_metrics(), key=key) for key, backend in backends]
+
+def create_backend_from_env(prefix, default_model, fallback=None):
+    """
+    Create the backend configured through environment variables
+
+    `<prefix>_API_URL` selects an OpenAI-compatible HTTP server (e.g. a local
+    model), otherwise `<prefix>_API_KEY` selects the OpenAI client. If neither
+    is set, `fallback` is used.
+
+    Args:
+        prefix (str): Environment variable prefix, e.g. "OPENAI" or "LLAMA"
+        default_model (str): Model to use if `<prefix>_MODEL` is not set
+        fallback (callable, optional): Factory for the backend to use without configuration
+
+    Returns:
+        LLMBackend: Shared backend instance, or None if nothing is configured
+    """
+    api_url = os.environ.get(f"{prefix}_API_URL")
+    api_key = os.environ.get(f"{prefix}_API_KEY")
+    model = os.environ.get(f"{prefix}_MODEL", default_model)
+
+    if api_url:
+        return get_shared_backend(f"http:{api_url}:{model}", lambda: HTTPChatBackend(api_url, model, api_key=api_key))
+    if api_key:
+        return get_shared_backend(f"openai:{model}:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}",
+                                  lambda: OpenAIBackend(api_key, model=model))
+    if fallback:
+        return get_shared_backend(f"fallback:{prefix}", fallback)
+    return None
+
+def run_stand_in_server(backend, host="127.0.0.1", port=8765):
+    """
+    Serve a backend through a local OpenAI-compatible HTTP endpoint
+
+    Useful to exercise HTTPChatBackend offline, e.g. with the rule engine.
+    Blocks until interrupted.
+
+    Args:
+        backend (LLMBackend): Backend answering the requests
+        host (str): Host to listen on
+        port (int): Port to listen on
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            options = {k: v for k, v in request.items() if k not in ("messages", "model", "temperature", "max_tokens", "response_format")}
+            text = backend.complete(request.get("messages", []), **options)
+
+            body = json.dumps({
+                "object": "chat.completion",
+                "model": request.get("model", backend.name),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(text) // 4}
+            }).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer((host, port), Handler).serve_forever()
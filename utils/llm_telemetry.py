@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from utils.database import get_db_session, LLMCallSample
+from utils.llm_backends import add_call_listener
+
+# Prezzi in USD per 1.000 token (input, output); i modelli locali non hanno costo
+MODEL_PRICING = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Estimate the cost of a model call
+
+    Args:
+        model (str): Name of the model
+        prompt_tokens (int): Input tokens
+        completion_tokens (int): Output tokens
+
+    Returns:
+        float: Estimated cost in USD
+    """
+    # Le versioni datate (es. gpt-4o-2024-08-06) usano il prezzo del modello base
+    name = (model or "").lower()
+    prices = MODEL_PRICING.get(name)
+    if prices is None:
+        matches = [key for key in MODEL_PRICING if name.startswith(key)]
+        prices = MODEL_PRICING[max(matches, key=len)] if matches else (0.0, 0.0)
+
+    return (prompt_tokens or 0) / 1000 * prices[0] + (completion_tokens or 0) / 1000 * prices[1]
+
+def record_llm_call(sample):
+    """
+    Save a model call sample in the database
+
+    Args:
+        sample (dict): Sample produced by the LLM backend after each call
+    """
+    session = get_db_session()
+    try:
+        session.add(LLMCallSample(
+            timestamp=datetime.fromtimestamp(sample["timestamp"]),
+            feature=sample.get("feature") or "other",
+            backend=sample.get("backend"),
+            model=sample.get("model"),
+            latency_ms=sample.get("latency_ms", 0.0),
+            prompt_tokens=sample.get("prompt_tokens", 0),
+            completion_tokens=sample.get("completion_tokens", 0),
+            cost=0.0 if sample.get("cache_hit") else estimate_cost(
+                sample.get("model"), sample.get("prompt_tokens"), sample.get("completion_tokens")
+            ),
+            cache_hit=bool(sample.get("cache_hit")),
+            error=sample.get("error")
+        ))
+        session.commit()
+    finally:
+        session.close()
+
+def enable_llm_telemetry():
+    """Start saving a sample for every model call (can be called more than once)"""
+    add_call_listener(record_llm_call)
+
+def load_llm_samples(days=30):
+    """
+    Load the model call samples of the last days
+
+    Args:
+        days (int): Number of days to include
+
+    Returns:
+        pandas.DataFrame: One row per call
+    """
+    since = datetime.now() - timedelta(days=days)
+    session = get_db_session()
+    query = session.query(
+        LLMCallSample.timestamp, LLMCallSample.feature, LLMCallSample.model,
+        LLMCallSample.latency_ms, LLMCallSample.prompt_tokens, LLMCallSample.completion_tokens,
+        LLMCallSample.cost, LLMCallSample.cache_hit, LLMCallSample.error
+    ).filter(LLMCallSample.timestamp >= since)
+    df = pd.read_sql(query.statement, session.bind)
+    session.close()
+    return df
+
+def get_feature_summary(days=30):
+    """
+    Get latency, token and cost statistics per feature
+
+    Latency percentiles only consider real calls, cache hits are counted apart.
+
+    Args:
+        days (int): Number of days to include
+
+    Returns:
+        pandas.DataFrame: One row per feature
+    """
+    df = load_llm_samples(days)
+    if df.empty:
+        return pd.DataFrame()
+
+    calls = df[~df["cache_hit"].astype(bool)]
+    grouped = calls.groupby("feature")
+
+    summary = pd.DataFrame({
+        "Chiamate": grouped.size(),
+        "Errori": grouped["error"].count(),
+        "Latenza p50 (ms)": grouped["latency_ms"].quantile(0.5),
+        "Latenza p95 (ms)": grouped["latency_ms"].quantile(0.95),
+        "Token input": grouped["prompt_tokens"].sum(),
+        "Token output": grouped["completion_tokens"].sum(),
+        "Costo (USD)": grouped["cost"].sum()
+    })
+    summary["Cache hit"] = df[df["cache_hit"].astype(bool)].groupby("feature").size()
+
+    return summary.fillna(0).round(2).reset_index().rename(columns={"feature": "Funzionalità"})
+
+def get_daily_spend(days=30):
+    """
+    Get the estimated daily spend per feature
+
+    Args:
+        days (int): Number of days to include
+
+    Returns:
+        pandas.DataFrame: Days as rows, features as columns, costs in USD
+    """
+    df = load_llm_samples(days)
+    if df.empty:
+        return pd.DataFrame()
+
+    df["date"] = pd.to_datetime(df["timestamp"]).dt.date
+    return df.pivot_table(index="date", columns="feature", values="cost", aggfunc="sum", fill_value=0.0)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+from datetime import datetime
+from utils.database import get_db_session, MessageTemplate
+from utils.translation_memory import get_placeholders, fill_placeholders
+
+# Campi della prenotazione che possono essere usati come segnaposto nei template
+BOOKING_PLACEHOLDERS = ["guest_name", "checkin_date", "checkout_date", "nights", "guests", "total_price"]
+
+# Campi dell'immobile che influenzano il testo del template
+PROPERTY_TEMPLATE_FIELDS = ["name", "type", "address", "city", "check_in_instructions", "wifi_details", "amenities"]
+
+# Template predefiniti usati in modalità simulazione o se la generazione AI fallisce
+DEFAULT_TEMPLATES = {
+    "welcome": {
+        "italiano": "Gentile {guest_name}, grazie per aver scelto il nostro alloggio! Siamo lieti di darti il benvenuto e non vediamo l'ora di ospitarti.",
+        "english": "Dear {guest_name}, thank you for choosing our accommodation! We are pleased to welcome you and look forward to hosting you."
+    },
+    "check_in": {
+        "italiano": "Gentile {guest_name}, oggi è il giorno del tuo check-in! Puoi arrivare dalle 15:00 in poi. Ti aspettiamo all'indirizzo indicato.",
+        "english": "Dear {guest_name}, today is your check-in day! You can arrive from 3:00 PM onwards. We'll be waiting for you at the indicated address."
+    },
+    "check_out": {
+        "italiano": "Gentile {guest_name}, domani è previsto il check-out entro le 10:00. Ti ringraziamo per aver scelto il nostro alloggio!",
+        "english": "Dear {guest_name}, tomorrow is your check-out day by 10:00 AM. Thank you for choosing our accommodation!"
+    },
+    "reminder": {
+        "italiano": "Gentile {guest_name}, questo è un promemoria per la tua prenotazione. Se hai domande, non esitare a contattarci.",
+        "english": "Dear {guest_name}, this is a reminder about your booking. If you have any questions, feel free to contact us."
+    }
+}
+
+# Cache in memoria dei template già caricati, per evitare query ripetute nei rerun
+_template_cache = {}
+
+def get_default_template(message_type, language="italiano"):
+    """
+    Get the built-in template for a message type
+
+    Args:
+        message_type (str): Type of message (welcome, check_in, check_out, etc.)
+        language (str): Language of the template
+
+    Returns:
+        str: Template with booking placeholders
+    """
+    lang = language.lower()
+    if lang not in ["italiano", "english"]:
+        lang = "italiano"  # Default to Italian
+
+    return DEFAULT_TEMPLATES.get(message_type, DEFAULT_TEMPLATES["welcome"])[lang]
+
+def get_property_fingerprint(property_data):
+    """
+    Get a fingerprint of the property fields that affect message templates
+
+    Args:
+        property_data (dict): Property information
+
+    Returns:
+        str: SHA-256 hash of the relevant property fields
+    """
+    relevant = {field: (property_data or {}).get(field) for field in PROPERTY_TEMPLATE_FIELDS}
+    payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_valid_template(template):
+    """
+    Check that a generated template only uses known booking placeholders
+
+    Args:
+        template (str): Template to validate
+
+    Returns:
+        bool: True if the template can be filled locally
+    """
+    placeholders = get_placeholders(template)
+    return "guest_name" in placeholders and placeholders.issubset(BOOKING_PLACEHOLDERS)
+
+def get_stored_template(property_id, message_type, language, property_hash):
+    """
+    Get a compiled template if it is still valid for the current property data
+
+    Args:
+        property_id (str): ID of the property
+        message_type (str): Type of message
+        language (str): Language of the template
+        property_hash (str): Current property fingerprint
+
+    Returns:
+        str: Template text, or None if missing or outdated
+    """
+    key = (property_id, message_type, language.lower())
+    cached = _template_cache.get(key)
+    if cached and cached[0] == property_hash:
+        return cached[1]
+
+    session = get_db_session()
+    entry = session.query(MessageTemplate).filter(
+        MessageTemplate.property_id == property_id,
+        MessageTemplate.message_type == message_type,
+        MessageTemplate.language == language.lower()
+    ).first()
+    result = entry.template_text if entry and entry.property_hash == property_hash else None
+    session.close()
+
+    if result is not None:
+        _template_cache[key] = (property_hash, result)
+
+    return result
+
+def store_template(property_id, message_type, language, property_hash, template_text):
+    """
+    Save a compiled template, replacing the one generated for older property data
+
+    Args:
+        property_id (str): ID of the property
+        message_type (str): Type of message
+        language (str): Language of the template
+        property_hash (str): Property fingerprint used to generate the template
+        template_text (str): Template with booking placeholders
+    """
+    session = get_db_session()
+    entry = session.query(MessageTemplate).filter(
+        MessageTemplate.property_id == property_id,
+        MessageTemplate.message_type == message_type,
+        MessageTemplate.language == language.lower()
+    ).first()
+
+    if entry:
+        entry.property_hash = property_hash
+        entry.template_text = template_text
+        entry.created_at = datetime.now()
+    else:
+        session.add(MessageTemplate(
+            property_id=property_id,
+            message_type=message_type,
+            language=language.lower(),
+            property_hash=property_hash,
+            template_text=template_text
+        ))
+
+    session.commit()
+    session.close()
+
+    _template_cache[(property_id, message_type, language.lower())] = (property_hash, template_text)
+
+def format_template_date(value):
+    """Format a booking date as DD/MM/YYYY, leaving unparsable values untouched"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value).date()
+        except ValueError:
+            return value
+    return value.strftime("%d/%m/%Y") if value else ""
+
+def get_booking_values(booking_data, guest_name=None):
+    """
+    Get the placeholder values for a booking
+
+    Args:
+        booking_data (dict): Booking information
+        guest_name (str, optional): Guest name, overrides the booking one
+
+    Returns:
+        dict: Values for the booking placeholders
+    """
+    booking_data = booking_data or {}
+
+    nights = booking_data.get("nights")
+    if nights is None:
+        try:
+            checkin = datetime.fromisoformat(str(booking_data.get("checkin_date"))).date()
+            checkout = datetime.fromisoformat(str(booking_data.get("checkout_date"))).date()
+            nights = (checkout - checkin).days
+        except ValueError:
+            nights = ""
+
+    total_price = booking_data.get("total_price")
+
+    return {
+        "guest_name": guest_name or booking_data.get("guest_name", "Ospite"),
+        "checkin_date": format_template_date(booking_data.get("checkin_date")),
+        "checkout_date": format_template_date(booking_data.get("checkout_date")),
+        "nights": nights,
+        "guests": booking_data.get("guests", 1),
+        "total_price": f"€{total_price:.2f}" if isinstance(total_price, (int, float)) else ""
+    }
+
+def render_message(template, booking_data, guest_name=None):
+    """
+    Fill a compiled template with the data of a booking
+
+    Args:
+        template (str): Template with booking placeholders
+        booking_data (dict): Booking information
+        guest_name (str, optional): Guest name, overrides the booking one
+
+    Returns:
+        str: Message ready to be sent
+    """
+    return fill_placeholders(template, get_booking_values(booking_data, guest_name))
@@ -3,11 +3,17 @@ from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm, mm
-from reportlab.platypus.flowables import KeepTogether
+from reportlab.lib.units import cm, mm, inch
+from reportlab.platypus.flowables import KeepTogether, Flowable
+from reportlab.lib.utils import ImageReader
+from PIL import Image as PILImage
 from io import BytesIO
 from datetime import datetime
 import os
+import threading
+import pandas as pd
+from utils.booking_facts import get_booking_facts
+from utils.fiscal_ledger import estimate_fiscal_amounts, COMMISSION_RATE, DEFAULT_VAT_RATE
 
 def create_logo():
     """Crea un'immagine di logo semplice se non esiste"""
@@ -20,6 +26,121 @@ def create_logo():
     # Altrimenti, torniamo None (verrà usato solo testo)
     return None
 
+# Dimensioni del logo nei documenti e risoluzione a cui viene incorporato
+LOGO_WIDTH = 5*cm
+LOGO_HEIGHT = 2*cm
+LOGO_DPI = 200
+
+# Stili delle tabelle comuni a tutti i documenti
+GRID_TABLE_COMMANDS = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+]
+
+# Righe per tabella nei report lunghi: ogni blocco sta in una pagina A4 e ripete l'intestazione
+FINANCIAL_TABLE_ROWS = 40
+
+class LogoFlowable(Flowable):
+    """Draw a logo decoded once, instead of reading and decoding the file for every document"""
+    
+    def __init__(self, reader, width, height):
+        Flowable.__init__(self)
+        self.reader = reader
+        self.width = width
+        self.height = height
+        self.hAlign = 'CENTER'
+    
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+    
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask='auto')
+
+class PDFRenderContext:
+    """
+    Styles, logo and table styles shared by every PDF generated in the process
+    
+    Building the stylesheet and decoding the logo is done once instead of
+    once per document, which matters when invoices or confirmations are
+    generated in bulk.
+    """
+    
+    def __init__(self, logo_path=None):
+        # Stili
+        self.styles = getSampleStyleSheet()
+        self.styles.add(ParagraphStyle(name='Justify', alignment=1))
+        self.styles.add(ParagraphStyle(name='Center', alignment=1))
+        self.styles.add(ParagraphStyle(name='Right', alignment=2))
+        self.styles.add(ParagraphStyle(name='LeftIndent', leftIndent=20))
+        
+        # Tabelle con intestazione e griglia: numeri allineati a destra dalla seconda colonna o solo nell'ultima
+        self.grid_table_style = TableStyle(GRID_TABLE_COMMANDS + [('ALIGN', (1, 1), (-1, -1), 'RIGHT')])
+        self.list_table_style = TableStyle(GRID_TABLE_COMMANDS + [('ALIGN', (-1, 1), (-1, -1), 'RIGHT')])
+        
+        # Tabelle etichetta/valore
+        self.details_table_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ])
+        
+        # Riepiloghi con la riga del totale in grassetto
+        self.summary_table_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+            ('LINEBELOW', (0, -1), (-1, -1), 1, colors.black),
+        ])
+        
+        # Logo decodificato una volta sola e ridotto alla risoluzione di stampa: ogni documento
+        # incorpora la stessa immagine, più piccola, invece di rileggere e ricomprimere l'originale
+        self.logo = None
+        logo_path = logo_path or create_logo()
+        if logo_path:
+            try:
+                with PILImage.open(logo_path) as image:
+                    image.load()
+                    size = (round(LOGO_WIDTH / inch * LOGO_DPI), round(LOGO_HEIGHT / inch * LOGO_DPI))
+                    if image.width > size[0] or image.height > size[1]:
+                        image = image.resize(size, PILImage.LANCZOS)
+                    self.logo = ImageReader(image)
+                    self.logo.getRGBData()
+            except Exception:
+                # Se c'è un errore con l'immagine, usiamo solo il testo
+                self.logo = None
+    
+    def logo_flowable(self):
+        """Get the document header: the logo, or the CiaoHost title if there is no logo"""
+        if self.logo is not None:
+            return LogoFlowable(self.logo, LOGO_WIDTH, LOGO_HEIGHT)
+        return Paragraph("<b>CiaoHost</b>", self.styles['Title'])
+
+_render_context = None
+_render_context_lock = threading.Lock()
+
+def get_render_context():
+    """Get the rendering context of the process, building it on first use"""
+    global _render_context
+    if _render_context is None:
+        with _render_context_lock:
+            if _render_context is None:
+                _render_context = PDFRenderContext()
+    return _render_context
+
+def reset_render_context():
+    """Discard the rendering context, e.g. after the logo file has changed"""
+    global _render_context
+    with _render_context_lock:
+        _render_context = None
+
 def create_invoice_pdf(invoice_data, booking_data, property_data):
     """
     Crea un PDF per una fattura
@@ -40,23 +161,12 @@ def create_invoice_pdf(invoice_data, booking_data, property_data):
     # Contenuto del documento
     content = []
     
-    # Stili
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=1))
-    styles.add(ParagraphStyle(name='Center', alignment=1))
-    styles.add(ParagraphStyle(name='Right', alignment=2))
-    styles.add(ParagraphStyle(name='LeftIndent', leftIndent=20))
+    # Stili e logo condivisi tra i documenti
+    context = get_render_context()
+    styles = context.styles
     
     # Logo
-    logo_path = create_logo()
-    if logo_path:
-        try:
-            content.append(Image(logo_path, width=5*cm, height=2*cm))
-        except:
-            # Se c'è un errore con l'immagine, usiamo solo il testo
-            content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
-    else:
-        content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
+    content.append(context.logo_flowable())
     
     content.append(Spacer(1, 12))
     
@@ -97,16 +207,7 @@ def create_invoice_pdf(invoice_data, booking_data, property_data):
     imponibile = invoice_data.get('amount') - invoice_data.get('tax_amount')
     
     table = Table(data, colWidths=[doc.width*0.4, doc.width*0.2, doc.width*0.2, doc.width*0.2])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-    ]))
+    table.setStyle(context.grid_table_style)
     
     content.append(table)
     content.append(Spacer(1, 12))
@@ -119,13 +220,7 @@ def create_invoice_pdf(invoice_data, booking_data, property_data):
     ]
     
     summary_table = Table(summary_data, colWidths=[doc.width*0.7, doc.width*0.3])
-    summary_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ('LINEBELOW', (0, -1), (-1, -1), 1, colors.black),
-    ]))
+    summary_table.setStyle(context.summary_table_style)
     
     content.append(summary_table)
     content.append(Spacer(1, 12))
@@ -171,21 +266,12 @@ def create_booking_confirmation_pdf(booking_data, property_data):
     # Contenuto del documento
     content = []
     
-    # Stili
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=1))
-    styles.add(ParagraphStyle(name='Center', alignment=1))
-    styles.add(ParagraphStyle(name='LeftIndent', leftIndent=20))
+    # Stili e logo condivisi tra i documenti
+    context = get_render_context()
+    styles = context.styles
     
     # Logo
-    logo_path = create_logo()
-    if logo_path:
-        try:
-            content.append(Image(logo_path, width=5*cm, height=2*cm))
-        except:
-            content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
-    else:
-        content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
+    content.append(context.logo_flowable())
     
     content.append(Spacer(1, 12))
     
@@ -220,12 +306,7 @@ def create_booking_confirmation_pdf(booking_data, property_data):
     ]
     
     details_table = Table(details_data, colWidths=[doc.width*0.3, doc.width*0.7])
-    details_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-    ]))
+    details_table.setStyle(context.details_table_style)
     
     content.append(details_table)
     content.append(Spacer(1, 12))
@@ -295,21 +376,12 @@ def create_property_report_pdf(property_data, bookings_data=None, period=None):
     # Contenuto del documento
     content = []
     
-    # Stili
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=1))
-    styles.add(ParagraphStyle(name='Center', alignment=1))
-    styles.add(ParagraphStyle(name='LeftIndent', leftIndent=20))
+    # Stili e logo condivisi tra i documenti
+    context = get_render_context()
+    styles = context.styles
     
     # Logo
-    logo_path = create_logo()
-    if logo_path:
-        try:
-            content.append(Image(logo_path, width=5*cm, height=2*cm))
-        except:
-            content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
-    else:
-        content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
+    content.append(context.logo_flowable())
     
     content.append(Spacer(1, 12))
     
@@ -339,12 +411,7 @@ def create_property_report_pdf(property_data, bookings_data=None, period=None):
     ]
     
     property_table = Table(property_details, colWidths=[doc.width*0.3, doc.width*0.7])
-    property_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-    ]))
+    property_table.setStyle(context.details_table_style)
     
     content.append(property_table)
     content.append(Spacer(1, 12))
@@ -392,16 +459,7 @@ def create_property_report_pdf(property_data, bookings_data=None, period=None):
             
             # Creazione tabella
             bookings_table = Table(bookings_table_data, colWidths=[doc.width*0.2, doc.width*0.2, doc.width*0.25, doc.width*0.15, doc.width*0.2])
-            bookings_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
-            ]))
+            bookings_table.setStyle(context.list_table_style)
             
             content.append(bookings_table)
             
@@ -434,214 +492,265 @@ def create_property_report_pdf(property_data, bookings_data=None, period=None):
     buffer.seek(0)
     return buffer
 
-def create_financial_report_pdf(bookings_data, period=None, properties_data=None):
+def aggregate_financial_report(bookings_data, period=None, properties_data=None):
+    """
+    Compute the figures of the financial report in one vectorized pass over the booking facts
+    
+    Args:
+        bookings_data (list): Booking dictionaries
+        period (dict, optional): 'start_date' and 'end_date' as YYYY-MM-DD strings
+        properties_data (list, optional): Property dictionaries, for names and occupancy
+        
+    Returns:
+        dict: Totals, per-property rows and the bookings of the period sorted by check-in
+    """
+    facts = get_booking_facts(bookings_data, properties_data)
+    
+    start_date = end_date = None
+    if period and period.get('start_date') and period.get('end_date'):
+        start_date = pd.Timestamp(period.get('start_date'))
+        end_date = pd.Timestamp(period.get('end_date'))
+    
+    # Prenotazioni che si sovrappongono al periodo (check-in prima della fine, check-out dopo l'inizio)
+    if facts.empty:
+        bookings = facts
+    elif start_date is not None:
+        mask = (facts['checkin_date'] <= end_date) & (facts['checkout_date'] >= start_date)
+        bookings = facts[mask.to_numpy()]
+    else:
+        bookings = facts
+    
+    total_price = bookings['total_price'].fillna(0) if 'total_price' in bookings.columns else pd.Series(0.0, index=bookings.index)
+    cleaning_fee = bookings['cleaning_fee'].fillna(0) if 'cleaning_fee' in bookings.columns else pd.Series(0.0, index=bookings.index)
+    
+    # Calcola il ricavo netto (ricavo - tasse e commissioni stimate)
+    total_revenue = float(total_price.sum())
+    _, tax_amount, commissions = estimate_fiscal_amounts(total_revenue)
+    
+    summary = {
+        "total_bookings": len(bookings),
+        "total_revenue": total_revenue,
+        "total_cleaning_fees": float(cleaning_fee.sum()),
+        "commissions": commissions,
+        "tax_amount": tax_amount,
+        "net_revenue": total_revenue - commissions - tax_amount
+    }
+    
+    # Ricavi e occupazione per immobile, nell'ordine in cui gli immobili compaiono nelle prenotazioni
+    property_rows = []
+    if properties_data and not bookings.empty:
+        by_property = pd.DataFrame({
+            "property_id": bookings['property_id'].to_numpy() if 'property_id' in bookings.columns else None,
+            "revenue": total_price.to_numpy()
+        })
+        if start_date is not None:
+            # Giorni di ogni prenotazione che cadono nel periodo, estremi inclusi
+            booking_start = bookings['checkin_date'].where(bookings['checkin_date'] > start_date, start_date)
+            booking_end = bookings['checkout_date'].where(bookings['checkout_date'] < end_date, end_date)
+            by_property["occupied_days"] = ((booking_end - booking_start).dt.days + 1).clip(lower=0).to_numpy()
+        
+        grouped = by_property.groupby("property_id", sort=False, dropna=False)
+        totals = grouped.agg(bookings=("revenue", "size"), revenue=("revenue", "sum"))
+        if start_date is not None:
+            total_days = (end_date - start_date).days + 1
+            totals["occupancy"] = grouped["occupied_days"].sum() / total_days * 100
+        
+        property_names = {p.get('id'): p.get('name', 'Sconosciuto') for p in properties_data}
+        for property_id, row in totals.iterrows():
+            property_rows.append({
+                "name": property_names.get(property_id, 'Sconosciuto'),
+                "bookings": int(row["bookings"]),
+                "revenue": float(row["revenue"]),
+                "occupancy": float(row["occupancy"]) if start_date is not None else None
+            })
+    
+    if not bookings.empty:
+        bookings = bookings.sort_values('checkin_date', kind='stable')
+    
+    return {"summary": summary, "properties": property_rows, "bookings": bookings}
+
+class FlowableStream:
+    """
+    List-like queue of flowables, filled from an iterator while the document is built
+    
+    SimpleDocTemplate.build only looks at the front of its flowable list, so
+    tables generated on demand are laid out and released one chunk at a time
+    instead of all being held in memory before the first page is drawn.
+    """
+    
+    # Flowable successivi mantenuti pronti, per keepWithNext dei titoli
+    LOOKAHEAD = 2
+    
+    def __init__(self, flowables):
+        self._source = iter(flowables)
+        self._buffer = []
+    
+    def _fill(self, count):
+        while self._source is not None and len(self._buffer) < count:
+            try:
+                self._buffer.append(next(self._source))
+            except StopIteration:
+                self._source = None
+    
+    def __len__(self):
+        self._fill(self.LOOKAHEAD)
+        return len(self._buffer)
+    
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            self._fill(index + 1)
+        return self._buffer[index]
+    
+    def __setitem__(self, index, value):
+        self._buffer[index] = value
+    
+    def __delitem__(self, index):
+        del self._buffer[index]
+    
+    def insert(self, index, value):
+        self._buffer.insert(index, value)
+
+def _chunked_tables(header, rows, col_widths, style, rows_per_table=FINANCIAL_TABLE_ROWS):
+    """
+    Yield a long table as page-sized tables, each repeating the header
+    
+    Args:
+        header (list): Header row
+        rows (iterable): Table rows, consumed lazily
+        col_widths (list): Column widths
+        style (TableStyle): Table style
+        rows_per_table (int): Rows in each chunk
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == rows_per_table:
+            yield _table_chunk(header, chunk, col_widths, style)
+            chunk = []
+    if chunk:
+        yield _table_chunk(header, chunk, col_widths, style)
+
+def _table_chunk(header, rows, col_widths, style):
+    table = Table([header] + rows, colWidths=col_widths, repeatRows=1)
+    table.setStyle(style)
+    return table
+
+def _booking_rows(bookings):
+    """Yield the rows of the booking list, formatting one chunk of the facts at a time"""
+    for start in range(0, len(bookings), FINANCIAL_TABLE_ROWS):
+        chunk = bookings.iloc[start:start + FINANCIAL_TABLE_ROWS]
+        checkin = chunk['checkin_date'].dt.strftime('%Y-%m-%d').fillna('')
+        names = chunk['name'] if 'name' in chunk.columns else pd.Series(None, index=chunk.index, dtype=object)
+        names = names.astype(object).where(names.notna(), 'Sconosciuto')
+        guests = chunk['guest_name'] if 'guest_name' in chunk.columns else pd.Series('', index=chunk.index)
+        statuses = chunk['status'] if 'status' in chunk.columns else pd.Series('', index=chunk.index)
+        totals = chunk['total_price'].fillna(0) if 'total_price' in chunk.columns else pd.Series(0.0, index=chunk.index)
+        
+        for row in zip(checkin, names, guests.astype(object).fillna(''), statuses.astype(object).fillna(''), totals):
+            yield [row[0], row[1], row[2], row[3], f"€{row[4]:.2f}"]
+
+def create_financial_report_pdf(bookings_data, period=None, properties_data=None, output=None):
     """
     Crea un report finanziario in PDF
     
+    I totali sono calcolati in un solo passaggio vettoriale sulla tabella delle
+    prenotazioni e le tabelle lunghe vengono generate a blocchi di una pagina
+    durante l'impaginazione, così anche report su molti anni e molti immobili
+    occupano una quantità di memoria limitata.
+    
     Args:
         bookings_data: Lista di prenotazioni
         period: Dizionario con 'start_date' e 'end_date' per filtrare le prenotazioni
         properties_data: Lista di dati delle proprietà per riferimento
+        output: Percorso del file o stream in cui scrivere il PDF (default: un nuovo BytesIO)
         
     Returns:
-        BytesIO: PDF come oggetto BytesIO
+        BytesIO: PDF come oggetto BytesIO, oppure output se specificato
     """
-    buffer = BytesIO()
+    buffer = BytesIO() if output is None else output
     doc = SimpleDocTemplate(buffer, pagesize=A4, 
                           rightMargin=20*mm, leftMargin=20*mm,
-                          topMargin=20*mm, bottomMargin=20*mm)
+                          topMargin=20*mm, bottomMargin=20*mm,
+                          pageCompression=1)
     
-    # Contenuto del documento
-    content = []
+    report = aggregate_financial_report(bookings_data, period, properties_data)
     
-    # Stili
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=1))
-    styles.add(ParagraphStyle(name='Center', alignment=1))
-    styles.add(ParagraphStyle(name='LeftIndent', leftIndent=20))
+    doc.build(FlowableStream(_financial_report_content(doc, report, period, properties_data)))
+    if output is None:
+        buffer.seek(0)
+    return buffer
+
+def _financial_report_content(doc, report, period, properties_data):
+    """Yield the flowables of the financial report in document order"""
+    # Stili e logo condivisi tra i documenti
+    context = get_render_context()
+    styles = context.styles
     
     # Logo
-    logo_path = create_logo()
-    if logo_path:
-        try:
-            content.append(Image(logo_path, width=5*cm, height=2*cm))
-        except:
-            content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
-    else:
-        content.append(Paragraph("<b>CiaoHost</b>", styles['Title']))
+    yield context.logo_flowable()
     
-    content.append(Spacer(1, 12))
+    yield Spacer(1, 12)
     
     # Intestazione report
-    content.append(Paragraph("<b>REPORT FINANZIARIO</b>", styles['Title']))
+    yield Paragraph("<b>REPORT FINANZIARIO</b>", styles['Title'])
     
     # Periodo del report
     if period:
-        content.append(Paragraph(f"Periodo: dal {period.get('start_date')} al {period.get('end_date')}", styles['Normal']))
-    
-    content.append(Paragraph(f"Data report: {datetime.now().strftime('%d/%m/%Y')}", styles['Normal']))
-    content.append(Spacer(1, 12))
+        yield Paragraph(f"Periodo: dal {period.get('start_date')} al {period.get('end_date')}", styles['Normal'])
     
-    # Filtriamo le prenotazioni se è specificato un periodo
-    filtered_bookings = bookings_data
-    if period and period.get('start_date') and period.get('end_date'):
-        start_date = datetime.strptime(period.get('start_date'), '%Y-%m-%d').date()
-        end_date = datetime.strptime(period.get('end_date'), '%Y-%m-%d').date()
-        filtered_bookings = [
-            b for b in bookings_data 
-            if (datetime.strptime(b.get('checkin_date'), '%Y-%m-%d').date() <= end_date and
-                datetime.strptime(b.get('checkout_date'), '%Y-%m-%d').date() >= start_date)
-        ]
+    yield Paragraph(f"Data report: {datetime.now().strftime('%d/%m/%Y')}", styles['Normal'])
+    yield Spacer(1, 12)
     
     # Riepilogo finanziario
-    total_revenue = sum(b.get('total_price', 0) for b in filtered_bookings)
-    total_cleaning_fees = sum(b.get('cleaning_fee', 0) for b in filtered_bookings)
-    total_bookings = len(filtered_bookings)
-    
-    # Calcola il ricavo netto (ricavo - tasse e commissioni stimate)
-    commission_rate = 0.10  # 10% commissione
-    commissions = total_revenue * commission_rate
-    tax_rate = 0.22  # 22% IVA
-    tax_amount = total_revenue / (1 + tax_rate) * tax_rate
-    net_revenue = total_revenue - commissions - tax_amount
-    
-    content.append(Paragraph("<b>Riepilogo Finanziario:</b>", styles['Heading3']))
+    summary = report["summary"]
+    yield Paragraph("<b>Riepilogo Finanziario:</b>", styles['Heading3'])
     
     financial_data = [
-        ["Prenotazioni Totali:", str(total_bookings)],
-        ["Ricavo Lordo:", f"€{total_revenue:.2f}"],
-        ["Commissioni (10%):", f"€{commissions:.2f}"],
-        ["IVA (22%):", f"€{tax_amount:.2f}"],
-        ["Ricavo Netto:", f"€{net_revenue:.2f}"]
+        ["Prenotazioni Totali:", str(summary["total_bookings"])],
+        ["Ricavo Lordo:", f"€{summary['total_revenue']:.2f}"],
+        [f"Commissioni ({COMMISSION_RATE:.0%}):", f"€{summary['commissions']:.2f}"],
+        [f"IVA ({DEFAULT_VAT_RATE:.0%}):", f"€{summary['tax_amount']:.2f}"],
+        ["Ricavo Netto:", f"€{summary['net_revenue']:.2f}"]
     ]
     
     financial_table = Table(financial_data, colWidths=[doc.width*0.7, doc.width*0.3])
-    financial_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ('LINEBELOW', (0, -1), (-1, -1), 1, colors.black),
-    ]))
-    
-    content.append(financial_table)
-    content.append(Spacer(1, 12))
+    financial_table.setStyle(context.summary_table_style)
+    
+    yield financial_table
+    yield Spacer(1, 12)
     
     # Dettaglio prenotazioni per immobile
     if properties_data:
-        content.append(Paragraph("<b>Dettaglio per Immobile:</b>", styles['Heading3']))
-        
-        # Raggruppa prenotazioni per immobile
-        bookings_by_property = {}
-        property_dict = {p.get('id'): p for p in properties_data}
-        
-        for booking in filtered_bookings:
-            property_id = booking.get('property_id')
-            if property_id not in bookings_by_property:
-                bookings_by_property[property_id] = []
-            bookings_by_property[property_id].append(booking)
-        
-        # Crea tabella con ricavi per immobile
-        property_revenue_data = [
-            ["Immobile", "Prenotazioni", "Ricavo", "Occupazione"]
-        ]
-        
-        for property_id, prop_bookings in bookings_by_property.items():
-            property_name = property_dict.get(property_id, {}).get('name', 'Sconosciuto')
-            property_revenue = sum(b.get('total_price', 0) for b in prop_bookings)
-            property_bookings = len(prop_bookings)
-            
-            # Calcolo occupazione (giorni occupati / giorni totali nel periodo)
-            # Semplificazione: contiamo i giorni di ogni prenotazione nel periodo
-            occupied_days = 0
-            if period:
-                start_date = datetime.strptime(period.get('start_date'), '%Y-%m-%d').date()
-                end_date = datetime.strptime(period.get('end_date'), '%Y-%m-%d').date()
-                total_days = (end_date - start_date).days + 1
-                
-                for booking in prop_bookings:
-                    booking_start = max(start_date, datetime.strptime(booking.get('checkin_date'), '%Y-%m-%d').date())
-                    booking_end = min(end_date, datetime.strptime(booking.get('checkout_date'), '%Y-%m-%d').date())
-                    booking_days = (booking_end - booking_start).days + 1
-                    occupied_days += max(0, booking_days)
-                
-                occupancy_rate = f"{(occupied_days / total_days * 100):.1f}%"
-            else:
-                occupancy_rate = "N/A"
-            
-            property_revenue_data.append([
-                property_name,
-                str(property_bookings),
-                f"€{property_revenue:.2f}",
-                occupancy_rate
-            ])
-        
-        property_revenue_table = Table(property_revenue_data, colWidths=[doc.width*0.4, doc.width*0.2, doc.width*0.2, doc.width*0.2])
-        property_revenue_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ]))
-        
-        content.append(property_revenue_table)
-        content.append(Spacer(1, 12))
-    
-    # Lista delle prenotazioni
-    content.append(Paragraph("<b>Dettaglio Prenotazioni:</b>", styles['Heading3']))
-    
-    if filtered_bookings:
-        bookings_table_data = [
-            ["Data", "Immobile", "Ospite", "Stato", "Totale"]
-        ]
+        yield Paragraph("<b>Dettaglio per Immobile:</b>", styles['Heading3'])
         
-        # Ottieni il nome dell'immobile dalla lista di proprietà
-        property_dict = {}
-        if properties_data:
-            property_dict = {p.get('id'): p.get('name') for p in properties_data}
-        
-        # Ordina le prenotazioni per data di check-in
-        sorted_bookings = sorted(filtered_bookings, key=lambda b: b.get('checkin_date', ''))
-        
-        for booking in sorted_bookings:
-            property_id = booking.get('property_id')
-            property_name = property_dict.get(property_id, 'Sconosciuto')
-            
-            bookings_table_data.append([
-                booking.get('checkin_date'),
-                property_name,
-                booking.get('guest_name'),
-                booking.get('status'),
-                f"€{booking.get('total_price', 0):.2f}"
-            ])
-        
-        bookings_table = Table(bookings_table_data, colWidths=[doc.width*0.15, doc.width*0.3, doc.width*0.2, doc.width*0.15, doc.width*0.2])
-        bookings_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
-        ]))
-        
-        content.append(bookings_table)
+        property_rows = (
+            [
+                row["name"],
+                str(row["bookings"]),
+                f"€{row['revenue']:.2f}",
+                f"{row['occupancy']:.1f}%" if row["occupancy"] is not None else "N/A"
+            ]
+            for row in report["properties"]
+        )
+        yield from _chunked_tables(
+            ["Immobile", "Prenotazioni", "Ricavo", "Occupazione"], property_rows,
+            [doc.width*0.4, doc.width*0.2, doc.width*0.2, doc.width*0.2], context.grid_table_style
+        )
+        yield Spacer(1, 12)
+    
+    # Lista delle prenotazioni, ordinate per data di check-in
+    yield Paragraph("<b>Dettaglio Prenotazioni:</b>", styles['Heading3'])
+    
+    bookings = report["bookings"]
+    if not bookings.empty:
+        yield from _chunked_tables(
+            ["Data", "Immobile", "Ospite", "Stato", "Totale"], _booking_rows(bookings),
+            [doc.width*0.15, doc.width*0.3, doc.width*0.2, doc.width*0.15, doc.width*0.2], context.list_table_style
+        )
     else:
-        content.append(Paragraph("Nessuna prenotazione nel periodo selezionato.", styles['Normal']))
+        yield Paragraph("Nessuna prenotazione nel periodo selezionato.", styles['Normal'])
     
-    content.append(Spacer(1, 24))
+    yield Spacer(1, 24)
     
     # Piè di pagina
-    content.append(Paragraph("Report generato automaticamente da CiaoHost.", styles['Italic']))
-    
-    # Assembla il documento
-    doc.build(content)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+    yield Paragraph("Report generato automaticamente da CiaoHost.", styles['Italic'])
@@ -0,0 +1,334 @@
+def _condition_values(values, filter_value):
+    """Evaluate one filter condition on a column"""
+    if isinstance(filter_value, tuple) and len(filter_value) == 2:
+        # Range filter for numeric columns
+        min_val, max_val = filter_value
+        condition = (values >= min_val) & (values <= max_val)
+    elif isinstance(filter_value, list):
+        # Multi-select filter for categorical columns
+        condition = values.isin(filter_value)
+    else:
+        # Simple equality filter
+        condition = values == filter_value
+
+    return condition.to_numpy(dtype=bool, na_value=False)
+
+def build_filter_mask(df, conditions):
+    """
+    Build one boolean mask for a list of filter conditions
+
+    Conditions on columns that are not in the dataframe are ignored, as in
+    filter_dataframe. Errors match filtering one condition at a time: once
+    no row is left the remaining conditions are not evaluated, and a
+    condition that fails on the whole column (e.g. a range on text) is
+    evaluated again on the rows kept so far only.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to filter
+        conditions (list): (column, value) pairs; a 2-tuple is a range, a list a multi-select
+
+    Returns:
+        numpy.ndarray: Boolean mask, or None if no condition applies
+    """
+    mask = None
+
+    for col, filter_value in conditions:
+        if col not in df.columns:
+            continue
+
+        if mask is not None and not mask.any():
+            break
+
+        values = df[col]
+        try:
+            condition = _condition_values(values, filter_value)
+        except TypeError:
+            if mask is None or mask.all():
+                raise
+            # Come nel filtro sequenziale, la condizione vale solo per le righe rimaste
+            condition = mask.copy()
+            condition[mask] = _condition_values(values[mask], filter_value)
+
+        mask = condition if mask is None else mask & condition
+
+    return mask
+
+def to_plan(transformations):
+    """
+    Normalize a list of transformations into plan steps
+
+    Filters become lists of (column, value) conditions so that they can be
+    split and fused; no-op steps are removed.
+
+    Args:
+        transformations (list): Transformations in the transform_dataframe format
+
+    Returns:
+        list: Plan steps
+    """
+    plan = []
+    for transform in transformations:
+        transform_type = transform.get('type')
+
+        if transform_type == 'filter':
+            conditions = list(transform.get('filters', {}).items())
+            if conditions:
+                plan.append({'type': 'filter', 'conditions': conditions})
+        elif transform_type == 'group_by':
+            if transform.get('columns') and transform.get('aggregations'):
+                plan.append(dict(transform))
+        elif transform_type == 'sort':
+            if transform.get('column'):
+                plan.append(dict(transform))
+        elif transform_type == 'select_columns':
+            if transform.get('columns'):
+                plan.append(dict(transform))
+        elif transform_type == 'rename_columns':
+            if transform.get('rename_map'):
+                plan.append(dict(transform))
+        elif transform_type == 'fillna':
+            if transform.get('column') and transform.get('value') is not None:
+                plan.append(dict(transform))
+
+    return plan
+
+def apply_schema(step, columns):
+    """
+    Get the columns after a plan step
+
+    Args:
+        step (dict): Plan step
+        columns (list): Columns before the step
+
+    Returns:
+        list: Columns after the step
+    """
+    step_type = step['type']
+
+    if step_type == 'select_columns':
+        return list(step['columns'])
+    if step_type == 'group_by':
+        return list(step['columns']) + [col for col in step['aggregations'] if col not in step['columns']]
+    if step_type == 'rename_columns':
+        return [step['rename_map'].get(col, col) for col in columns]
+    return list(columns)
+
+def _push_condition(step, col, columns_before):
+    """
+    Get the name of a filter column before a step, if the filter can move before it
+
+    Args:
+        step (dict): Step the filter would move before
+        col (str): Filter column after the step (present in the schema)
+        columns_before (list): Columns before the step
+
+    Returns:
+        tuple: (can_move, column name before the step)
+    """
+    step_type = step['type']
+
+    if step_type in ('sort', 'select_columns'):
+        return True, col
+    if step_type == 'rename_columns':
+        rename_map = step['rename_map']
+        return True, next(c for c in columns_before if rename_map.get(c, c) == col)
+    if step_type == 'group_by':
+        # Filtrare le chiavi del raggruppamento prima o dopo dà lo stesso risultato
+        return col in step['columns'], col
+    if step_type == 'fillna':
+        return col != step['column'], col
+    return False, col
+
+def _insert_filter(plan, schemas, position, conditions, schema):
+    """Insert filter conditions, fusing them with an adjacent filter into one mask"""
+    if position > 0 and plan[position - 1]['type'] == 'filter':
+        plan[position - 1] = {'type': 'filter', 'conditions': plan[position - 1]['conditions'] + conditions}
+    elif position < len(plan) and plan[position]['type'] == 'filter':
+        plan[position] = {'type': 'filter', 'conditions': plan[position]['conditions'] + conditions}
+    else:
+        plan.insert(position, {'type': 'filter', 'conditions': conditions})
+        # Un filtro non cambia le colonne
+        schemas.insert(position, schema)
+
+def push_down_filters(plan, columns):
+    """
+    Move filter conditions as early as possible and fuse adjacent filters
+
+    Conditions on columns that do not exist where the filter runs are
+    dropped, since filter_dataframe ignores them. A filter moves as a whole
+    and never before an earlier filter, so conditions are still evaluated
+    in their original order and raise the same errors as step-by-step
+    filtering.
+
+    Args:
+        plan (list): Plan steps
+        columns (list): Columns of the source dataframe
+
+    Returns:
+        list: Equivalent plan with filters pushed down
+    """
+    optimized = []
+    # schemas[i] sono le colonne disponibili prima di optimized[i]
+    schemas = []
+    current = list(columns)
+
+    for step in plan:
+        if step['type'] != 'filter':
+            optimized.append(step)
+            schemas.append(current)
+            current = apply_schema(step, current)
+            continue
+
+        pending = [(col, value) for col, value in step['conditions'] if col in current]
+        position = len(optimized)
+
+        # Risaliamo il piano finché tutte le condizioni possono essere anticipate
+        while position > 0 and pending:
+            previous = optimized[position - 1]
+            if previous['type'] == 'filter':
+                # Ci fondiamo dopo le condizioni del filtro precedente senza scavalcarlo
+                break
+
+            moved = [_push_condition(previous, col, schemas[position - 1]) + (value,) for col, value in pending]
+            if not all(can_move for can_move, _, _ in moved):
+                # Una condizione bloccata ferma tutto il filtro
+                break
+            pending = [(col, value) for _, col, value in moved]
+            position -= 1
+
+        if pending:
+            _insert_filter(optimized, schemas, position, pending,
+                           schemas[position] if position < len(schemas) else current)
+
+    return optimized
+
+def required_columns(plan):
+    """
+    Get the source columns needed by a plan
+
+    Args:
+        plan (list): Plan steps
+
+    Returns:
+        set: Needed columns, or None if the result keeps every column
+    """
+    needed = None
+
+    for step in reversed(plan):
+        step_type = step['type']
+
+        if step_type == 'select_columns':
+            needed = set(step['columns'])
+        elif step_type == 'group_by':
+            needed = set(step['columns']) | set(step['aggregations'])
+        elif needed is None:
+            continue
+        elif step_type == 'rename_columns':
+            original = {new: old for old, new in step['rename_map'].items()}
+            needed = {original.get(col, col) for col in needed}
+        elif step_type == 'filter':
+            needed |= {col for col, _ in step['conditions']}
+        elif step_type == 'sort':
+            needed |= set(step['column']) if isinstance(step['column'], list) else {step['column']}
+        elif step_type == 'fillna':
+            needed.add(step['column'])
+
+    return needed
+
+def optimize_plan(transformations, columns):
+    """
+    Build the optimized plan of a list of transformations
+
+    Args:
+        transformations (list): Transformations in the transform_dataframe format
+        columns (list): Columns of the source dataframe
+
+    Returns:
+        dict: 'columns' to read from the source (None for all) and optimized 'steps'
+    """
+    steps = push_down_filters(to_plan(transformations), list(columns))
+    return {'columns': required_columns(steps), 'steps': steps}
+
+def execute_plan(df, plan):
+    """
+    Run an optimized plan on a dataframe
+
+    The source is never copied: unused columns are dropped first, fused
+    filters are applied as a single mask and each step builds on the
+    previous result.
+
+    Args:
+        df (pandas.DataFrame): Source dataframe
+        plan (dict): Plan returned by optimize_plan
+
+    Returns:
+        pandas.DataFrame: Result
+    """
+    result = df
+    if plan['columns'] is not None:
+        keep = [col for col in df.columns if col in plan['columns']]
+        if len(keep) < len(df.columns):
+            result = df[keep]
+
+    for step in plan['steps']:
+        step_type = step['type']
+
+        if step_type == 'filter':
+            mask = build_filter_mask(result, step['conditions'])
+            if mask is not None and not mask.all():
+                result = result[mask]
+        elif step_type == 'group_by':
+            result = result.groupby(step['columns'], observed=True).agg(step['aggregations']).reset_index()
+        elif step_type == 'sort':
+            # Ordinamento stabile: anticipare i filtri non cambia l'ordine dei pari merito
+            result = result.sort_values(by=step['column'], ascending=step.get('ascending', True), kind='stable')
+        elif step_type == 'select_columns':
+            result = result[step['columns']]
+        elif step_type == 'rename_columns':
+            result = result.rename(columns=step['rename_map'])
+        elif step_type == 'fillna':
+            result = result.assign(**{step['column']: result[step['column']].fillna(step['value'])})
+
+    # Il risultato non deve mai essere la sorgente stessa: chi lo modifica non tocca i dati originali
+    return result.copy(deep=False) if result is df else result
+
+class LazyFrame:
+    """
+    Dataframe transformations recorded as a plan and run once on collect()
+
+    Example:
+        LazyFrame(df).filter({"city": ["Roma"]}).group_by(["property"], {"price": "mean"}).collect()
+    """
+
+    def __init__(self, df, transformations=None):
+        self.df = df
+        self.transformations = list(transformations or [])
+
+    def _with(self, transform):
+        return LazyFrame(self.df, self.transformations + [transform])
+
+    def filter(self, filters):
+        return self._with({'type': 'filter', 'filters': filters})
+
+    def group_by(self, columns, aggregations):
+        return self._with({'type': 'group_by', 'columns': columns, 'aggregations': aggregations})
+
+    def sort(self, column, ascending=True):
+        return self._with({'type': 'sort', 'column': column, 'ascending': ascending})
+
+    def select(self, columns):
+        return self._with({'type': 'select_columns', 'columns': columns})
+
+    def rename(self, rename_map):
+        return self._with({'type': 'rename_columns', 'rename_map': rename_map})
+
+    def fillna(self, column, value):
+        return self._with({'type': 'fillna', 'column': column, 'value': value})
+
+    def explain(self):
+        """Get the optimized plan that collect() will run"""
+        return optimize_plan(self.transformations, self.df.columns)
+
+    def collect(self):
+        """Run the optimized plan and return the resulting dataframe"""
+        return execute_plan(self.df, self.explain())
@@ -0,0 +1,160 @@
+import os
+import json
+from datetime import datetime
+from sqlalchemy import or_
+from utils.database import get_db_session, SavedReport
+
+REPORTS_DIR = os.path.join("data", "reports")
+
+REPORTS_PER_PAGE = 20
+
+def _report_type(filename):
+    return "AI" if "ai_report" in filename else "Custom"
+
+def _created_from_filename(filename):
+    """Get the save time encoded in names like report_20250510_191324.json"""
+    stem = os.path.splitext(filename)[0]
+    parts = stem.split("_")
+    for i in range(len(parts) - 1):
+        try:
+            return datetime.strptime(f"{parts[i]}_{parts[i + 1]}", "%Y%m%d_%H%M%S")
+        except ValueError:
+            continue
+    return None
+
+def _catalog_entry(filename, report, created_at=None):
+    return SavedReport(
+        filename=filename,
+        title=report.get("title", "Untitled"),
+        author=report.get("author", ""),
+        report_type=_report_type(filename),
+        report_date=report.get("date", "N/A"),
+        sections=len(report["sections"]) if isinstance(report.get("sections"), list) else 0,
+        created_at=created_at or _created_from_filename(filename) or datetime.now()
+    )
+
+def save_report(report, prefix="report"):
+    """
+    Save a report to data/reports and add it to the catalog
+
+    Args:
+        report (dict): Report structure
+        prefix (str): File name prefix ("report" or "ai_report")
+
+    Returns:
+        str: Name of the saved file
+    """
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+
+    now = datetime.now()
+    filename = f"{prefix}_{now.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(os.path.join(REPORTS_DIR, filename), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    session = get_db_session()
+    try:
+        session.merge(_catalog_entry(filename, report, now))
+        session.commit()
+    finally:
+        session.close()
+
+    return filename
+
+def sync_catalog():
+    """
+    Align the catalog with the files in data/reports
+
+    Only file names are listed: reports saved before the catalog existed, or
+    copied in by hand, are opened once to be indexed, and entries of deleted
+    files are removed.
+
+    Returns:
+        int: Number of reports added or removed
+    """
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    on_disk = {entry.name for entry in os.scandir(REPORTS_DIR) if entry.name.endswith('.json')}
+
+    session = get_db_session()
+    try:
+        indexed = {filename for (filename,) in session.query(SavedReport.filename)}
+
+        missing = on_disk - indexed
+        entries = []
+        for filename in missing:
+            try:
+                report = load_report(filename)
+            except (OSError, ValueError):
+                report = {"title": "Error loading report"}
+            entries.append(_catalog_entry(filename, report))
+        session.add_all(entries)
+
+        removed = indexed - on_disk
+        if removed:
+            session.query(SavedReport).filter(SavedReport.filename.in_(removed)).delete(synchronize_session=False)
+
+        session.commit()
+        return len(missing) + len(removed)
+    finally:
+        session.close()
+
+def search_reports(query="", report_type=None, page=1, per_page=REPORTS_PER_PAGE):
+    """
+    Search saved reports by title or author, newest first
+
+    Args:
+        query (str): Text searched in title and author
+        report_type (str, optional): "Custom" or "AI"
+        page (int): Page number, starting from 1
+        per_page (int): Reports per page
+
+    Returns:
+        tuple: (list of report metadata dictionaries, total number of matches)
+    """
+    session = get_db_session()
+    try:
+        results = session.query(SavedReport)
+        if query:
+            pattern = f"%{query}%"
+            results = results.filter(or_(SavedReport.title.ilike(pattern), SavedReport.author.ilike(pattern)))
+        if report_type:
+            results = results.filter(SavedReport.report_type == report_type)
+
+        total = results.count()
+        page_rows = results.order_by(SavedReport.created_at.desc()) \
+            .offset((max(page, 1) - 1) * per_page).limit(per_page).all()
+        return [row.to_dict() for row in page_rows], total
+    finally:
+        session.close()
+
+def load_report(filename):
+    """
+    Load the body of a saved report
+
+    Args:
+        filename (str): Name of the report file
+
+    Returns:
+        dict: Report structure
+
+    Raises:
+        ValueError: If the file is not valid JSON or its root is not an object
+    """
+    with open(os.path.join(REPORTS_DIR, os.path.basename(filename)), 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    if not isinstance(report, dict):
+        raise ValueError(f"Report {filename} is not a JSON object")
+    return report
+
+def delete_report(filename):
+    """Delete a saved report file and its catalog entry"""
+    filename = os.path.basename(filename)
+    path = os.path.join(REPORTS_DIR, filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+    session = get_db_session()
+    try:
+        session.query(SavedReport).filter(SavedReport.filename == filename).delete()
+        session.commit()
+    finally:
+        session.close()
@@ -3,11 +3,16 @@ import pandas as pd
 import plotly.graph_objects as go
 from datetime import datetime
 import base64
-from io import BytesIO
+from io import BytesIO, StringIO
 import matplotlib.pyplot as plt
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from jinja2 import Environment, DictLoader, select_autoescape
+from markupsafe import Markup, escape
 from utils.visualization import create_visualization
 from utils.ai_insights import generate_report_with_ai
+from utils.table_export import write_excel
 
 def generate_report_template(title, description, sections, author="", date=None):
     """
@@ -96,130 +101,290 @@ def render_report_in_streamlit(report, df=None):
                 except Exception as e:
                     st.error(f"Error rendering visualization: {str(e)}")
 
-def generate_report_html(report, df=None):
+# Righe di tabella scritte per ogni blocco del template
+TABLE_CHUNK_ROWS = 500
+
+# Sotto questa soglia i PDF vengono convertiti nel processo corrente
+MIN_PARALLEL_REPORTS = 2
+
+REPORT_CSS = """
+body {
+    font-family: Arial, sans-serif;
+    line-height: 1.6;
+    margin: 0;
+    padding: 20px;
+    color: #333;
+}
+.container {
+    max-width: 1200px;
+    margin: 0 auto;
+}
+.header {
+    text-align: center;
+    margin-bottom: 30px;
+    padding-bottom: 20px;
+    border-bottom: 1px solid #eee;
+}
+.header h1 {
+    margin-bottom: 10px;
+    color: #2c3e50;
+}
+.meta {
+    color: #7f8c8d;
+    font-size: 0.9em;
+}
+.section {
+    margin-bottom: 30px;
+}
+.section h2 {
+    color: #3498db;
+    border-bottom: 1px solid #eee;
+    padding-bottom: 10px;
+}
+.visualization {
+    margin: 20px 0;
+    text-align: center;
+}
+.caption {
+    font-style: italic;
+    color: #7f8c8d;
+    text-align: center;
+    margin-top: 5px;
+}
+img {
+    max-width: 100%;
+    height: auto;
+}
+table.data-table {
+    width: 100%;
+    border-collapse: collapse;
+    font-size: 0.85em;
+    text-align: left;
+}
+table.data-table th {
+    background-color: lightblue;
+}
+table.data-table th, table.data-table td {
+    border: 1px solid #ddd;
+    padding: 4px 6px;
+}
+table.data-table thead {
+    display: table-header-group;
+}
+table.data-table tr {
+    page-break-inside: avoid;
+}
+"""
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ report.title }}</title>
+    {% if inline_css %}<style>{{ css }}</style>{% endif %}
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>{{ report.title }}</h1>
+            <div class="meta">
+                <p>Date: {{ report.date }}</p>
+                {% if report.author %}<p>Author: {{ report.author }}</p>{% endif %}
+            </div>
+            <p>{{ report.description }}</p>
+        </div>
+        {% for section in sections %}
+        <div class="section">
+            <h2>{{ section.title }}</h2>
+            <div class="content">
+                {{ section.content | nl2br }}
+            </div>
+            {% for viz in section.visualizations %}
+            {% if viz.error is defined %}
+            <div class="error">Error rendering visualization: {{ viz.error }}</div>
+            {% else %}
+            <div class="visualization">
+                {% if viz.image is defined %}
+                <img src="data:image/png;base64,{{ viz.image }}" alt="{{ viz.type }} visualization">
+                {% else %}
+                <table class="data-table">
+                    <thead><tr>{% for column in viz.columns %}<th>{{ column }}</th>{% endfor %}</tr></thead>
+                    <tbody>
+                    {% for rows in viz.row_chunks %}{{ rows }}{% endfor %}
+                    </tbody>
+                </table>
+                {% endif %}
+                {% if viz.caption is not none %}
+                <div class="caption">{{ viz.caption }}</div>
+                {% endif %}
+            </div>
+            {% endif %}
+            {% endfor %}
+        </div>
+        {% endfor %}
+    </div>
+</body>
+</html>
+"""
+
+# Template compilato una volta e condiviso; il CSS di WeasyPrint viene creato per processo
+_template_lock = threading.Lock()
+_report_template = None
+_pdf_assets = None
+
+def _nl2br(text):
+    """Escape text and keep its line breaks"""
+    return Markup("<br>\n").join(escape(text).split("\n"))
+
+def get_report_template():
+    """
+    Get the compiled report template, building it on first use
+
+    Returns:
+        jinja2.Template: Report template
+    """
+    global _report_template
+    with _template_lock:
+        if _report_template is None:
+            env = Environment(
+                loader=DictLoader({"report.html": REPORT_TEMPLATE}),
+                autoescape=select_autoescape(default=True),
+                trim_blocks=True,
+                lstrip_blocks=True
+            )
+            env.filters["nl2br"] = _nl2br
+            _report_template = env.get_template("report.html")
+        return _report_template
+
+def _table_row_chunks(table_df):
+    """Yield the rows of a table as HTML, TABLE_CHUNK_ROWS at a time"""
+    for start in range(0, len(table_df), TABLE_CHUNK_ROWS):
+        chunk = table_df.iloc[start:start + TABLE_CHUNK_ROWS].astype(object)
+        chunk = chunk.where(chunk.notna(), "")
+        yield Markup("").join(
+            Markup("<tr>") + Markup("").join(Markup("<td>%s</td>") % value for value in row) + Markup("</tr>\n")
+            for row in chunk.itertuples(index=False, name=None)
+        )
+
+def _render_visualization(df, viz):
+    """Prepare one visualization for the template: a PNG image, or the rows of a table"""
+    viz_type = viz.get("type")
+    config = viz.get("config", {})
+    rendered = {"type": viz_type, "caption": viz.get("caption") if "caption" in viz else None}
+
+    if viz_type == "table":
+        # Le tabelle diventano HTML, scritto a blocchi, invece di un'immagine troncata
+        columns = config.get("columns", df.columns.tolist())
+        table_df = df[columns].head(config.get("rows", df.shape[0]))
+        rendered["columns"] = list(table_df.columns)
+        rendered["row_chunks"] = _table_row_chunks(table_df)
+    else:
+        # Create visualization using plotly and convert it to a static image
+        fig = create_visualization(df, viz_type, config)
+        rendered["image"] = base64.b64encode(fig.to_image(format="png")).decode("utf-8")
+    return rendered
+
+def _render_sections(report, df):
+    """Yield the report sections with their visualizations, one at a time"""
+    for section in report["sections"]:
+        visualizations = []
+        if section["visualizations"] and df is not None:
+            for viz in section["visualizations"]:
+                if not (viz.get("type") and viz.get("config", {})):
+                    continue
+                try:
+                    visualizations.append(_render_visualization(df, viz))
+                except Exception as e:
+                    visualizations.append({"error": str(e)})
+        yield {"title": section["title"], "content": section["content"], "visualizations": visualizations}
+
+def iter_report_html(report, df=None, inline_css=True):
+    """
+    Render the report HTML incrementally
+
+    Sections are prepared one at a time and table rows are produced in
+    blocks, so large reports can be written out without building the whole
+    document in memory.
+
+    Args:
+        report (dict): Report dictionary
+        df (pandas.DataFrame, optional): Dataframe for generating visualizations
+        inline_css (bool): Embed the stylesheet in the page; the PDF conversion passes it separately
+
+    Returns:
+        generator: Chunks of the HTML document
+    """
+    return get_report_template().generate(
+        report=report,
+        sections=_render_sections(report, df),
+        css=Markup(REPORT_CSS),
+        inline_css=inline_css
+    )
+
+def generate_report_html(report, df=None, inline_css=True):
     """
     Generate an HTML version of the report
     
     Args:
         report (dict): Report dictionary
         df (pandas.DataFrame, optional): Dataframe for generating visualizations
+        inline_css (bool): Embed the stylesheet in the page
         
     Returns:
         str: HTML string of the report
     """
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{report["title"]}</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                margin: 0;
-                padding: 20px;
-                color: #333;
-            }}
-            .container {{
-                max-width: 1200px;
-                margin: 0 auto;
-            }}
-            .header {{
-                text-align: center;
-                margin-bottom: 30px;
-                padding-bottom: 20px;
-                border-bottom: 1px solid #eee;
-            }}
-            .header h1 {{
-                margin-bottom: 10px;
-                color: #2c3e50;
-            }}
-            .meta {{
-                color: #7f8c8d;
-                font-size: 0.9em;
-            }}
-            .section {{
-                margin-bottom: 30px;
-            }}
-            .section h2 {{
-                color: #3498db;
-                border-bottom: 1px solid #eee;
-                padding-bottom: 10px;
-            }}
-            .visualization {{
-                margin: 20px 0;
-                text-align: center;
-            }}
-            .caption {{
-                font-style: italic;
-                color: #7f8c8d;
-                text-align: center;
-                margin-top: 5px;
-            }}
-            img {{
-                max-width: 100%;
-                height: auto;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>{report["title"]}</h1>
-                <div class="meta">
-                    <p>Date: {report["date"]}</p>
-                    {"<p>Author: " + report["author"] + "</p>" if report["author"] else ""}
-                </div>
-                <p>{report["description"]}</p>
-            </div>
+    return "".join(iter_report_html(report, df, inline_css))
+
+def write_report_html(report, df=None, output=None):
     """
-    
-    # Add sections
-    for section in report["sections"]:
-        html += f"""
-            <div class="section">
-                <h2>{section["title"]}</h2>
-                <div class="content">
-                    {section["content"].replace('\n', '<br>')}
-                </div>
-            </div>
-        """
-        
-        # Add visualizations if any
-        if section["visualizations"] and df is not None:
-            for i, viz in enumerate(section["visualizations"]):
-                try:
-                    viz_type = viz.get("type")
-                    config = viz.get("config", {})
-                    
-                    if viz_type and config:
-                        # Create visualization using plotly
-                        fig = create_visualization(df, viz_type, config)
-                        
-                        # Convert to static image for HTML
-                        img_bytes = fig.to_image(format="png")
-                        img_base64 = base64.b64encode(img_bytes).decode("utf-8")
-                        
-                        html += f"""
-                            <div class="visualization">
-                                <img src="data:image/png;base64,{img_base64}" alt="{viz_type} visualization">
-                                {"<div class='caption'>" + viz.get("caption", "") + "</div>" if "caption" in viz else ""}
-                            </div>
-                        """
-                except Exception as e:
-                    html += f"""<div class="error">Error rendering visualization: {str(e)}</div>"""
-        
-        html += "</div>"
-    
-    html += """
-        </div>
-    </body>
-    </html>
+    Write the HTML report to a file as it is rendered
+
+    Args:
+        report (dict): Report dictionary
+        df (pandas.DataFrame, optional): Dataframe for generating visualizations
+        output (str or file, optional): Path or text file object; a StringIO is created if not given
+
+    Returns:
+        The output path or file object
     """
-    
-    return html
+    if output is None:
+        output = StringIO()
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'w', encoding='utf-8') as f:
+            f.writelines(iter_report_html(report, df))
+        return output
+    output.writelines(iter_report_html(report, df))
+    return output
+
+def _get_pdf_assets():
+    """Get the parsed stylesheet and font configuration shared by every PDF of this process"""
+    global _pdf_assets
+    with _template_lock:
+        if _pdf_assets is None:
+            import weasyprint
+            from weasyprint.text.fonts import FontConfiguration
+
+            font_config = FontConfiguration()
+            _pdf_assets = (weasyprint.CSS(string=REPORT_CSS, font_config=font_config), font_config)
+        return _pdf_assets
+
+def html_to_pdf(html_report):
+    """
+    Convert a report page to PDF (also runs in the worker processes)
+
+    The stylesheet is parsed once per process instead of once per report.
+
+    Args:
+        html_report (str): HTML generated with inline_css=False
+
+    Returns:
+        bytes: PDF file content
+    """
+    import weasyprint
+
+    stylesheet, font_config = _get_pdf_assets()
+    return weasyprint.HTML(string=html_report).write_pdf(stylesheets=[stylesheet], font_config=font_config)
 
 def generate_pdf_report(report, df=None):
     """
@@ -235,23 +400,43 @@ def generate_pdf_report(report, df=None):
         BytesIO: PDF file as BytesIO object
     """
     try:
-        import weasyprint
-        
-        # Generate HTML report
-        html_report = generate_report_html(report, df)
-        
-        # Convert HTML to PDF
-        pdf_bytes = BytesIO()
-        weasyprint.HTML(string=html_report).write_pdf(pdf_bytes)
-        pdf_bytes.seek(0)
-        
-        return pdf_bytes
+        # Generate HTML report and convert it to PDF
+        html_report = generate_report_html(report, df, inline_css=False)
+        return BytesIO(html_to_pdf(html_report))
     
     except ImportError:
         # Fallback if weasyprint is not available
         st.error("PDF generation requires WeasyPrint library, which is not available. Providing HTML report instead.")
         return None
 
+def generate_pdf_reports(reports, df=None, max_workers=None):
+    """
+    Generate the PDF of many reports, converting them in a process pool
+
+    The HTML is rendered here, where the dataframe is; only the conversion,
+    the slowest step, runs in the workers.
+
+    Args:
+        reports (list): Report dictionaries
+        df (pandas.DataFrame, optional): Dataframe for generating visualizations
+        max_workers (int, optional): Worker processes (default: number of CPUs)
+
+    Returns:
+        list: One BytesIO per report, in order, or None if WeasyPrint is not available
+    """
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        st.error("PDF generation requires WeasyPrint library, which is not available. Providing HTML report instead.")
+        return None
+
+    html_reports = [generate_report_html(report, df, inline_css=False) for report in reports]
+    if len(html_reports) < MIN_PARALLEL_REPORTS or max_workers == 1:
+        return [BytesIO(pdf) for pdf in map(html_to_pdf, html_reports)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [BytesIO(pdf) for pdf in executor.map(html_to_pdf, html_reports)]
+
 def generate_excel_report(report, df):
     """
     Generate an Excel version of the report
@@ -263,64 +448,33 @@ def generate_excel_report(report, df):
     Returns:
         BytesIO: Excel file as BytesIO object
     """
-    output = BytesIO()
-    
     try:
-        # Create a Pandas Excel writer using XlsxWriter as the engine
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Create a sheet for the data
-            df.to_excel(writer, sheet_name='Data', index=False)
-            
-            # Create a sheet for the report
-            report_data = {
-                'Section': [],
-                'Content': []
-            }
-            
-            # Add report title and description
-            report_data['Section'].append('Title')
-            report_data['Content'].append(report['title'])
-            
-            report_data['Section'].append('Description')
-            report_data['Content'].append(report['description'])
-            
-            report_data['Section'].append('Date')
-            report_data['Content'].append(report['date'])
-            
-            report_data['Section'].append('Author')
-            report_data['Content'].append(report['author'])
-            
-            # Add each section
-            for section in report['sections']:
-                report_data['Section'].append(section['title'])
-                report_data['Content'].append(section['content'])
-            
-            # Write report data to Excel
-            pd.DataFrame(report_data).to_excel(writer, sheet_name='Report', index=False)
-            
-            # Access the workbook and the worksheets
-            workbook = writer.book
-            report_sheet = writer.sheets['Report']
-            
-            # Set column widths in the report sheet
-            report_sheet.set_column('A:A', 20)
-            report_sheet.set_column('B:B', 80)
-            
-            # Add some formatting
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'top',
-                'fg_color': '#D7E4BC',
-                'border': 1
-            })
-            
-            # Write the column headers with the defined format
-            for col_num, value in enumerate(['Section', 'Content']):
-                report_sheet.write(0, col_num, value, header_format)
+        report_data = {
+            'Section': ['Title', 'Description', 'Date', 'Author'],
+            'Content': [report['title'], report['description'], report['date'], report['author']]
+        }
         
-        output.seek(0)
-        return output
+        # Add each section
+        for section in report['sections']:
+            report_data['Section'].append(section['title'])
+            report_data['Content'].append(section['content'])
+        
+        # The data sheet is written in chunks, in constant memory
+        return write_excel([
+            {"name": "Data", "data": df},
+            {
+                "name": "Report",
+                "data": pd.DataFrame(report_data),
+                "columns": {"Section": {"width": 20}, "Content": {"width": 80}},
+                "header_format": {
+                    'bold': True,
+                    'text_wrap': True,
+                    'valign': 'top',
+                    'fg_color': '#D7E4BC',
+                    'border': 1
+                }
+            }
+        ])
     
     except Exception as e:
         st.error(f"Error generating Excel report: {str(e)}")
@@ -0,0 +1,452 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+
+# Righe lette per ogni blocco del file CSV
+DEFAULT_CHUNKSIZE = 100_000
+
+# Precisione degli sketch: 2^14 registri HyperLogLog, reservoir da 10.000 valori,
+# count-min 2048 x 5
+HLL_PRECISION = 14
+RESERVOIR_SIZE = 10_000
+CMS_WIDTH = 2048
+CMS_DEPTH = 5
+TOP_K = 5
+
+# Hash di riga conservati per contare i duplicati in modo esatto (8 byte ciascuno);
+# oltre questo limite il conteggio diventa approssimato
+EXACT_DUPLICATE_LIMIT = 5_000_000
+
+# Livello di confidenza dei limiti di errore riportati
+CONFIDENCE = 0.95
+
+# Moltiplicatori per derivare le righe del count-min da un unico hash a 64 bit
+_CMS_SEEDS = np.array([
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+    0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD
+], dtype=np.uint64)
+
+def hash_values(values):
+    """
+    Hash the values of a column so that equal values hash equally in every chunk
+
+    Numbers are hashed as float64, everything else as strings, so a column
+    parsed as int in one chunk and as float or object in another stays consistent.
+
+    Args:
+        values (pandas.Series): Non-null values
+
+    Returns:
+        numpy.ndarray: uint64 hashes
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        keys = values.astype("float64").to_numpy()
+    else:
+        keys = values.astype(str).to_numpy(dtype=object)
+    return pd.util.hash_array(keys, categorize=False)
+
+def _bit_length(x):
+    """Vectorized bit length of uint64 values"""
+    x = x.copy()
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= np.uint64(1 << shift)
+        length += shift * mask
+        x = np.where(mask, x >> np.uint64(shift), x)
+    return length + (x > 0)
+
+class HyperLogLog:
+    """
+    Mergeable distinct-count sketch
+
+    Standard error is 1.04 / sqrt(2^precision), about 0.8% with the default precision.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - _bit_length(remainder) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Correzione per piccoli insiemi (linear counting)
+            return m * math.log(m / zeros)
+        return float(raw)
+
+class ReservoirSample:
+    """
+    Mergeable uniform sample used for approximate quantiles
+
+    Keeps the values with the largest random keys (bottom-k sampling), so two
+    samples merge into a uniform sample of the union. By the DKW inequality,
+    quantile ranks are within sqrt(ln(2/(1-confidence)) / (2k)) of the truth.
+    """
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.values = np.empty(0, dtype=np.float64)
+        self.keys = np.empty(0, dtype=np.float64)
+
+    def _keep_top(self, values, keys):
+        if len(keys) > self.size:
+            top = np.argpartition(keys, -self.size)[-self.size:]
+            values, keys = values[top], keys[top]
+        self.values, self.keys = values, keys
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        keys = self.rng.random(len(values))
+        self._keep_top(np.concatenate([self.values, values]), np.concatenate([self.keys, keys]))
+
+    def merge(self, other):
+        self._keep_top(np.concatenate([self.values, other.values]), np.concatenate([self.keys, other.keys]))
+        return self
+
+    def rank_error(self, confidence=CONFIDENCE):
+        if len(self.values) == 0:
+            return 0.0
+        return math.sqrt(math.log(2 / (1 - confidence)) / (2 * len(self.values)))
+
+    def quantiles(self, qs):
+        if len(self.values) == 0:
+            return [None] * len(qs)
+        return np.quantile(self.values, qs).tolist()
+
+class CountMinTopK:
+    """
+    Mergeable frequency sketch with a candidate set of heavy hitters
+
+    Counts are overestimated by at most e / width * total with probability
+    1 - exp(-depth).
+    """
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, k=TOP_K):
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self.candidates = {}  # valore -> hash
+
+    def _columns(self, hashes):
+        mixed = hashes[None, :] * _CMS_SEEDS[:self.depth, None]
+        return ((mixed >> np.uint64(32)) % np.uint64(self.width)).astype(np.int64)
+
+    def estimate_hashes(self, hashes):
+        columns = self._columns(hashes)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def add_counts(self, counts):
+        """Add the value counts of a chunk (pandas.Series indexed by value)"""
+        if counts.empty:
+            return
+        hashes = hash_values(counts.index.to_series())
+        columns = self._columns(hashes)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts.to_numpy())
+        self.total += int(counts.sum())
+
+        # I candidati sono i più frequenti del blocco più quelli già noti
+        head = counts.head(self.k * 4)
+        self.candidates.update(zip(head.index.tolist(), hashes[:len(head)].tolist()))
+        self._prune()
+
+    def merge(self, other):
+        self.table += other.table
+        self.total += other.total
+        self.candidates.update(other.candidates)
+        self._prune()
+        return self
+
+    def _prune(self):
+        if len(self.candidates) <= self.k * 4:
+            return
+        values = list(self.candidates)
+        estimates = self.estimate_hashes(np.array([self.candidates[v] for v in values], dtype=np.uint64))
+        keep = np.argsort(estimates)[::-1][:self.k * 4]
+        self.candidates = {values[i]: self.candidates[values[i]] for i in keep}
+
+    @property
+    def error_bound(self):
+        return math.ceil(math.e / self.width * self.total)
+
+    def top_k(self):
+        if not self.candidates:
+            return {}
+        values = list(self.candidates)
+        estimates = self.estimate_hashes(np.array([self.candidates[v] for v in values], dtype=np.uint64))
+        order = np.argsort(estimates)[::-1][:self.k]
+        return {values[i]: int(estimates[i]) for i in order}
+
+class ColumnSketch:
+    """Exact counters and approximate sketches of a single column"""
+
+    def __init__(self, name, dtype):
+        self.name = name
+        self.dtype = dtype
+        self.numeric = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+        self.missing = 0
+        self.invalid = 0
+        self.distinct = HyperLogLog()
+        self.frequent = CountMinTopK()
+        # Momenti esatti e campione per i quantili delle colonne numeriche
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sample = ReservoirSample() if self.numeric else None
+
+    def update(self, series):
+        """
+        Add a chunk of the column
+
+        Returns:
+            numpy.ndarray: Hashes of all the values of the chunk, used for duplicate rows
+        """
+        missing = series.isna()
+        self.missing += int(missing.sum())
+
+        if self.numeric:
+            series = pd.to_numeric(series, errors="coerce").astype("float64")
+            # Valori non numerici in una colonna numerica: contati a parte
+            self.invalid += int(series.isna().sum()) - int(missing.sum())
+            self._update_moments(series.dropna().to_numpy())
+
+        hashes = hash_values(series)
+        present = series.notna().to_numpy()
+        self.distinct.add_hashes(hashes[present])
+        if not self.numeric:
+            self.frequent.add_counts(series[present].value_counts())
+
+        return hashes
+
+    def _update_moments(self, numbers):
+        if len(numbers) == 0:
+            return
+        # Unione di Chan et al. dei momenti del blocco con quelli accumulati
+        n, mean, m2 = len(numbers), float(numbers.mean()), float(((numbers - numbers.mean()) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = float(numbers.min()) if self.min is None else min(self.min, float(numbers.min()))
+        self.max = float(numbers.max()) if self.max is None else max(self.max, float(numbers.max()))
+        self.sample.add(numbers)
+
+    def to_column_info(self, rows):
+        distinct = int(round(self.distinct.estimate()))
+        col_info = {
+            'name': self.name,
+            'type': str(self.dtype),
+            'missing': self.missing,
+            'missing_percent': round((self.missing / rows) * 100, 2) if rows else 0.0,
+            'unique_values': distinct,
+            'unique_values_error': int(math.ceil(distinct * self.distinct.relative_error * 2))
+        }
+
+        if self.numeric and self.count:
+            q1, median, q3 = self.sample.quantiles([0.25, 0.5, 0.75])
+            col_info.update({
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean,
+                'median': median,
+                'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float("nan"),
+                'q1': q1,
+                'q3': q3,
+                'quantile_rank_error': round(self.sample.rank_error(), 4),
+                'invalid': self.invalid
+            })
+        elif not self.numeric:
+            col_info['most_common'] = self.frequent.top_k()
+            col_info['most_common_error'] = self.frequent.error_bound
+
+        return col_info
+
+class CorrelationAccumulator:
+    """Exact pairwise correlations from co-moments summed chunk by chunk"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        k = len(columns)
+        self.n = np.zeros((k, k))
+        self.sx = np.zeros((k, k))
+        self.sxx = np.zeros((k, k))
+        self.sxy = np.zeros((k, k))
+
+    def update(self, chunk):
+        values = chunk[self.columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        present = (~np.isnan(values)).astype(np.float64)
+        filled = np.nan_to_num(values)
+        # Somme sulle sole righe in cui entrambe le colonne sono presenti
+        self.n += present.T @ present
+        self.sx += filled.T @ present
+        self.sxx += (filled * filled).T @ present
+        self.sxy += filled.T @ filled
+
+    def correlations(self):
+        n, sx, sxx, sxy = self.n, self.sx, self.sxx, self.sxy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = n * sxy - sx * sx.T
+            var = n * sxx - sx * sx
+            corr = cov / np.sqrt(var * var.T)
+
+        rows, cols = np.triu_indices(len(self.columns), k=1)
+        correlations = [
+            {
+                'column1': self.columns[i],
+                'column2': self.columns[j],
+                'correlation': round(float(corr[i, j]), 2)
+            }
+            for i, j in zip(rows, cols)
+            if n[i, j] > 1 and np.isfinite(corr[i, j])
+        ]
+        correlations.sort(key=lambda x: abs(x['correlation']), reverse=True)
+        return correlations
+
+class StreamingProfile:
+    """
+    Profile of a dataset built chunk by chunk in bounded memory
+
+    Row and missing counts, min, max, mean, std and correlations are exact;
+    distinct counts, quantiles and top values are approximate with the error
+    bounds reported in the profile. Duplicate rows are exact up to
+    EXACT_DUPLICATE_LIMIT distinct rows, then estimated.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.memory_bytes = 0
+        self.columns = {}
+        self.row_hashes = HyperLogLog()
+        self.seen_rows = np.empty(0, dtype=np.uint64)
+        self.duplicate_rows = 0
+        self.exact_duplicates = True
+        self.correlation = None
+
+    def update(self, chunk):
+        if not self.columns:
+            for col in chunk.columns:
+                self.columns[col] = ColumnSketch(col, chunk[col].dtype)
+            numeric_cols = [col for col, sketch in self.columns.items() if sketch.numeric]
+            if len(numeric_cols) >= 2:
+                self.correlation = CorrelationAccumulator(numeric_cols)
+
+        self.rows += len(chunk)
+        self.memory_bytes += int(chunk.memory_usage(deep=True).sum())
+        # L'hash di riga combina gli hash già calcolati per ogni colonna
+        row_hashes = np.zeros(len(chunk), dtype=np.uint64)
+        for col, sketch in self.columns.items():
+            row_hashes = row_hashes * np.uint64(0x100000001B3) + sketch.update(chunk[col])
+        self.row_hashes.add_hashes(row_hashes)
+        if self.exact_duplicates:
+            self._count_duplicates(row_hashes)
+
+        if self.correlation:
+            self.correlation.update(chunk)
+
+    def _count_duplicates(self, row_hashes):
+        unique = np.unique(row_hashes)
+        duplicates = len(row_hashes) - len(unique)
+
+        if len(self.seen_rows):
+            positions = np.minimum(np.searchsorted(self.seen_rows, unique), len(self.seen_rows) - 1)
+            found = self.seen_rows[positions] == unique
+            duplicates += int(found.sum())
+            unique = unique[~found]
+
+        self.duplicate_rows += duplicates
+        self.seen_rows = np.sort(np.concatenate([self.seen_rows, unique]))
+
+        if len(self.seen_rows) > EXACT_DUPLICATE_LIMIT:
+            self.exact_duplicates = False
+            self.seen_rows = np.empty(0, dtype=np.uint64)
+
+    def to_profile(self, file_size=None):
+        """
+        Get the profile in the same format as create_data_profile
+
+        Returns:
+            dict: Profile with an 'approximate' flag and 'error_bounds'
+        """
+        if self.exact_duplicates:
+            duplicate_rows, duplicate_error = self.duplicate_rows, 0
+        else:
+            distinct_rows = min(self.rows, self.row_hashes.estimate())
+            duplicate_rows = int(round(self.rows - distinct_rows))
+            duplicate_error = int(math.ceil(distinct_rows * 2 * self.row_hashes.relative_error))
+        column_info = [sketch.to_column_info(self.rows) for sketch in self.columns.values()]
+
+        return {
+            'basic_info': {
+                'rows': self.rows,
+                'columns': len(self.columns),
+                'memory_usage': self.memory_bytes / (1024 * 1024),  # In MB, se caricato interamente
+                'file_size': file_size / (1024 * 1024) if file_size else None,
+                'duplicate_rows': duplicate_rows
+            },
+            'column_info': column_info,
+            'correlations': self.correlation.correlations() if self.correlation else [],
+            'missing_values': {
+                info['name']: {'count': info['missing'], 'percent': info['missing_percent']}
+                for info in column_info if info['missing'] > 0
+            },
+            'categorical_columns': [col for col, sketch in self.columns.items() if not sketch.numeric],
+            'approximate': True,
+            'error_bounds': {
+                'confidence': CONFIDENCE,
+                'distinct_relative_error': round(2 * self.row_hashes.relative_error, 4),
+                'duplicate_rows_error': duplicate_error,
+                'quantile_rank_error': round(math.sqrt(math.log(2 / (1 - CONFIDENCE)) / (2 * RESERVOIR_SIZE)), 4),
+                'top_values_error_share': round(math.e / CMS_WIDTH, 5)
+            }
+        }
+
+def profile_csv_stream(file_obj, chunksize=DEFAULT_CHUNKSIZE, progress_callback=None, **read_options):
+    """
+    Profile a CSV file of any size reading it in chunks
+
+    Args:
+        file_obj: Path or file object of the CSV file
+        chunksize (int): Rows read per chunk
+        progress_callback (callable, optional): Called with the rows read so far
+        **read_options: Extra options for pandas.read_csv
+
+    Returns:
+        dict: Approximate profile (see StreamingProfile.to_profile)
+    """
+    file_size = os.path.getsize(file_obj) if isinstance(file_obj, (str, os.PathLike)) else getattr(file_obj, "size", None)
+
+    profile = StreamingProfile()
+    for chunk in pd.read_csv(file_obj, chunksize=chunksize, **read_options):
+        profile.update(chunk)
+        if progress_callback:
+            progress_callback(profile.rows)
+
+    return profile.to_profile(file_size)
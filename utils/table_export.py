@@ -0,0 +1,301 @@
+import gzip
+import io
+import os
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import xlsxwriter
+    XLSXWRITER_INSTALLED = True
+except ImportError:
+    XLSXWRITER_INSTALLED = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_INSTALLED = True
+except ImportError:
+    PYARROW_INSTALLED = False
+
+# Righe convertite e scritte per ogni blocco
+EXPORT_CHUNK_ROWS = 10_000
+
+# Intestazione predefinita, come quella di pandas
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+DATE_FORMAT = "dd/mm/yyyy"
+
+# Righe per foglio di Excel, intestazione compresa
+EXCEL_MAX_ROWS = 1_048_576
+
+# Compressione più veloce del default di gzip, con file poco più grandi
+CSV_GZIP_LEVEL = 6
+
+# Blocchi tenuti in memoria, al massimo, per dare un tipo alle colonne ancora tutte nulle
+PARQUET_SCHEMA_CHUNKS = 4
+
+EXPORT_FORMATS = {
+    "xlsx": {
+        "label": "Excel (.xlsx)",
+        "extension": "xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    },
+    "csv.gz": {
+        "label": "CSV compresso (.csv.gz)",
+        "extension": "csv.gz",
+        "mime": "application/gzip"
+    },
+    "parquet": {
+        "label": "Parquet (.parquet)",
+        "extension": "parquet",
+        "mime": "application/vnd.apache.parquet"
+    }
+}
+
+def iter_frame_chunks(data, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield a table as dataframes of at most chunk_rows rows
+
+    Args:
+        data: DataFrame, or an iterable of DataFrame chunks (returned as they are)
+        chunk_rows (int): Rows per chunk when data is a DataFrame
+
+    Returns:
+        generator: DataFrame chunks; an empty DataFrame still yields one chunk, for its header
+    """
+    if not isinstance(data, pd.DataFrame):
+        yield from data
+        return
+    if data.empty:
+        yield data
+        return
+    for start in range(0, len(data), chunk_rows):
+        yield data.iloc[start:start + chunk_rows]
+
+def _excel_rows(chunk):
+    """Convert a chunk to lists of Python values, with missing values as empty cells"""
+    values = chunk.astype(object)
+    return values.where(values.notna(), None).to_numpy().tolist()
+
+@contextmanager
+def _binary_output(output):
+    """Open a path for writing, or use the given file object; a BytesIO is created if output is None"""
+    if output is None:
+        output = io.BytesIO()
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            yield f, output
+    else:
+        yield output, output
+
+def _rewind(output):
+    if isinstance(output, io.BytesIO):
+        output.seek(0)
+    return output
+
+def write_excel(sheets, output=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Write tables to an Excel workbook in constant memory
+
+    XlsxWriter's constant_memory mode flushes every row to a temporary file
+    as soon as the next one starts, and rows are converted one chunk at a
+    time, so memory does not grow with the number of rows. Cell formats are
+    created once per workbook and applied to whole columns. A table longer
+    than an Excel sheet (EXCEL_MAX_ROWS rows with the header) continues on
+    new sheets named "<name> (2)", "<name> (3)", ... with the same header.
+
+    Args:
+        sheets (list): One dictionary per sheet, with:
+            name (str): Sheet name
+            data: DataFrame, or an iterable of DataFrame chunks with the same columns
+            columns (dict, optional): Column name -> {"width": float, "format": XlsxWriter format dict}
+            header_format (dict, optional): Format of the header row (default: HEADER_FORMAT)
+        output (str or file, optional): Path or binary file object; a BytesIO is created if not given
+        chunk_rows (int): Rows converted at a time when data is a DataFrame
+
+    Returns:
+        The output path or file object (BytesIO rewound to the start)
+
+    Raises:
+        ValueError: If a row is outside the sheet (e.g. too many columns)
+    """
+    if not XLSXWRITER_INSTALLED:
+        raise ImportError("Excel export requires the XlsxWriter package")
+
+    with _binary_output(output) as (target, result):
+        workbook = xlsxwriter.Workbook(target, {
+            "constant_memory": True,
+            "nan_inf_to_errors": True,
+            "default_date_format": DATE_FORMAT
+        })
+        formats = {}
+
+        def get_format(spec):
+            key = tuple(sorted(spec.items()))
+            if key not in formats:
+                formats[key] = workbook.add_format(spec)
+            return formats[key]
+
+        def add_sheet(sheet, columns, part):
+            name = sheet["name"]
+            if part > 1:
+                # Il nome di un foglio è lungo al massimo 31 caratteri
+                suffix = f" ({part})"
+                name = name[:31 - len(suffix)].rstrip() + suffix
+            worksheet = workbook.add_worksheet(name)
+            column_specs = sheet.get("columns", {})
+            # In constant_memory le colonne vanno impostate prima di scrivere le righe
+            for col, column in enumerate(columns):
+                spec = column_specs.get(column)
+                if spec:
+                    cell_format = get_format(spec["format"]) if spec.get("format") else None
+                    worksheet.set_column(col, col, spec.get("width"), cell_format)
+            worksheet.write_row(0, 0, [str(column) for column in columns],
+                                get_format(sheet.get("header_format", HEADER_FORMAT)))
+            return worksheet
+
+        try:
+            for sheet in sheets:
+                worksheet = None
+                part = 0
+                row = 0
+                for chunk in iter_frame_chunks(sheet["data"], chunk_rows):
+                    if worksheet is None:
+                        part = 1
+                        worksheet = add_sheet(sheet, chunk.columns, part)
+                        row = 1
+                    for values in _excel_rows(chunk):
+                        if row >= EXCEL_MAX_ROWS:
+                            # Foglio pieno: le righe successive continuano su un nuovo foglio
+                            part += 1
+                            worksheet = add_sheet(sheet, chunk.columns, part)
+                            row = 1
+                        if worksheet.write_row(row, 0, values) == -1:
+                            raise ValueError(f"Row {row} is out of range in sheet {sheet['name']}")
+                        row += 1
+                if worksheet is None:
+                    # Nessun blocco da scrivere: il foglio resta vuoto
+                    workbook.add_worksheet(sheet["name"])
+        finally:
+            workbook.close()
+
+    return _rewind(result)
+
+def write_csv_gzip(data, output=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Write a table to a gzip-compressed CSV file, one chunk at a time
+
+    Args:
+        data: DataFrame, or an iterable of DataFrame chunks with the same columns
+        output (str or file, optional): Path or binary file object; a BytesIO is created if not given
+        chunk_rows (int): Rows written at a time when data is a DataFrame
+
+    Returns:
+        The output path or file object (BytesIO rewound to the start)
+    """
+    with _binary_output(output) as (target, result):
+        with gzip.GzipFile(fileobj=target, mode='wb', compresslevel=CSV_GZIP_LEVEL) as compressed:
+            text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+            for i, chunk in enumerate(iter_frame_chunks(data, chunk_rows)):
+                chunk.to_csv(text, index=False, header=(i == 0))
+            text.flush()
+            text.detach()
+
+    return _rewind(result)
+
+def _has_null_fields(schema):
+    return any(pa.types.is_null(field.type) for field in schema)
+
+def write_parquet(data, output=None, chunk_rows=EXPORT_CHUNK_ROWS, schema=None):
+    """
+    Write a table to a Parquet file, one row group per chunk
+
+    The file schema is fixed when the writer opens. It is, in order: the
+    schema given, the schema of the whole DataFrame, or for an iterator of
+    chunks the schema of the first chunk. Columns that are all null in the
+    first chunks have no type yet: up to PARQUET_SCHEMA_CHUNKS chunks are
+    held back and their types promoted (null to the type found later, int to
+    float) before writing. Pass schema for iterators whose columns can stay
+    empty longer than that.
+
+    Args:
+        data: DataFrame, or an iterable of DataFrame chunks with the same columns
+        output (str or file, optional): Path or binary file object; a BytesIO is created if not given
+        chunk_rows (int): Rows per row group when data is a DataFrame
+        schema (pyarrow.Schema, optional): Schema of the file
+
+    Returns:
+        The output path or file object (BytesIO rewound to the start)
+
+    Raises:
+        ValueError: If a chunk does not fit the schema of the file
+    """
+    if not PYARROW_INSTALLED:
+        raise ImportError("Parquet export requires the pyarrow package")
+
+    # Con un DataFrame completo i tipi sono dedotti da tutte le righe, non dal primo blocco
+    if schema is None and isinstance(data, pd.DataFrame):
+        schema = pa.Schema.from_pandas(data, preserve_index=False)
+
+    with _binary_output(output) as (target, result):
+        writer = None
+        pending = []
+        try:
+            for chunk in iter_frame_chunks(data, chunk_rows):
+                if schema is not None:
+                    try:
+                        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+                        raise ValueError(f"Chunk does not match the Parquet schema, pass schema explicitly: {e}") from e
+                    if writer is None:
+                        writer = pq.ParquetWriter(target, schema)
+                    writer.write_table(table)
+                    continue
+
+                # Schema non ancora fissato: i blocchi restano in attesa finché le colonne nulle non hanno un tipo
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                pending.append(table)
+                inferred = pa.unify_schemas([t.schema for t in pending], promote_options="permissive")
+                if not _has_null_fields(inferred) or len(pending) >= PARQUET_SCHEMA_CHUNKS:
+                    schema = inferred
+                    writer = pq.ParquetWriter(target, schema)
+                    for held in pending:
+                        writer.write_table(held.cast(schema))
+                    pending = []
+
+            if pending:
+                schema = pa.unify_schemas([t.schema for t in pending], promote_options="permissive")
+                writer = pq.ParquetWriter(target, schema)
+                for held in pending:
+                    writer.write_table(held.cast(schema))
+        finally:
+            if writer is not None:
+                writer.close()
+
+    return _rewind(result)
+
+def export_table(data, file_format="xlsx", output=None, sheet_name="Sheet1", columns=None, header_format=None):
+    """
+    Export a table in one of EXPORT_FORMATS
+
+    Args:
+        data: DataFrame, or an iterable of DataFrame chunks with the same columns
+        file_format (str): "xlsx", "csv.gz" or "parquet"
+        output (str or file, optional): Path or binary file object; a BytesIO is created if not given
+        sheet_name (str): Sheet name (Excel only)
+        columns (dict, optional): Column widths and formats (Excel only, see write_excel)
+        header_format (dict, optional): Format of the header row (Excel only)
+
+    Returns:
+        The output path or file object (BytesIO rewound to the start)
+    """
+    if file_format == "xlsx":
+        sheet = {"name": sheet_name, "data": data, "columns": columns or {}}
+        if header_format:
+            sheet["header_format"] = header_format
+        return write_excel([sheet], output)
+    if file_format == "csv.gz":
+        return write_csv_gzip(data, output)
+    if file_format == "parquet":
+        return write_parquet(data, output)
+    raise ValueError(f"Unsupported export format: {file_format}")
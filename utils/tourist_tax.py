@@ -0,0 +1,358 @@
+import os
+import json
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, type_coerce, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from utils.database import get_db_session, Booking, Invoice, Property, TouristTaxCharge
+
+# Un file JSON di regole per comune, es. data/tourist_tax/napoli.json
+RULES_DIR = os.path.join("data", "tourist_tax")
+
+# Posizione di ogni giorno dell'anno nelle tabelle delle tariffe: (mese - 1) * 31 + (giorno - 1)
+DAYS_KEY_SIZE = 12 * 31
+
+_rules_cache = {"signature": None, "rules": {}}
+_rules_lock = threading.Lock()
+
+def _city_key(city):
+    """Normalize a city name for matching properties to rule files"""
+    return (city or "").strip().lower()
+
+def _day_key(month, day):
+    return (month - 1) * 31 + (day - 1)
+
+def build_rate_table(rules):
+    """
+    Build the nightly rate of every day of the year from the seasons of a city
+
+    Seasons are "MM-DD" ranges, inclusive, and may wrap around the new year;
+    days outside every season use the default rate.
+
+    Args:
+        rules (dict): City rules
+
+    Returns:
+        numpy.ndarray: Rate per guest-night, indexed by (month - 1) * 31 + (day - 1)
+    """
+    table = np.full(DAYS_KEY_SIZE, float(rules.get("default_rate", 0)))
+    for season in rules.get("seasons", []):
+        start_month, start_day = (int(part) for part in season["start"].split("-"))
+        end_month, end_day = (int(part) for part in season["end"].split("-"))
+        start, end = _day_key(start_month, start_day), _day_key(end_month, end_day)
+        if start <= end:
+            table[start:end + 1] = float(season["rate"])
+        else:
+            table[start:] = float(season["rate"])
+            table[:end + 1] = float(season["rate"])
+    return table
+
+def load_city_rules(rules_dir=RULES_DIR):
+    """
+    Load the tourist tax rules of every municipality, reloading only when the files change
+
+    Each file holds city, default_rate, optional seasons (start, end, rate),
+    max_nights (per-stay cap, 0 for none) and age_bands (max_age, factor).
+
+    Returns:
+        dict: Normalized city name -> rules, with the rate table under "rate_table"
+    """
+    if not os.path.isdir(rules_dir):
+        return {}
+
+    files = sorted(entry.path for entry in os.scandir(rules_dir) if entry.name.endswith(".json"))
+    signature = tuple((path, os.path.getmtime(path)) for path in files)
+
+    with _rules_lock:
+        if _rules_cache["signature"] == signature:
+            return _rules_cache["rules"]
+
+        rules = {}
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    city_rules = json.load(f)
+                city_rules["rate_table"] = build_rate_table(city_rules)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Errore nel caricamento delle regole {path}: {str(e)}")
+                continue
+            rules[_city_key(city_rules.get("city") or os.path.splitext(os.path.basename(path))[0])] = city_rules
+
+        _rules_cache["signature"] = signature
+        _rules_cache["rules"] = rules
+        return rules
+
+def _guest_factors(bookings, rules, city_codes, cities):
+    """
+    Get the taxed guests of each booking, weighted by the age bands of its city
+
+    Guests whose age is not in 'guest_ages' count as adults (factor 1).
+    """
+    guests = pd.to_numeric(bookings["guests"], errors="coerce").fillna(1).to_numpy(dtype=float) \
+        if "guests" in bookings.columns else np.ones(len(bookings))
+    guests = np.maximum(guests, 1)
+    if "guest_ages" not in bookings.columns:
+        return guests
+
+    ages = bookings["guest_ages"].reset_index(drop=True).explode().dropna()
+    if ages.empty:
+        return guests
+
+    positions = ages.index.to_numpy()
+    ages = pd.to_numeric(ages, errors="coerce").to_numpy(dtype=float)
+    factors = np.ones(len(ages))
+    for code, city in enumerate(cities):
+        bands = sorted(rules[city].get("age_bands", []), key=lambda band: band["max_age"])
+        if not bands:
+            continue
+        in_city = city_codes[positions] == code
+        limits = np.array([band["max_age"] for band in bands], dtype=float)
+        band_factors = np.array([band["factor"] for band in bands] + [1.0])
+        band_index = np.searchsorted(limits, ages[in_city], side="left")
+        factors[in_city] = np.where(np.isnan(ages[in_city]), 1.0, band_factors[band_index])
+
+    # Ogni età nota sostituisce un ospite adulto nel conteggio
+    known = np.bincount(positions, minlength=len(bookings))
+    weighted = np.bincount(positions, weights=factors, minlength=len(bookings))
+    return np.maximum(guests - known, 0) + weighted
+
+def compute_tourist_tax(bookings, rules=None, with_nights=False):
+    """
+    Compute the tourist tax of many bookings in one vectorized pass
+
+    Every stay is expanded to its taxed nights (up to the per-stay cap of the
+    city), each night takes the seasonal rate of its day and is multiplied by
+    the guests weighted by age.
+
+    Args:
+        bookings (pandas.DataFrame): Bookings with checkin_date, checkout_date, city,
+            and optionally guests and guest_ages (list of ages)
+        rules (dict, optional): Rules by city, from load_city_rules
+        with_nights (bool): Also return the taxed nights, for remittance by month
+
+    Returns:
+        pandas.DataFrame: taxed_nights, guest_nights and tourist_tax per booking (same index),
+        plus the nights dataframe (booking position, city, night, tax) if with_nights
+    """
+    rules = load_city_rules() if rules is None else rules
+    cities = sorted(rules)
+    result = pd.DataFrame(index=bookings.index, data={"taxed_nights": 0, "guest_nights": 0.0, "tourist_tax": 0.0})
+    nights_df = pd.DataFrame(columns=["booking", "city", "night", "tax"])
+    if bookings.empty or not cities:
+        return (result, nights_df) if with_nights else result
+
+    # I nomi dei comuni vengono normalizzati una volta per valore distinto
+    codes, uniques = pd.factorize(bookings["city"])
+    unique_codes = np.array([cities.index(key) if key in rules else -1 for key in map(_city_key, uniques)] + [-1])
+    city_codes = unique_codes[codes]
+    checkin = pd.to_datetime(bookings["checkin_date"], errors="coerce").to_numpy(dtype="datetime64[D]")
+    checkout = pd.to_datetime(bookings["checkout_date"], errors="coerce").to_numpy(dtype="datetime64[D]")
+    nights = (checkout - checkin).astype("int64")
+    nights = np.where(np.isnat(checkin) | np.isnat(checkout) | (city_codes < 0), 0, np.maximum(nights, 0))
+
+    # Tetto di notti tassate per soggiorno, per comune (0 = nessun tetto)
+    caps = np.array([rules[city].get("max_nights") or np.iinfo(np.int64).max for city in cities], dtype=np.int64)
+    taxed = np.where(city_codes >= 0, np.minimum(nights, caps[city_codes]), 0)
+
+    # Una riga per notte tassata
+    booking_index = np.repeat(np.arange(len(bookings)), taxed)
+    offsets = np.arange(len(booking_index)) - np.repeat(np.cumsum(taxed) - taxed, taxed)
+    night_dates = checkin[booking_index] + offsets.astype("timedelta64[D]")
+    night_index = pd.DatetimeIndex(night_dates)
+    day_keys = (night_index.month.to_numpy() - 1) * 31 + (night_index.day.to_numpy() - 1)
+
+    rate_tables = np.vstack([rules[city]["rate_table"] for city in cities])
+    night_rates = rate_tables[city_codes[booking_index], day_keys]
+
+    guest_factors = _guest_factors(bookings, rules, city_codes, cities)
+    night_tax = night_rates * guest_factors[booking_index]
+
+    result["taxed_nights"] = taxed
+    result["guest_nights"] = taxed * guest_factors
+    result["tourist_tax"] = np.round(np.bincount(booking_index, weights=night_tax, minlength=len(bookings)), 2)
+
+    if with_nights:
+        nights_df = pd.DataFrame({
+            "booking": booking_index,
+            "city": np.asarray(cities, dtype=object)[city_codes[booking_index]],
+            "night": night_dates,
+            "tax": night_tax
+        })
+        return result, nights_df
+    return result
+
+def _parse_ages(value):
+    """Get the list of ages stored as JSON in Booking.guest_ages"""
+    try:
+        ages = json.loads(value) if value else []
+    except (TypeError, ValueError):
+        return []
+    return ages if isinstance(ages, list) else []
+
+def load_stays(invoice_ids=None, invoiced=False, connection=None):
+    """
+    Load bookings with the city of their property in one query
+
+    Args:
+        invoice_ids (list, optional): Only the bookings of these invoices
+        invoiced (bool): Only invoiced bookings, one row per invoice with its invoice_id
+        connection (optional): SQLAlchemy connection to read from, e.g. inside a flush
+
+    Returns:
+        pandas.DataFrame: booking_id, checkin_date, checkout_date, guests, guest_ages (list),
+        status, city (and invoice_id for invoiced bookings)
+    """
+    columns = [
+        Booking.id.label("booking_id"),
+        # Le date restano testo ISO: pandas le converte tutte insieme, molto più in fretta
+        type_coerce(Booking.checkin_date, String).label("checkin_date"),
+        type_coerce(Booking.checkout_date, String).label("checkout_date"),
+        Booking.guests, Booking.guest_ages, Booking.status, Property.city.label("city")
+    ]
+    query = select(*columns).outerjoin(Property, Booking.property_id == Property.id)
+    if invoiced or invoice_ids is not None:
+        query = query.add_columns(Invoice.id.label("invoice_id")).join(Invoice, Invoice.booking_id == Booking.id)
+        if invoice_ids is not None:
+            query = query.where(Invoice.id.in_(invoice_ids))
+
+    if connection is not None:
+        stays = pd.read_sql(query, connection)
+    else:
+        session = get_db_session()
+        try:
+            # Lettura diretta in un dataframe, senza creare una riga ORM per prenotazione
+            stays = pd.read_sql(query, session.connection())
+        finally:
+            session.close()
+
+    stays["guest_ages"] = stays["guest_ages"].map(_parse_ages)
+    return stays
+
+def _store_charges(connection, stays, rules):
+    """Compute the tourist tax of invoiced stays and upsert one charge per invoice"""
+    taxes = compute_tourist_tax(stays, rules)
+    # Le prenotazioni cancellate non pagano l'imposta
+    taxes.loc[(stays["status"] == "cancellata").to_numpy()] = 0
+    now = datetime.now()
+    charges = [
+        {"invoice_id": invoice_id, "booking_id": booking_id, "city": city,
+         "taxed_nights": int(taxed_nights), "guest_nights": float(guest_nights),
+         "amount": float(amount), "computed_at": now}
+        for invoice_id, booking_id, city, taxed_nights, guest_nights, amount in zip(
+            stays["invoice_id"], stays["booking_id"], stays["city"],
+            taxes["taxed_nights"], taxes["guest_nights"], taxes["tourist_tax"])
+    ]
+
+    statement = sqlite_insert(TouristTaxCharge)
+    statement = statement.on_conflict_do_update(
+        index_elements=["invoice_id"],
+        set_={column: getattr(statement.excluded, column)
+              for column in ("booking_id", "city", "taxed_nights", "guest_nights", "amount", "computed_at")}
+    )
+    connection.execute(statement, charges)
+    return charges, taxes
+
+def attach_tourist_tax_to_invoices(invoice_ids=None):
+    """
+    Compute the tourist tax of invoiced bookings and store it with each invoice
+
+    Invoices of cancelled bookings get a charge of zero.
+
+    Args:
+        invoice_ids (list, optional): Invoices to update (default: every invoice)
+
+    Returns:
+        dict: Number of invoices updated, total tax and cities without rules
+    """
+    stays = load_stays(invoice_ids, invoiced=True)
+    if stays.empty:
+        return {"invoices": 0, "total": 0.0, "missing_rules": []}
+
+    rules = load_city_rules()
+    session = get_db_session()
+    try:
+        charges, taxes = _store_charges(session.connection(), stays, rules)
+        session.commit()
+    finally:
+        session.close()
+
+    missing = sorted({city for city in stays["city"].dropna() if _city_key(city) not in rules})
+    return {"invoices": len(charges), "total": float(taxes["tourist_tax"].sum()), "missing_rules": missing}
+
+def refresh_tourist_tax_charges(connection, booking_ids):
+    """
+    Recompute the tourist tax already stored with the invoices of changed bookings
+
+    Called from the after_flush hook, on the caller's connection and inside
+    its transaction, so the charges follow changes of dates, guests and
+    status. Charges of deleted bookings are removed.
+
+    Args:
+        connection: SQLAlchemy connection of the current transaction
+        booking_ids (iterable): Ids of the changed bookings
+    """
+    invoice_ids = connection.execute(
+        select(TouristTaxCharge.invoice_id).where(TouristTaxCharge.booking_id.in_(list(booking_ids)))
+    ).scalars().all()
+    if not invoice_ids:
+        return
+
+    stays = load_stays(invoice_ids, connection=connection)
+    if not stays.empty:
+        _store_charges(connection, stays, load_city_rules())
+
+    stale = set(invoice_ids) - set(stays["invoice_id"])
+    if stale:
+        connection.execute(delete(TouristTaxCharge).where(TouristTaxCharge.invoice_id.in_(stale)))
+
+def get_invoice_tourist_tax(invoice_id):
+    """Get the tourist tax stored with an invoice, or None if it was never computed"""
+    session = get_db_session()
+    try:
+        charge = session.get(TouristTaxCharge, invoice_id)
+        return charge.to_dict() if charge else None
+    finally:
+        session.close()
+
+def get_monthly_remittance(year=None, stays=None):
+    """
+    Get the tourist tax to remit to each city, month by month
+
+    Each taxed night is due in the month it falls in; cancelled bookings are excluded.
+
+    Args:
+        year (int, optional): Only nights of this year
+        stays (pandas.DataFrame, optional): Bookings with city (default: every booking in the database)
+
+    Returns:
+        pandas.DataFrame: city, month (YYYY-MM), stays, guest_nights and tourist_tax
+    """
+    stays = load_stays() if stays is None else stays
+    if "status" in stays.columns:
+        stays = stays[stays["status"] != "cancellata"]
+    stays = stays.reset_index(drop=True)
+
+    taxes, nights = compute_tourist_tax(stays, with_nights=True)
+    columns = ["city", "month", "stays", "guest_nights", "tourist_tax"]
+    if nights.empty:
+        return pd.DataFrame(columns=columns)
+
+    # Mese come numero (mesi dal 1970): il testo YYYY-MM viene creato solo per i mesi distinti
+    nights["month"] = nights["night"].to_numpy(dtype="datetime64[M]").astype("int64")
+    if year is not None:
+        nights = nights[nights["month"] // 12 + 1970 == year]
+
+    guest_factors = (taxes["guest_nights"] / taxes["taxed_nights"].where(taxes["taxed_nights"] > 0)).to_numpy()
+    nights["guest_nights"] = guest_factors[nights["booking"].to_numpy()]
+
+    remittance = nights.groupby(["city", "month"], sort=True).agg(
+        stays=("booking", "nunique"), guest_nights=("guest_nights", "sum"), tourist_tax=("tax", "sum")
+    ).reset_index()
+    # Nome del comune come scritto nel file di regole
+    rules = load_city_rules()
+    remittance["city"] = remittance["city"].map(lambda key: rules.get(key, {}).get("city", key))
+    remittance["month"] = [f"{month // 12 + 1970}-{month % 12 + 1:02d}" for month in remittance["month"]]
+    remittance["tourist_tax"] = remittance["tourist_tax"].round(2)
+    return remittance[columns]
@@ -0,0 +1,170 @@
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
+from utils.database import get_db_session, TranslationMemory
+
+# Numero massimo di traduzioni conservate prima dell'eviction LRU
+MAX_ENTRIES = 5000
+
+# Segnaposto nei template dei messaggi, es. {guest_name}
+PLACEHOLDER_PATTERN = re.compile(r"\{([a-zA-Z_][a-zA-Z0-9_]*)\}")
+
+def normalize_text(text):
+    """
+    Normalize a source text so that equivalent messages share a cache entry
+
+    Args:
+        text (str): Text to normalize
+
+    Returns:
+        str: Text in NFC form with collapsed whitespace on every line
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    lines = [" ".join(line.split()) for line in text.strip().splitlines()]
+    return "\n".join(lines)
+
+def normalize_language(language):
+    """Normalize a language name used as part of the cache key"""
+    return (language or "").strip().lower()
+
+def get_source_hash(text):
+    """Get the hash of a normalized source text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def get_placeholders(template):
+    """
+    Get the placeholders used in a message template
+
+    Args:
+        template (str): Template with placeholders like {guest_name}
+
+    Returns:
+        set: Placeholder names
+    """
+    return set(PLACEHOLDER_PATTERN.findall(template or ""))
+
+def fill_placeholders(template, values):
+    """
+    Fill the placeholders of a template, leaving unknown ones untouched
+
+    Args:
+        template (str): Template with placeholders like {guest_name}
+        values (dict): Values for the placeholders
+
+    Returns:
+        str: Filled message
+    """
+    return PLACEHOLDER_PATTERN.sub(
+        lambda match: str(values[match.group(1)]) if values.get(match.group(1)) is not None else match.group(0),
+        template
+    )
+
+def get_cached_translation(text, target_language):
+    """
+    Look up a translation in the translation memory
+
+    Args:
+        text (str): Source text
+        target_language (str): Target language
+
+    Returns:
+        str: Cached translation, or None if not found
+    """
+    session = get_db_session()
+    entry = session.query(TranslationMemory).filter(
+        TranslationMemory.source_hash == get_source_hash(text),
+        TranslationMemory.target_language == normalize_language(target_language)
+    ).first()
+
+    result = None
+    if entry:
+        # Aggiorniamo i dati di utilizzo per l'eviction LRU
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = datetime.now()
+        result = entry.translated_text
+        session.commit()
+
+    session.close()
+    return result
+
+def store_translation(text, target_language, translated_text, max_entries=MAX_ENTRIES):
+    """
+    Save a translation in the translation memory, evicting the least recently used entries
+
+    Args:
+        text (str): Source text
+        target_language (str): Target language
+        translated_text (str): Translated text
+        max_entries (int): Maximum number of entries to keep
+    """
+    session = get_db_session()
+    source_hash = get_source_hash(text)
+    language = normalize_language(target_language)
+
+    entry = session.query(TranslationMemory).filter(
+        TranslationMemory.source_hash == source_hash,
+        TranslationMemory.target_language == language
+    ).first()
+
+    if entry:
+        entry.translated_text = translated_text
+        entry.last_used_at = datetime.now()
+    else:
+        session.add(TranslationMemory(
+            source_hash=source_hash,
+            target_language=language,
+            source_text=normalize_text(text),
+            translated_text=translated_text
+        ))
+        session.flush()
+
+        # Eviction LRU: eliminiamo le voci usate meno di recente oltre il limite
+        excess = session.query(TranslationMemory).count() - max_entries
+        if excess > 0:
+            stale_ids = [row.id for row in session.query(TranslationMemory.id)
+                         .order_by(TranslationMemory.last_used_at.asc())
+                         .limit(excess)]
+            session.query(TranslationMemory).filter(
+                TranslationMemory.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+
+    session.commit()
+    session.close()
+
+def delete_translation(text, target_language):
+    """
+    Remove a translation from the translation memory
+
+    Args:
+        text (str): Source text
+        target_language (str): Target language
+    """
+    session = get_db_session()
+    session.query(TranslationMemory).filter(
+        TranslationMemory.source_hash == get_source_hash(text),
+        TranslationMemory.target_language == normalize_language(target_language)
+    ).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+
+def get_translation_memory_stats():
+    """
+    Get usage statistics of the translation memory
+
+    Returns:
+        dict: Number of entries, total cache hits and entries per language
+    """
+    session = get_db_session()
+    entries = session.query(TranslationMemory.target_language, TranslationMemory.hit_count).all()
+    session.close()
+
+    by_language = {}
+    for language, _ in entries:
+        by_language[language] = by_language.get(language, 0) + 1
+
+    return {
+        "entries": len(entries),
+        "hits": sum(hit_count or 0 for _, hit_count in entries),
+        "by_language": by_language
+    }
@@ -4,6 +4,10 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from utils.data_processor import get_column_types
+from utils.chart_aggregation import (
+    HISTOGRAM_AGGREGATE_ROWS, MAX_LINE_POINTS, MAX_SCATTER_POINTS,
+    bin_histogram, downsample_lines, density_sample, sample_distribution, use_webgl
+)
 
 def visualize_data_overview(df):
     """
@@ -74,7 +78,8 @@ def visualize_data_overview(df):
         )
         
         # Count frequencies
-        value_counts = df[selected_categorical].value_counts().reset_index()
+        value_counts = df[selected_categorical].value_counts()
+        value_counts = value_counts[value_counts > 0].reset_index()
         value_counts.columns = [selected_categorical, 'Count']
         
         # Only show top 10 if many categories
@@ -167,6 +172,10 @@ def create_line_chart(df, config):
     if not x or not y:
         raise ValueError("Line chart requires both x and y values")
     
+    # Each line is reduced with LTTB: the payload stays bounded and peaks are kept
+    if len(df) > MAX_LINE_POINTS:
+        df = downsample_lines(df, x, y, color, config.get('max_points', MAX_LINE_POINTS))
+    
     fig = px.line(
         df,
         x=x,
@@ -174,7 +183,8 @@ def create_line_chart(df, config):
         color=color,
         markers=config.get('markers', False),
         line_shape=config.get('line_shape', 'linear'),
-        labels=config.get('labels', {})
+        labels=config.get('labels', {}),
+        render_mode='webgl' if use_webgl(len(df), config) else 'svg'
     )
     
     return fig
@@ -189,6 +199,12 @@ def create_scatter_plot(df, config):
     if not x or not y:
         raise ValueError("Scatter plot requires both x and y values")
     
+    # Dense regions are thinned, isolated points and outliers are kept
+    total_points = len(df)
+    max_points = config.get('max_points', MAX_SCATTER_POINTS)
+    if total_points > max_points:
+        df = density_sample(df, x, y, max_points)
+    
     fig = px.scatter(
         df,
         x=x,
@@ -196,9 +212,17 @@ def create_scatter_plot(df, config):
         color=color,
         size=size,
         opacity=config.get('opacity', 0.7),
-        labels=config.get('labels', {})
+        labels=config.get('labels', {}),
+        render_mode='webgl' if use_webgl(len(df), config) else 'svg'
     )
     
+    if len(df) < total_points:
+        fig.add_annotation(
+            text=f"Showing {len(df):,} of {total_points:,} points",
+            xref="paper", yref="paper", x=1, y=1.05,
+            showarrow=False, font=dict(size=10, color="gray")
+        )
+    
     return fig
 
 def create_pie_chart(df, config):
@@ -227,6 +251,12 @@ def create_histogram(df, config):
     if not x:
         raise ValueError("Histogram requires x value")
     
+    # Large numeric or date columns are binned server-side, the browser receives only the counts
+    if len(df) > HISTOGRAM_AGGREGATE_ROWS and (
+        pd.api.types.is_numeric_dtype(df[x]) or pd.api.types.is_datetime64_any_dtype(df[x])
+    ) and not pd.api.types.is_bool_dtype(df[x]):
+        return create_binned_histogram(df, config)
+    
     fig = px.histogram(
         df,
         x=x,
@@ -239,6 +269,40 @@ def create_histogram(df, config):
     
     return fig
 
+def create_binned_histogram(df, config):
+    """Create a histogram from counts binned with NumPy"""
+    x = config.get('x')
+    color = config.get('color')
+    
+    binned, width = bin_histogram(df, x, color, config.get('nbins', 30))
+    
+    fig = px.bar(
+        binned,
+        x=x,
+        y="count",
+        color=color,
+        opacity=config.get('opacity', 0.7),
+        labels=config.get('labels', {})
+    )
+    fig.update_traces(width=width)
+    fig.update_layout(bargap=0, barmode='relative')
+    
+    # The marginal plot is drawn from a sample, with the same layout as px.histogram
+    marginal = config.get('marginal')
+    if marginal in ('box', 'violin', 'rug'):
+        sample = sample_distribution(df, x, color)
+        marginal_fig = px.histogram(sample, x=x, color=color, marginal=marginal)
+        for trace in marginal_fig.data:
+            if trace.type != 'histogram':
+                fig.add_trace(trace)
+        fig.update_layout(
+            xaxis=marginal_fig.layout.xaxis, yaxis=marginal_fig.layout.yaxis,
+            xaxis2=marginal_fig.layout.xaxis2, yaxis2=marginal_fig.layout.yaxis2
+        )
+        fig.update_layout(yaxis_title_text="count")
+    
+    return fig
+
 def create_heatmap(df, config):
     """Create a heatmap visualization"""
     columns = config.get('columns', df.select_dtypes(include=np.number).columns.tolist())
@@ -271,6 +335,9 @@ def create_box_plot(df, config):
     if not y:
         raise ValueError("Box plot requires y value")
     
+    # Large data is sampled per group, keeping each group's minimum and maximum
+    df = sample_distribution(df, y, config.get('color'), x)
+    
     fig = px.box(
         df,
         x=x,
@@ -291,6 +358,9 @@ def create_violin_plot(df, config):
     if not y:
         raise ValueError("Violin plot requires y value")
     
+    # Large data is sampled per group, keeping each group's minimum and maximum
+    df = sample_distribution(df, y, config.get('color'), x)
+    
     fig = px.violin(
         df,
         x=x,
@@ -383,6 +453,7 @@ def suggest_visualizations(df):
     # For categorical columns: bar charts, pie charts
     for col in column_types['categorical'][:3]:  # Limit to first 3
         value_counts = df[col].value_counts()
+        value_counts = value_counts[value_counts > 0]
         if len(value_counts) <= 10:  # Only for columns with few unique values
             suggestions.append({
                 'type': 'bar',